@@ -1,138 +1,330 @@
 # %%
+import json
+import logging
+import os
 import streamlit as st
 import pandas as pd
-from io import BytesIO
+from datasets import ARQUIVOS_CSV, MODO_COMPACTO, load_dataset, source_stamp
+from exports import FORMATOS, filtered_csv, full_export
+from result_cache import MOSTRAR_ESTATISTICAS, cache_resultados, cached_rows
+from facet_index import FacetIndex
+from instrumentation import instrumented_tab, stage
+from search_index import LIMITE_RESULTADOS, TrigramIndex
+from profiles import build_profiles
+from geo_index import ARQUIVO_COORDENADAS, LocationIndex, load_centroids
 
 
 #%%
 
+# Mensagens de carga das bases (linhas, colunas e memória, ver datasets.py) no log do servidor
+logging.basicConfig(level=os.environ.get('GUIA_LOG_NIVEL', 'INFO'), format='%(asctime)s %(name)s %(message)s')
+
 st.set_page_config(
     page_title="Guia das Federais - Encontre seu curso numa universidade federal",
     layout="wide",
  )
 # %%
-# Função para carregar os dados do CSV da pos-graduacao
-@st.cache_data  # Cache para melhorar a performance
-def load_data_mestrado_doutorado(csv_file):
-    df = pd.read_csv(csv_file,sep='\t',index_col=None)
-    
-    
-    colunas_novas = {
-    'Sigla da Instituição de Ensino Superior do programa de pós-graduação': 'Sigla_IES',
-    'Nome do programa de pós-graduação': 'Nome_Programa',
-    'Área de conhecimento do programa de pós-graduação': 'Area_Conhecimento',
-    'Sigla da Unidade da Federação do programa': 'UF',
-    'Município sede do programa de pós-graduação': 'Municipio',
-    'Modalidade do programa de pós-graduação': 'Modalidade',
-    'Nível do programa de pós-graduação': 'Nivel_Programa',
-    'Nota/Conceito do programa de pós-graduação': 'Nota_Conceito',
-    'Instituição de Ensino Superior do programa de pós-graduação': 'Nome_IES'
-    }
-    df.rename(columns=colunas_novas, inplace=True)
-    df['Nota_Conceito'].fillna("Não informado", inplace=True)
-    df['Nota_Conceito'] = df['Nota_Conceito'].astype(str)
-
-    return df
-#%%
-
-# Função para carregar os dados do CSV da pos-graduacao
-@st.cache_data  # Cache para melhorar a performance
-def load_data_graduacao(csv_file):
-    df = pd.read_csv(csv_file, sep='\t', index_col=None)
-    
-    # Novo mapeamento de colunas
-    colunas_novas = {
-        'Nome da IES': 'Nome_IES',
-        'Nome do curso': 'Nome_Curso',
-        'Grau': 'Grau',
-        'Área OCDE': 'Area_Conhecimento',
-        'Modalidade de ensino (presencial ou EaD)': 'Modalidade_Ensino',
-        'Município': 'Municipio',
-        'UF': 'UF',
-        }
-    
-    df.rename(columns=colunas_novas, inplace=True)
-
-    # Você pode adicionar aqui qualquer outra operação que deseje realizar no DataFrame
-    # Por exemplo, tratar colunas com valores nulos, converter tipos de dados, etc.
-
-    return df
-
-@st.cache_data  # Cache para melhorar a performance
-def load_data_especializacao(csv_file):
-    df = pd.read_csv(csv_file, sep='\t', index_col=None)
-    return df
+# As bases são lidas pelo snapshot colunar mapeado em memória (ver datasets.py).
+# cache_resource devolve sempre o mesmo objeto, sem a cópia por sessão do cache_data;
+# os DataFrames são apenas lidos, nunca alterados, pelas abas.
+# O carimbo do CSV (mtime e tamanho, ver source_stamp) entra na chave: um CSV
+# trocado no disco é relido na execução seguinte. Os caches derivados são
+# chaveados pela versão da base (df.attrs['versao']) e guardam no máximo
+# MAX_VERSOES entradas, para que as versões antigas saiam da memória.
+MAX_VERSOES = 2
+
+@st.cache_resource(max_entries=MAX_VERSOES)
+def load_data_mestrado_doutorado(csv_file, carimbo, compacto=MODO_COMPACTO):
+    return load_dataset('mestrado_doutorado', csv_file, compacto)
+
+@st.cache_resource(max_entries=MAX_VERSOES)
+def load_data_graduacao(csv_file, carimbo, compacto=MODO_COMPACTO):
+    return load_dataset('graduacao', csv_file, compacto)
+
+@st.cache_resource(max_entries=MAX_VERSOES)
+def load_data_especializacao(csv_file, carimbo, compacto=MODO_COMPACTO):
+    return load_dataset('especializacao', csv_file, compacto)
+
+# No modo compacto as abas só têm as colunas da interface; os downloads leem a
+# base completa (mesmas linhas, na mesma ordem), só quando um deles é pedido
+@st.cache_resource(max_entries=3 * MAX_VERSOES)
+def load_export_data(nome_base, csv_file, carimbo):
+    return load_dataset(nome_base, csv_file, compacto=False)
+
+
+# Índice de facetas construído uma vez por versão da base, já com a ordem de
+# exibição das linhas; o DataFrame não entra no hash do cache
+@st.cache_resource(max_entries=3 * MAX_VERSOES)
+def load_facet_index(versao, _df, columns, sort_by=()):
+    return FacetIndex(_df, columns, sort_by)
+
+
+# Índice de trigramas dos nomes distintos de uma coluna (ver search_index.py),
+# montado uma vez por versão da base a partir das opções do índice de facetas
+@st.cache_resource(max_entries=3 * MAX_VERSOES)
+def load_search_index(versao, _facetas, column):
+    return TrigramIndex(_facetas.options(column))
+
+
+def search_box(rotulo, indice, opcoes, chave):
+    """Caixa de busca por nome: devolve as opções do multiselect de chave ``chave``.
+
+    Sem texto, são as opções da cascata. Com texto, são os nomes da cascata
+    parecidos com ele (sem acento, maiúsculas ou erros de digitação pequenos),
+    do mais ao menos parecido, depois dos que já estão selecionados.
+    """
+    busca = st.text_input(rotulo, key=f'busca_{chave}', placeholder='Digite parte do nome')
+    if not busca.strip():
+        return opcoes
+    permitidas = set(opcoes)
+    encontradas = [valor for valor in indice.search(busca, limite=None) if valor in permitidas]
+    return list(dict.fromkeys([*st.session_state.get(chave, []), *encontradas[:LIMITE_RESULTADOS]]))
 
 
 #%%
-def convert_df_to_csv(df):
-    return df.to_csv(index=False).encode('utf-8')
+TAMANHOS_PAGINA = [50, 100, 250, 500]
+
+# Só a página visível do resultado vai para o navegador; o total é sempre exato
+# e as páginas percorrem todas as linhas filtradas.
+def show_paginated_table(nome_base, data, linhas, colunas, column_config=None):
+    chave_pagina = f'pagina_{nome_base}'
+    # Filtros novos voltam para a primeira página
+    assinatura = hash(linhas.tobytes())
+    if st.session_state.get(f'resultado_{nome_base}') != assinatura:
+        st.session_state[f'resultado_{nome_base}'] = assinatura
+        st.session_state[chave_pagina] = 1
+
+    total = len(linhas)
+    tamanho = st.session_state.get(f'tamanho_pagina_{nome_base}', TAMANHOS_PAGINA[0])
+    n_paginas = max(1, -(-total // tamanho))
+    if st.session_state.get(chave_pagina, 1) > n_paginas:
+        st.session_state[chave_pagina] = n_paginas
+    pagina = st.session_state.get(chave_pagina, 1)
+    inicio, fim = (pagina - 1) * tamanho, min(pagina * tamanho, total)
+
+    with stage('tabela', total) as etapa:
+        st.dataframe(data.iloc[linhas[inicio:fim]][colunas], column_config=column_config, hide_index=True)
+        etapa.linhas_saida = fim - inicio
+
+    col_resumo, col_pagina, col_tamanho = st.columns([2, 1, 1])
+    with col_resumo:
+        if total:
+            st.caption(f"Mostrando {inicio + 1:n}–{fim:n} de **{total:n}** resultados")
+        else:
+            st.caption("Nenhum resultado para os filtros escolhidos")
+    with col_pagina:
+        st.number_input(f'Página (de {n_paginas:n})', min_value=1, max_value=n_paginas, step=1, key=chave_pagina)
+    with col_tamanho:
+        st.selectbox('Linhas por página', TAMANHOS_PAGINA, key=f'tamanho_pagina_{nome_base}')
+
+
+# Os downloads são gerados só quando o botão é clicado (``data`` recebe uma função)
+# e reaproveitados: a base completa uma vez por versão dos dados e o resultado
+# filtrado enquanto as mesmas linhas forem pedidas (ver exports.py).
+def show_download_buttons(nome_base, data, linhas, rotulo_filtrado, rotulo_completo,
+                          arquivo_filtrado, arquivo_completo):
+    def dados_exportacao():
+        if not MODO_COMPACTO:
+            return data
+        csv_file = ARQUIVOS_CSV[nome_base]
+        return load_export_data(nome_base, csv_file, source_stamp(csv_file))
+
+    # Chamadas quando o download é pedido, fora da execução da aba: a etapa
+    # informa a aba por conta própria
+    def gerar_filtrado():
+        with stage('exportacao_filtrada', len(linhas), aba=nome_base) as etapa:
+            etapa.linhas_saida = len(linhas)
+            return filtered_csv(nome_base, dados_exportacao().iloc[linhas])
+
+    def gerar_completo():
+        with stage(f'exportacao_{formato}', len(data), aba=nome_base) as etapa:
+            etapa.linhas_saida = len(data)
+            return full_export(nome_base, dados_exportacao(), formato)
 
-# %%
-# Carregar os dados
-data_mestrado_doutorado = load_data_mestrado_doutorado('mestrado_doutorado_univ_publicas.csv')
-data_graduacao = load_data_graduacao('graduacao_univ_publicas.csv')
-data_especializacao = load_data_especializacao('especializacao_univ_publicas.csv')
+    col_download1, col_download2 = st.columns(2)
+    with col_download1:
+        # Botão para baixar dados filtrados
+        st.download_button(rotulo_filtrado, type="primary",
+                           data=gerar_filtrado,
+                           file_name=f'{arquivo_filtrado}.csv',
+                           mime='text/csv', on_click='ignore')
+    with col_download2:
+        # Botão para baixar todos os dados, no formato escolhido
+        formato = st.radio('Formato da base completa', list(FORMATOS), horizontal=True,
+                           format_func=lambda f: FORMATOS[f][0], key=f'formato_{nome_base}')
+        _, extensao, mime = FORMATOS[formato]
+        st.download_button(rotulo_completo, type="secondary",
+                           data=gerar_completo,
+                           file_name=f'{arquivo_completo}{extensao}',
+                           mime=mime, on_click='ignore')
 
+# %%
+# Carregar os dados: cada aba lê a própria base e monta os índices de facetas e
+# de busca por nome só quando é aberta pela primeira vez no processo
+def load_tab_mestrado_doutorado():
+    csv_file = 'mestrado_doutorado_univ_publicas.csv'
+    data = load_data_mestrado_doutorado(csv_file, source_stamp(csv_file))
+    facetas = load_facet_index(
+        data.attrs['versao'], data,
+        ('Nivel_Programa', 'Area_Conhecimento', 'Nota_Conceito', 'UF', 'Municipio', 'Sigla_IES', 'Nome_IES',
+         'Nome_Programa'),
+        sort_by=('Nome_Programa', 'Sigla_IES', 'UF', 'Municipio', 'Modalidade'))
+    return data, facetas, load_search_index(data.attrs['versao'], facetas, 'Nome_Programa')
+
+def load_tab_graduacao():
+    csv_file = 'graduacao_univ_publicas.csv'
+    data = load_data_graduacao(csv_file, source_stamp(csv_file))
+    facetas = load_facet_index(
+        data.attrs['versao'], data,
+        ('Grau', 'Modalidade_Ensino', 'UF', 'Municipio', 'Nome_IES', 'Nome_Curso'),
+        sort_by=('Nome_Curso', 'Nome_IES', 'UF', 'Municipio', 'Modalidade_Ensino'))
+    return data, facetas, load_search_index(data.attrs['versao'], facetas, 'Nome_Curso')
+
+def load_tab_especializacao():
+    csv_file = 'especializacao_univ_publicas.csv'
+    data = load_data_especializacao(csv_file, source_stamp(csv_file))
+    facetas = load_facet_index(
+        data.attrs['versao'], data,
+        ('Area_Conhecimento', 'MODALIDADE', 'NOME_IES', 'NOME_ESPECIALIZACAO', 'CARGA_HORARIA', 'DURACAO_MESES', 'MUNICIPIO', 'UF'))
+    return data, facetas, load_search_index(data.attrs['versao'], facetas, 'NOME_ESPECIALIZACAO')
+
+
+# Perfis por instituição e por município (ver profiles.py), calculados uma vez
+# por versão das três bases; o resumo de uma IES ou cidade é uma leitura pelo índice
+@st.cache_resource(max_entries=MAX_VERSOES)
+def load_profiles(versoes, _frames):
+    return build_profiles(_frames, 'app', 'ies'), build_profiles(_frames, 'app', 'municipio')
+
+
+def load_tab_perfis():
+    frames = {
+        'graduacao': load_tab_graduacao()[0],
+        'especializacao': load_tab_especializacao()[0],
+        'mestrado_doutorado': load_tab_mestrado_doutorado()[0],
+    }
+    return load_profiles(tuple(df.attrs['versao'] for df in frames.values()), frames)
+
+
+# Centróides dos municípios, do arquivo local do IBGE (ver geo_index.py), e o
+# índice espacial das linhas de cada base; sem o arquivo os dois são None.
+# O carimbo do arquivo de coordenadas entra na chave, como o dos CSVs
+@st.cache_resource(max_entries=MAX_VERSOES)
+def load_municipality_centroids(carimbo):
+    return load_centroids(ARQUIVO_COORDENADAS)
+
+@st.cache_resource(max_entries=3 * MAX_VERSOES)
+def load_location_index(versao, carimbo, _df, uf, municipio):
+    centroides = load_municipality_centroids(carimbo)
+    if centroides is None:
+        return None
+    return LocationIndex(_df[uf], _df[municipio], centroides)
+
+
+def proximity_filter(nome_base, data, facetas, uf, municipio):
+    """Filtro "a até N km de uma cidade": devolve o bitmap das linhas e a seleção.
+
+    A seleção, ``(cidade, raio)`` ou ``None`` sem cidade escolhida, entra nos
+    filtros da chave do cache de resultados. Sem o arquivo de coordenadas o
+    filtro não aparece e todas as linhas passam.
+    """
+    carimbo = source_stamp(ARQUIVO_COORDENADAS)
+    locais = load_location_index(data.attrs['versao'], carimbo, data, uf, municipio)
+    if locais is None:
+        return facetas.all_rows(), None
+    centroides = load_municipality_centroids(carimbo)
+    col_cidade, col_raio = st.columns(2)
+    with col_cidade:
+        cidade = st.selectbox('Perto da cidade', centroides.index, index=None, key=f'cidade_{nome_base}',
+                              format_func=lambda chave: f"{centroides.at[chave, 'nome']} ({centroides.at[chave, 'uf']})",
+                              placeholder='Digite o nome da sua cidade')
+    with col_raio:
+        raio = st.slider('Distância máxima (km)', 10, 500, 50, step=10, key=f'raio_{nome_base}',
+                         disabled=cidade is None)
+    if cidade is None:
+        return facetas.all_rows(), None
+    origem = centroides.loc[cidade]
+    linhas = locais.rows_within(origem['latitude'], origem['longitude'], raio)
+    return facetas.select_rows(linhas), (cidade, raio)
 
 
 # %%
+# Cada aba é um fragmento: mexer num filtro reexecuta só a aba em que ele está
+@st.fragment
+@instrumented_tab('especializacao')
 def show_especializacao():
     st.caption("""🔍 **Escolha os filtros que preferir** e veja os resultados na tabela no final da página.    
     💡 **Dica:** Você pode deixar todos os filtros em branco se quiser ver todos os dados 🌐
 """)
 
+    with stage('carga') as etapa:
+        data_especializacao, facetas, busca_nomes = load_tab_especializacao()
+        etapa.linhas_saida = len(data_especializacao)
+    # Filtros em cascata: das opções de cada campo até a última seleção
+    etapa_filtros = stage('filtros', len(data_especializacao)).start()
+
     col_area, col_modalidade = st.columns(2)
     with col_area:
         # Primeira camada de filtro: Área de Conhecimento
         areas_conhecimento = st.multiselect('Área de conhecimento especializacao', 
-                                            sorted(data_especializacao['Area_Conhecimento'].unique()), 
+                                            facetas.options('Area_Conhecimento'), 
                                             default=[])
-        df_filtrado = data_especializacao[data_especializacao['Area_Conhecimento'].isin(areas_conhecimento)] if areas_conhecimento else data_especializacao
+        filtro = facetas.select('Area_Conhecimento', areas_conhecimento)
     with col_modalidade:
         # Segunda camada de filtro: Modalidade de Ensino
         modalidade = st.multiselect('Modalidade de ensino', 
-                                sorted(df_filtrado['MODALIDADE'].unique()), 
+                                facetas.options('MODALIDADE', filtro), 
                                 default=[])
-        df_filtrado = df_filtrado[df_filtrado['MODALIDADE'].isin(modalidade)] if modalidade else df_filtrado
+        filtro &= facetas.select('MODALIDADE', modalidade)
+
+    # Cursos a até N km de uma cidade (só com o arquivo de coordenadas)
+    filtro_proximidade, proximidade = proximity_filter('especializacao', data_especializacao, facetas, 'UF', 'MUNICIPIO')
+    filtro &= filtro_proximidade
 
     col_nome_ies, col_nome_especializacao = st.columns(2)
     with col_nome_ies:
         # Terceira camada de filtro: Nome da Instituição
         nome_ies = st.multiselect('Nome da Instituição', 
-                                sorted(df_filtrado['NOME_IES'].unique()), 
+                                facetas.options('NOME_IES', filtro), 
                                 default=[])
-        df_filtrado = df_filtrado[df_filtrado['NOME_IES'].isin(nome_ies)] if nome_ies else df_filtrado
+        filtro &= facetas.select('NOME_IES', nome_ies)
     with col_nome_especializacao:
-        # Quarta camada de filtro: Nome do Curso de Especialização
+        # Quarta camada de filtro: Nome do Curso de Especialização, com busca pelo nome
+        opcoes_especializacao = search_box('Buscar curso de especialização', busca_nomes,
+                                           facetas.options('NOME_ESPECIALIZACAO', filtro), 'nome_especializacao')
         nome_especializacao = st.multiselect('Nome do Curso de Especialização', 
-                                            sorted(df_filtrado['NOME_ESPECIALIZACAO'].unique()), 
-                                            default=[])
-        df_filtrado = df_filtrado[df_filtrado['NOME_ESPECIALIZACAO'].isin(nome_especializacao)] if nome_especializacao else df_filtrado
+                                            opcoes_especializacao, 
+                                            default=[], key='nome_especializacao')
+        filtro &= facetas.select('NOME_ESPECIALIZACAO', nome_especializacao)
 
+    # Intervalos dos sliders, quando exibidos, para a chave do cache de resultados
+    filtros = {}
     col_carga_horaria, col_duracao = st.columns(2)
     
     with col_carga_horaria:
     # Quinta camada de filtro: Carga Horária
-        if not df_filtrado.empty:
-            min_carga_horaria, max_carga_horaria = min(df_filtrado['CARGA_HORARIA']), max(df_filtrado['CARGA_HORARIA'])
+        intervalo = facetas.value_range('CARGA_HORARIA', filtro)
+        if intervalo:
+            min_carga_horaria, max_carga_horaria = intervalo
             if min_carga_horaria < max_carga_horaria:  # Só mostra o slider se houver um intervalo válido
                 carga_horaria = st.slider('Carga Horária', 
                                         min_carga_horaria, max_carga_horaria, 
                                         (min_carga_horaria, max_carga_horaria), step=30)
-                df_filtrado = df_filtrado[(df_filtrado['CARGA_HORARIA'] >= carga_horaria[0]) & (df_filtrado['CARGA_HORARIA'] <= carga_horaria[1])]
+                filtro &= facetas.select_range('CARGA_HORARIA', carga_horaria[0], carga_horaria[1])
+                filtros['CARGA_HORARIA'] = carga_horaria
             else:
                 st.warning("Ocultamos o filtro de Carga Horária nesse momento.")
 
     with col_duracao:
     # Sexta camada de filtro: Duração em Meses
-        if not df_filtrado.empty:
-            min_duracao_meses, max_duracao_meses = min(df_filtrado['DURACAO_MESES']), max(df_filtrado['DURACAO_MESES'])
+        intervalo = facetas.value_range('DURACAO_MESES', filtro)
+        if intervalo:
+            min_duracao_meses, max_duracao_meses = intervalo
             if min_duracao_meses < max_duracao_meses:  # Só mostra o slider se houver um intervalo válido
                 duracao_meses = st.slider('Duração em Meses', 
                                         min_duracao_meses, max_duracao_meses, 
                                         (min_duracao_meses, max_duracao_meses), step=6)
-                df_filtrado = df_filtrado[(df_filtrado['DURACAO_MESES'] >= duracao_meses[0]) & (df_filtrado['DURACAO_MESES'] <= duracao_meses[1])]
+                filtro &= facetas.select_range('DURACAO_MESES', duracao_meses[0], duracao_meses[1])
+                filtros['DURACAO_MESES'] = duracao_meses
             else:
                 st.warning("Ocultamos o filtro Duração em meses nesse momento.")
 
@@ -140,50 +332,56 @@ def show_especializacao():
     with col_municipio:
         # Sétima camada de filtro: Município
         municipio_especializacao = st.multiselect('Município', 
-                                sorted(df_filtrado['MUNICIPIO'].unique()), 
+                                facetas.options('MUNICIPIO', filtro), 
                                 default=[])
-        df_filtrado = df_filtrado[df_filtrado['MUNICIPIO'].isin(municipio_especializacao)] if municipio_especializacao else df_filtrado
+        filtro &= facetas.select('MUNICIPIO', municipio_especializacao)
 
     with col_estado:
         # Oitava camada de filtro: Estado (UF)
         estado_especializacao = st.multiselect('Estado', 
-                            sorted(df_filtrado['UF'].unique()), 
+                            facetas.options('UF', filtro), 
                             default=[])
-        df_filtrado = df_filtrado[df_filtrado['UF'].isin(estado_especializacao)] if estado_especializacao else df_filtrado
+        filtro &= facetas.select('UF', estado_especializacao)
+
+    filtros.update({'Area_Conhecimento': areas_conhecimento, 'MODALIDADE': modalidade, 'NOME_IES': nome_ies,
+                    'NOME_ESPECIALIZACAO': nome_especializacao, 'MUNICIPIO': municipio_especializacao,
+                    'UF': estado_especializacao, 'Proximidade': proximidade})
+    etapa_filtros.stop()
+    with stage('resultado', len(data_especializacao)) as etapa:
+        # O bitmap da cascata já tem todos os filtros; não é preciso compilá-lo de novo
+        linhas = cached_rows('especializacao', data_especializacao, filtros,
+                             lambda: facetas.ordered_rows(filtro))
+        etapa.linhas_saida = len(linhas)
 
     
     st.caption(""" ---
     __Atenção__: Se a tabela estiver muito pequena, você pode clicar no botão de ampliar no canto superior ou baixar a tabela nos botões abaixo""")
     # Aqui você pode adicionar a lógica para exibir a tabela com base nas seleções feitas.
-    st.dataframe(df_filtrado[['NOME_ESPECIALIZACAO','NOME_IES','MUNICIPIO','UF','MODALIDADE','DURACAO_MESES','CARGA_HORARIA']],hide_index=True)
+    show_paginated_table('especializacao', data_especializacao, linhas,
+                         ['NOME_ESPECIALIZACAO','NOME_IES','MUNICIPIO','UF','MODALIDADE','DURACAO_MESES','CARGA_HORARIA'])
 
 
 
     st.markdown(""" ---
     Utilize os botões abaixo se desejar baixar os dados da tabela acima :red[(primeiro botão)] ou baixar a base de dados orignal com todos os cursos de especialização das universidades públicas do Brasil :blue[(segundo botão)]""")
-    col_download1, col_download2 = st.columns(2)
-    with col_download1:
-        # Botão para baixar dados filtrados
-        if st.button('Planilha CSV dos dados dos cursos de especializacao', type="primary"):
-            csv = convert_df_to_csv(df_filtrado)
-            st.download_button(label="Dados prontos para download. Clique aqui para baixar.", 
-                            data=csv, 
-                            file_name='Dados_filtrados_graduacao.csv', 
-                            mime='text/csv')    
-    with col_download2:
-        # Botão para baixar todos os dados
-        if st.button('Planilha CSV com todas as especializações do Brasil', type="secondary"):
-            csv = convert_df_to_csv(data_especializacao)
-            st.download_button(label="Dados prontos para download. Clique aqui para baixar.", 
-                            data=csv, 
-                            file_name='Todos_os_dados_graduacao.csv', 
-                            mime='text/csv')
+    show_download_buttons('especializacao', data_especializacao, linhas,
+                          'Planilha CSV dos dados dos cursos de especializacao',
+                          'Planilha com todas as especializações do Brasil',
+                          'Dados_filtrados_especializacao', 'Todos_os_dados_especializacao')
 
 # Interface Mestrado e Doutorado
+@st.fragment
+@instrumented_tab('mestrado_doutorado')
 def show_mestrado_doutorado():
     st.caption("""🔍 **Escolha os filtros que preferir** e veja os resultados na tabela no final da página.    
     💡 **Dica:** Você pode deixar todos os filtros em branco se quiser ver todos os dados 🌐
 """)
+    with stage('carga') as etapa:
+        data_mestrado_doutorado, facetas, busca_nomes = load_tab_mestrado_doutorado()
+        etapa.linhas_saida = len(data_mestrado_doutorado)
+    # Filtros em cascata: das opções de cada campo até a última seleção
+    etapa_filtros = stage('filtros', len(data_mestrado_doutorado)).start()
+
     col_niveis, col_area = st.columns(2)
     with col_niveis:
         # Opções fixas para os níveis de curso (Mestrado e Doutorado)
@@ -193,172 +391,178 @@ def show_mestrado_doutorado():
                                 default=niveis_opcoes)
         # Filtrando dados com base na seleção de níveis
         # Usando correspondência parcial para capturar variações como 'MESTRADO EM ...'
-        data_niveis = data_mestrado_doutorado if not niveis else data_mestrado_doutorado[data_mestrado_doutorado['Nivel_Programa'].str.contains('|'.join(niveis), case=False)]
+        filtro_niveis = facetas.all_rows() if not niveis else facetas.select_where(
+            'Nivel_Programa', lambda nivel: any(n.lower() in nivel.lower() for n in niveis))
     with col_area:
         # Multiselect para Área de Conhecimento
         areas_conhecimento = st.multiselect('Área de conhecimento', 
-                                            sorted(data_mestrado_doutorado['Area_Conhecimento'].unique()), 
+                                            facetas.options('Area_Conhecimento'), 
                                             default=[])
         st.caption('__Atenção aos servidores públicos:__ Observe se esta informação está alinhada com seu ambiente organizacional')
         # Filtrando dados com base na seleção de áreas de conhecimento
-        data_areas = data_niveis if not areas_conhecimento else data_niveis[data_niveis['Area_Conhecimento'].isin(areas_conhecimento)]
+        filtro_areas = filtro_niveis & facetas.select('Area_Conhecimento', areas_conhecimento)
 
 
 
     # Multiselect para as notas CAPES
     notas_capes = st.multiselect('Avaliação CAPES', 
-                                sorted(data_areas['Nota_Conceito'].unique()), 
+                                facetas.options('Nota_Conceito', filtro_areas), 
                                 default=[])
-    data_notas = data_areas if not notas_capes else data_areas[data_areas['Nota_Conceito'].isin(notas_capes)]
+    filtro_notas = filtro_areas & facetas.select('Nota_Conceito', notas_capes)
 
 
-    data_atual = data_notas
+    # Programas a até N km de uma cidade (só com o arquivo de coordenadas)
+    filtro_proximidade, proximidade = proximity_filter('mestrado_doutorado', data_mestrado_doutorado, facetas, 'UF', 'Municipio')
+    filtro_atual = filtro_notas & filtro_proximidade
 
     col_estado, col_municipio = st.columns(2)
     with col_estado:
         # Multiselect para estados
         estados = st.multiselect('Estado da instituição', 
-                                sorted(data_atual['UF'].unique()), 
+                                facetas.options('UF', filtro_atual), 
                                 default=[])
         # Filtrando dados com base na seleção de estados
-        data_estados = data_atual if not estados else data_atual[data_atual['UF'].isin(estados)]
+        filtro_estados = filtro_atual & facetas.select('UF', estados)
 
 
     with col_municipio:
-        # Condicionando a exibição de municípios com base nos estados selecionados
-        if estados:
-            municipios_opcoes = sorted(data_estados['Municipio'].unique())
-        else:
-            municipios_opcoes = sorted(data_atual['Municipio'].unique())
+        # Os municípios oferecidos são apenas os dos estados selecionados (ou de todos, sem seleção)
+        municipios_opcoes = facetas.options('Municipio', filtro_estados)
 
         # Multiselect para Município
         municipios = st.multiselect('Município', 
                                     municipios_opcoes, 
                                     default=[])
         # Filtrando dados com base na seleção de municípios
-        data_municipios = data_estados if not municipios else data_estados[data_estados['Municipio'].isin(municipios)]
+        filtro_municipios = filtro_estados & facetas.select('Municipio', municipios)
    
 
 
-    # Usando 'data_municipios' como base para os próximos filtros
-    data_atual = data_municipios
+    # Usando 'filtro_municipios' como base para os próximos filtros
+    filtro_atual = filtro_municipios
 
     col_sigla_ies, col_nome_ies = st.columns(2)
     with col_sigla_ies:
         # Multiselect para siglas das instituições
         instituicoes = st.multiselect('Sigla da Instituição', 
-                                    sorted(data_atual['Sigla_IES'].unique()), 
+                                    facetas.options('Sigla_IES', filtro_atual), 
                                     default=[])
-        # Filtrando dados com base na seleção de siglas
-        data_sigla_ies = data_atual if not instituicoes else data_atual[data_atual['Sigla_IES'].isin(instituicoes)]
 
     with col_nome_ies:
         # Multiselect para nomes das instituições
         nomes_ies = st.multiselect('Nome da Instituição', 
-                                sorted(data_atual['Nome_IES'].unique()), 
+                                facetas.options('Nome_IES', filtro_atual), 
                                 default=[])
-        # Filtrando dados com base na seleção de nomes
-        data_nome_ies = data_atual if not nomes_ies else data_atual[data_atual['Nome_IES'].isin(nomes_ies)]
     st.caption('Você pode selecionar as instituições de seu interesse pela :blue[*_Sigla_*] pelo :red[*_Nome da Instituição_*] ou pelos dois ao mesmo tempo.')
 
-    # Combinando os filtros de Sigla e Nome da IES
-    # Isso permite que ambos os filtros sejam aplicados em conjunto
-    filtered_data = data_sigla_ies.merge(data_nome_ies, how='inner')
-
-    # Ordenando os dados primeiro por Nome_Programa e depois por Sigla_IES, UF, Município e Modalidade
-    filtered_data_sorted = filtered_data.sort_values(by=['Nome_Programa', 'Sigla_IES', 'UF', 'Municipio', 'Modalidade'])
+    # Programas das instituições escolhidas, com busca pelo nome
+    filtro_ies = filtro_atual & facetas.select('Sigla_IES', instituicoes) & facetas.select('Nome_IES', nomes_ies)
+    opcoes_programa = search_box('Buscar programa', busca_nomes,
+                                 facetas.options('Nome_Programa', filtro_ies), 'nome_programa')
+    nomes_programa = st.multiselect('Nome do Programa', 
+                                    opcoes_programa, 
+                                    default=[], key='nome_programa')
+    filtro_programa = filtro_ies & facetas.select('Nome_Programa', nomes_programa)
+
+    # O bitmap da cascata (filtro_programa) já combina todos os filtros, inclusive
+    # Sigla e Nome da IES em conjunto, como a especificação em filter_spec.py;
+    # o dicionário abaixo só serve de chave do cache de resultados.
+    # As linhas já vêm ordenadas por Nome_Programa e depois por Sigla_IES, UF, Município e Modalidade
+    filtros = {'Nivel_Programa': niveis, 'Area_Conhecimento': areas_conhecimento, 'Nota_Conceito': notas_capes,
+               'UF': estados, 'Municipio': municipios, 'Sigla_IES': instituicoes, 'Nome_IES': nomes_ies,
+               'Nome_Programa': nomes_programa, 'Proximidade': proximidade}
+    etapa_filtros.stop()
+    with stage('resultado', len(data_mestrado_doutorado)) as etapa:
+        linhas = cached_rows('mestrado_doutorado', data_mestrado_doutorado, filtros,
+                             lambda: facetas.ordered_rows(filtro_programa))
+        etapa.linhas_saida = len(linhas)
         
     st.caption(""" ---
     __Atenção__: Você pode acessar mais informações sobre o programa como email, site, telefone na coluna 'Mais informações'. Você será direcionado diretamente à plataforma Sucupira""")
     # Exibindo a tabela com os resultados filtrados
     # Configurando a coluna 'Link' para exibir o texto "Mais informações" e redirecionar para o URL correspondente
     link_column_config = st.column_config.LinkColumn(label="Mais informações",display_text="LINK")
-    st.dataframe(filtered_data_sorted[['Nome_Programa', 'Sigla_IES', 'UF', 
-                                      'Municipio', 'Area_Conhecimento', 'Nota_Conceito', 'Nivel_Programa',
-                                      'Modalidade', 'Link']],
-                 column_config={"Link": link_column_config},hide_index=True)
+    show_paginated_table('mestrado_doutorado', data_mestrado_doutorado, linhas,
+                         ['Nome_Programa', 'Sigla_IES', 'UF',
+                          'Municipio', 'Area_Conhecimento', 'Nota_Conceito', 'Nivel_Programa',
+                          'Modalidade', 'Link'],
+                         column_config={"Link": link_column_config})
     
 
     st.markdown(""" ---
     Utilize os botões abaixo se desejar baixar os dados da tabela acima :red[(primeiro botão)] ou baixar a base de dados orignal com todos os programas de mestrado e doutorado das universidades públicas do Brasil :blue[(segundo botão)]""")
-    col_download1, col_download2 = st.columns(2)
-    with col_download1:
-        # Botão para baixar dados filtrados
-        if st.button('Planilha CSV de todos os dados da tabela acima', type="primary"):
-            csv = convert_df_to_csv(filtered_data_sorted)
-            st.download_button(label="Dados prontos para download. Clique aqui para baixar.", 
-                            data=csv, 
-                            file_name='Dados_filtrados.csv', 
-                            mime='text/csv')    
-    with col_download2:
-        # Botão para baixar todos os dados
-        if st.button('Planilha CSV com todos os programas do Brasil', type="secondary"):
-            csv = convert_df_to_csv(data_mestrado_doutorado)
-            st.download_button(label="Dados prontos para download. Clique aqui para baixar.", 
-                            data=csv, 
-                            file_name='Todos_os_dados.csv', 
-                            mime='text/csv')
+    show_download_buttons('mestrado_doutorado', data_mestrado_doutorado, linhas,
+                          'Planilha CSV de todos os dados da tabela acima',
+                          'Planilha com todos os programas do Brasil',
+                          'Dados_filtrados', 'Todos_os_dados')
     
     
 
 
 # Função para exibir a mensagem de "Em Construção"
+@st.fragment
+@instrumented_tab('graduacao')
 def show_graduacao():
     
     st.caption("""🔍 **Escolha os filtros que preferir** e veja os resultados na tabela no final da página.    
     💡 **Dica:** Você pode deixar todos os filtros em branco se quiser ver todos os dados 🌐
 """)
 
+    with stage('carga') as etapa:
+        data_graduacao, facetas, busca_nomes = load_tab_graduacao()
+        etapa.linhas_saida = len(data_graduacao)
+    # Filtros em cascata: das opções de cada campo até a última seleção
+    etapa_filtros = stage('filtros', len(data_graduacao)).start()
+
     col_graus, col_modalidade = st.columns(2)
     with col_graus:
         # Seleção múltipla para os níveis de curso
         graus = st.multiselect('Tipos de graduação (Licenciatura, Bacharelado, etc.)', 
-                                sorted(data_graduacao['Grau'].unique()), 
+                                facetas.options('Grau'), 
                                 default=["Bacharelado","Licenciatura"])
         # Filtrando dados com base na seleção de níveis
-        data_graus = data_graduacao if not graus else data_graduacao[data_graduacao['Grau'].isin(graus)]
+        filtro_graus = facetas.select('Grau', graus)
 
     with col_modalidade:
         # Multiselect para Modalidade de ensino
         modalidade_ensino = st.multiselect('Modalidade de Ensino (Presencial ou EAD)', 
-                                            sorted(data_graduacao['Modalidade_Ensino'].unique()), 
+                                            facetas.options('Modalidade_Ensino'), 
                                             default=["Educação Presencial"])
         # Filtrando dados com base na seleção de áreas de conhecimento
-        data_modalidade = data_graus if not modalidade_ensino else data_graus[data_graus['Modalidade_Ensino'].isin(modalidade_ensino)]
+        filtro_modalidade = filtro_graus & facetas.select('Modalidade_Ensino', modalidade_ensino)
 
 
 
 
 
-    data_atual_graduacao = data_modalidade
+    # Cursos a até N km de uma cidade (só com o arquivo de coordenadas)
+    filtro_proximidade, proximidade = proximity_filter('graduacao', data_graduacao, facetas, 'UF', 'Municipio')
+    filtro_atual_graduacao = filtro_modalidade & filtro_proximidade
 
     col_estado, col_municipio = st.columns(2)
     with col_estado:
         # Multiselect para estados
         estados = st.multiselect('Estado/UF', 
-                                sorted(data_atual_graduacao['UF'].unique()), 
+                                facetas.options('UF', filtro_atual_graduacao), 
                                 default=[])
         # Filtrando dados com base na seleção de estados
-        data_estados = data_atual_graduacao if not estados else data_atual_graduacao[data_atual_graduacao['UF'].isin(estados)]
+        filtro_estados = filtro_atual_graduacao & facetas.select('UF', estados)
 
 
     with col_municipio:
-        # Condicionando a exibição de municípios com base nos estados selecionados
-        if estados:
-            municipios_opcoes = sorted(data_estados['Municipio'].unique())
-        else:
-            municipios_opcoes = sorted(data_atual_graduacao['Municipio'].unique())
+        # Os municípios oferecidos são apenas os dos estados selecionados (ou de todos, sem seleção)
+        municipios_opcoes = facetas.options('Municipio', filtro_estados)
 
         # Multiselect para Município
         municipios = st.multiselect('Município da instituição', 
                                     municipios_opcoes, 
                                     default=[])
         # Filtrando dados com base na seleção de municípios
-        data_municipios = data_estados if not municipios else data_estados[data_estados['Municipio'].isin(municipios)]
+        filtro_municipios = filtro_estados & facetas.select('Municipio', municipios)
 
 
-    # Usando 'data_municipios' como base para os próximos filtros
-    data_atual_graduacao = data_municipios
+    # Usando 'filtro_municipios' como base para os próximos filtros
+    filtro_atual_graduacao = filtro_municipios
 
 
     col_nome_ies, col_curso_ies = st.columns(2)
@@ -366,67 +570,123 @@ def show_graduacao():
     with col_nome_ies:
         # Multiselect para nomes das instituições
         nomes_ies = st.multiselect('Nome da Instituição', 
-                                sorted(data_atual_graduacao['Nome_IES'].unique()), 
+                                facetas.options('Nome_IES', filtro_atual_graduacao), 
                                 default=[])
         # Filtrando dados com base na seleção de nomes
-        data_nome_ies = data_atual_graduacao if not nomes_ies else data_atual_graduacao[data_atual_graduacao['Nome_IES'].isin(nomes_ies)]
+        filtro_nome_ies = filtro_atual_graduacao & facetas.select('Nome_IES', nomes_ies)
     
     with col_curso_ies:
-        # Multiselect para nomes das instituições
+        # Multiselect para os cursos, com busca pelo nome
+        opcoes_curso = search_box('Buscar curso', busca_nomes,
+                                  facetas.options('Nome_Curso', filtro_nome_ies), 'curso_graduacao')
         curso_ies = st.multiselect('Curso', 
-                                sorted(data_nome_ies['Nome_Curso'].unique()), 
-                                default=[])
-        # Filtrando dados com base na seleção de nomes
-        data_curso_ies = data_nome_ies if not curso_ies else data_nome_ies[data_nome_ies['Nome_Curso'].isin(curso_ies)]
-    
-    # Ordenando os dados primeiro por Nome_Programa e depois por Sigla_IES, UF, Município e Modalidade
-    filtered_data_sorted = data_curso_ies.sort_values(by=['Nome_Curso', 'Nome_IES', 'UF', 'Municipio', 'Modalidade_Ensino'])
+                                opcoes_curso, 
+                                default=[], key='curso_graduacao')
+        filtro_curso = filtro_nome_ies & facetas.select('Nome_Curso', curso_ies)
+
+    # Linhas ordenadas primeiro por Nome_Curso e depois por Nome_IES, UF, Município e Modalidade
+    filtros = {'Grau': graus, 'Modalidade_Ensino': modalidade_ensino, 'UF': estados, 'Municipio': municipios,
+               'Nome_IES': nomes_ies, 'Nome_Curso': curso_ies, 'Proximidade': proximidade}
+    etapa_filtros.stop()
+    with stage('resultado', len(data_graduacao)) as etapa:
+        linhas = cached_rows('graduacao', data_graduacao, filtros,
+                             lambda: facetas.ordered_rows(filtro_curso))
+        etapa.linhas_saida = len(linhas)
     
     st.caption(""" ---
     __Atenção__: Se a tabela estiver muito pequena, você pode clicar no botão de ampliar no canto superior ou baixar a tabela nos botões abaixo""")
     # Exibindo a tabela com os resultados filtrados
-    st.dataframe(filtered_data_sorted[['Nome_Curso', 'Nome_IES', 'UF', 
-                                    'Municipio', 'Modalidade_Ensino','Grau','Area_Conhecimento' ]],hide_index=True)
+    show_paginated_table('graduacao', data_graduacao, linhas,
+                         ['Nome_Curso', 'Nome_IES', 'UF',
+                          'Municipio', 'Modalidade_Ensino','Grau','Area_Conhecimento'])
     
 
     st.markdown(""" ---
     Utilize os botões abaixo se desejar baixar os dados da tabela acima :red[(primeiro botão)] ou baixar a base de dados orignal com todos os cursos de graduação das universidades públicas do Brasil :blue[(segundo botão)]""")
-    col_download1, col_download2 = st.columns(2)
-    with col_download1:
-        # Botão para baixar dados filtrados
-        if st.button('Planilha CSV dos dados da tabela acima', type="primary"):
-            csv = convert_df_to_csv(filtered_data_sorted)
-            st.download_button(label="Dados prontos para download. Clique aqui para baixar.", 
-                            data=csv, 
-                            file_name='Dados_filtrados_graduacao.csv', 
-                            mime='text/csv')    
-    with col_download2:
-        # Botão para baixar todos os dados
-        if st.button('Planilha CSV com todos os cursos do Brasil', type="secondary"):
-            csv = convert_df_to_csv(data_graduacao)
-            st.download_button(label="Dados prontos para download. Clique aqui para baixar.", 
-                            data=csv, 
-                            file_name='Todos_os_dados_graduacao.csv', 
-                            mime='text/csv')
+    show_download_buttons('graduacao', data_graduacao, linhas,
+                          'Planilha CSV dos dados da tabela acima',
+                          'Planilha com todos os cursos do Brasil',
+                          'Dados_filtrados_graduacao', 'Todos_os_dados_graduacao')
     
 
 
 
 
 
+ROTULOS_PERFIL = {'graduacao': 'Graduação', 'especializacao': 'Especialização', 'mestrado': 'Mestrado',
+                  'doutorado': 'Doutorado'}
+ROTULOS_DISTRIBUICAO = {'por_grau': 'Por grau / nível', 'por_modalidade': 'Por modalidade', 'por_area': 'Por área',
+                        'notas_capes': 'Notas da CAPES (programas de pós)'}
+
+
+def show_profile(perfil):
+    """Resumo de um perfil: contagens, vagas e as distribuições em tabelas."""
+    st.markdown(f"#### {perfil['nome']}")
+    for coluna, (campo, rotulo) in zip(st.columns(len(ROTULOS_PERFIL)), ROTULOS_PERFIL.items()):
+        coluna.metric(rotulo, f"{perfil[campo]:,}".replace(',', '.'))
+    st.caption(f"Vagas autorizadas: {perfil['vagas_graduacao']:,} na graduação e "
+               f"{perfil['vagas_especializacao']:,} na especialização".replace(',', '.'))
+    for campo, rotulo in ROTULOS_DISTRIBUICAO.items():
+        contagens = json.loads(perfil[campo])
+        if not contagens:
+            continue
+        with st.expander(rotulo):
+            if campo == 'notas_capes':
+                tabela = pd.Series(contagens, name='Programas').to_frame()
+            else:
+                tabela = pd.DataFrame(contagens).fillna(0).astype(int).sort_index()
+            st.dataframe(tabela)
+
+
+# Resumo por instituição e por cidade
+@st.fragment
+@instrumented_tab('perfis')
+def show_perfis():
+    st.caption("""🏛️ **Escolha uma instituição ou uma cidade** e veja, de uma vez, quantos cursos de graduação e especialização e quantos mestrados e doutorados ela tem.
+""")
+    with stage('carga') as etapa:
+        perfil_ies, perfil_municipio = load_tab_perfis()
+        etapa.linhas_saida = len(perfil_ies) + len(perfil_municipio)
+
+    col_ies, col_municipio = st.columns(2)
+    with col_ies:
+        chave_ies = st.selectbox('Instituição', perfil_ies.index, index=None,
+                                 format_func=lambda chave: perfil_ies.at[chave, 'nome'],
+                                 placeholder='Digite o nome da instituição')
+    with col_municipio:
+        chave_municipio = st.selectbox('Município', perfil_municipio.index, index=None,
+                                       format_func=lambda chave: f"{perfil_municipio.at[chave, 'nome']} "
+                                                                 f"({chave.split('|')[0]})",
+                                       placeholder='Digite o nome da cidade')
+    for chave, perfis in ((chave_ies, perfil_ies), (chave_municipio, perfil_municipio)):
+        if chave is not None:
+            with stage('resultado', len(perfis)):
+                show_profile(perfis.loc[chave])
+
+
 def main():
     st.title('Guia das Federais')
     st.subheader('Encontre cursos de graduação, especialização, mestrado e doutorado das universidades públicas do Brasil num único lugar')
 
     # Criação de abas para Graduação e Pós-Graduação
-    tab1, tab2, tab3 = st.tabs(["CURSOS DE GRADUAÇÃO","ESPECIALIZAÇÃO","MESTRADO E DOUTORADO"])
-
-    with tab1:
-        show_graduacao()
-    with tab2:
-        show_especializacao()
-    with tab3:
-        show_mestrado_doutorado()
+    abas = {
+        "CURSOS DE GRADUAÇÃO": show_graduacao,
+        "ESPECIALIZAÇÃO": show_especializacao,
+        "MESTRADO E DOUTORADO": show_mestrado_doutorado,
+        "INSTITUIÇÕES E CIDADES": show_perfis,
+    }
+    # Só roda a aba aberta e as já visitadas na sessão. As visitadas continuam
+    # sendo desenhadas para que seus filtros não se percam ao trocar de aba.
+    visitadas = st.session_state.setdefault('abas_visitadas', set())
+    for aba, (rotulo, show) in zip(st.tabs(list(abas), on_change="rerun", key="aba"), abas.items()):
+        with aba:
+            if aba.open is not False:
+                visitadas.add(rotulo)
+            if rotulo in visitadas:
+                show()
+
+    if MOSTRAR_ESTATISTICAS:
+        st.caption(f"Cache de resultados: {cache_resultados.stats()}")
     
 
     st.markdown(""" ---
@@ -0,0 +1,264 @@
+"""
+Mede quantos bytes um cliente HTTP Range precisa baixar por consulta típica.
+
+Sobe um servidor estático local (com suporte a ``Range``) na pasta gerada por
+``python3 build_sqlite_db.py --http-range`` e abre o banco por um VFS que lê
+o arquivo em blocos de ``requestChunkSize`` bytes, como o sql.js-httpvfs faz
+no navegador. Leituras sequenciais dobram o tamanho da requisição seguinte, como a
+leitura antecipada do sql.js-httpvfs. Cada consulta roda com o cache vazio e
+o script informa quantas requisições e quantos bytes ela precisou, comparando
+com o download do .gz inteiro.
+
+Uso:
+    python3 build_sqlite_db.py --normalizado --http-range
+    python3 benchmarks/bytes_http_range.py [pasta] [--json]
+
+Requer o pacote ``apsw`` (em requirements-dev.txt), que expõe a API de VFS do
+SQLite para Python; o módulo ``sqlite3`` da biblioteca padrão não expõe.
+"""
+
+import argparse
+import http.server
+import json
+import re
+import sys
+import threading
+import urllib.request
+from functools import partial
+from pathlib import Path
+
+try:
+    import apsw
+except ImportError:  # pragma: no cover - dependência só deste script
+    sys.exit("Este script precisa do pacote apsw: pip install -r requirements-dev.txt")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from build_sqlite_db import GZ_PATH, HTTP_DIR  # noqa: E402
+
+# Leituras sequenciais dobram o tamanho da próxima requisição até este número
+# de blocos, imitando a leitura antecipada do sql.js-httpvfs
+MAX_LEITURA_ANTECIPADA = 256
+
+# Consultas como o docs/app.js monta (filtros padrão de cada aba e variações comuns)
+COLUNAS_GRADUACAO = "nome_ies, nome_curso, municipio, uf, grau, modalidade, area_conhecimento, vagas_autorizadas"
+COLUNAS_POS = ("sigla_ies, nome_programa, municipio, uf, area_conhecimento, nota_conceito, nome_ies, "
+               "nivel_programa, modalidade, link")
+COLUNAS_ESPECIALIZACAO = ("nome_ies, nome_especializacao, municipio, uf, modalidade, carga_horaria, "
+                          "duracao_meses, area_conhecimento")
+PADRAO_GRADUACAO = "grau IN ('Bacharelado', 'Licenciatura', 'Tecnológico') AND modalidade IN ('Educação Presencial')"
+
+CONSULTAS = {
+    "graduação (filtros padrão)":
+        f"SELECT {COLUNAS_GRADUACAO} FROM graduacao WHERE {PADRAO_GRADUACAO} "
+        "ORDER BY nome_curso, nome_ies, municipio LIMIT 400",
+    "graduação, UF = MG":
+        f"SELECT {COLUNAS_GRADUACAO} FROM graduacao WHERE {PADRAO_GRADUACAO} AND uf IN ('MG') "
+        "ORDER BY nome_curso, nome_ies, municipio LIMIT 400",
+    "graduação, busca \"engenharia civil\"":
+        f"SELECT {COLUNAS_GRADUACAO} FROM graduacao WHERE {PADRAO_GRADUACAO} AND id IN "
+        "(SELECT rowid FROM graduacao_fts WHERE graduacao_fts MATCH 'nome_curso : (\"engenharia civil\"*)') "
+        "ORDER BY nome_curso, nome_ies, municipio LIMIT 400",
+    "pós (filtros padrão)":
+        f"SELECT {COLUNAS_POS} FROM pos WHERE (nivel_programa LIKE '%MESTRADO%' OR nivel_programa LIKE '%DOUTORADO%') "
+        "ORDER BY nome_programa, sigla_ies, municipio LIMIT 400",
+    "pós, UF = RS e área = EDUCAÇÃO":
+        f"SELECT {COLUNAS_POS} FROM pos WHERE uf IN ('RS') AND area_conhecimento IN ('EDUCAÇÃO') "
+        "ORDER BY nome_programa, sigla_ies, municipio LIMIT 400",
+    "especialização, carga 360-720 h":
+        f"SELECT {COLUNAS_ESPECIALIZACAO} FROM especializacao WHERE carga_horaria >= 360 AND carga_horaria <= 720 "
+        "ORDER BY nome_especializacao, nome_ies, municipio LIMIT 400",
+    "opções do filtro de UF":
+        "SELECT DISTINCT uf AS value FROM graduacao WHERE uf IS NOT NULL ORDER BY uf",
+}
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Servidor estático com ``Range: bytes=a-b`` (o do http.server não tem)."""
+
+    bytes_enviados = 0
+
+    def send_head(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not match:
+            return super().send_head()
+        path = Path(self.translate_path(self.path))
+        inicio, fim = int(match[1]), int(match[2])
+        tamanho = path.stat().st_size
+        fim = min(fim, tamanho - 1)
+        with open(path, "rb") as fh:
+            fh.seek(inicio)
+            corpo = fh.read(fim - inicio + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Range", f"bytes {inicio}-{fim}/{tamanho}")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        type(self).bytes_enviados += len(corpo)
+        self.wfile.write(corpo)
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPRangeFile:
+    """Arquivo do banco lido em blocos por HTTP Range, com cache de blocos."""
+
+    def __init__(self, base_url, config):
+        self.base_url = base_url
+        self.config = config
+        self.bloco = config["requestChunkSize"]
+        self.cache = {}
+        self.requisicoes = 0
+        self.bytes = 0
+        self.proximo_sequencial = None
+        self.antecipacao = 1
+
+    def _urls(self, inicio, fim):
+        """Trechos (url, início, fim) de [inicio, fim] nos arquivos do servidor."""
+        if self.config["serverMode"] == "full":
+            yield f"{self.base_url}/{self.config['url']}", inicio, fim
+            return
+        tamanho = self.config["serverChunkSize"]
+        while inicio <= fim:
+            n, deslocamento = divmod(inicio, tamanho)
+            ate = min(fim, (n + 1) * tamanho - 1)
+            sufixo = str(n).zfill(self.config["suffixLength"])
+            yield f"{self.base_url}/{self.config['urlPrefix']}{sufixo}", deslocamento, deslocamento + ate - inicio
+            inicio = ate + 1
+
+    def _fetch(self, primeiro, ultimo):
+        if primeiro == self.proximo_sequencial:
+            self.antecipacao = min(self.antecipacao * 2, MAX_LEITURA_ANTECIPADA)
+        else:
+            self.antecipacao = 1
+        total_blocos = -(-self.config["databaseLengthBytes"] // self.bloco)
+        ultimo = min(max(ultimo, primeiro + self.antecipacao - 1), total_blocos - 1)
+        self.proximo_sequencial = ultimo + 1
+
+        inicio = primeiro * self.bloco
+        fim = min((ultimo + 1) * self.bloco, self.config["databaseLengthBytes"]) - 1
+        dados = b""
+        for url, de, ate in self._urls(inicio, fim):
+            pedido = urllib.request.Request(url, headers={"Range": f"bytes={de}-{ate}"})
+            with urllib.request.urlopen(pedido) as resposta:
+                dados += resposta.read()
+            self.requisicoes += 1
+        self.bytes += len(dados)
+        for i, n in enumerate(range(primeiro, ultimo + 1)):
+            self.cache.setdefault(n, dados[i * self.bloco:(i + 1) * self.bloco])
+
+    def xRead(self, amount, offset):
+        primeiro, ultimo = offset // self.bloco, (offset + amount - 1) // self.bloco
+        faltando = [n for n in range(primeiro, ultimo + 1) if n not in self.cache]
+        if faltando:
+            # Blocos vizinhos que faltam vão numa requisição só
+            self._fetch(faltando[0], faltando[-1])
+        dados = b"".join(self.cache[n] for n in range(primeiro, ultimo + 1))
+        inicio = offset - primeiro * self.bloco
+        return dados[inicio:inicio + amount]
+
+    def xFileSize(self):
+        return self.config["databaseLengthBytes"]
+
+    def xWrite(self, data, offset):
+        raise apsw.ReadOnlyError("somente leitura")
+
+    def xTruncate(self, newsize):
+        raise apsw.ReadOnlyError("somente leitura")
+
+    def xSync(self, flags):
+        pass
+
+    def xLock(self, level):
+        pass
+
+    def xUnlock(self, level):
+        pass
+
+    def xCheckReservedLock(self):
+        return False
+
+    def xFileControl(self, op, ptr):
+        return False
+
+    def xSectorSize(self):
+        return self.bloco
+
+    def xDeviceCharacteristics(self):
+        return 0
+
+    def xClose(self):
+        pass
+
+
+class HTTPRangeVFS(apsw.VFS):
+    def __init__(self, base_url, config):
+        self.base_url = base_url
+        self.config = config
+        self.arquivo = None
+        super().__init__("http_range", "")
+
+    def xOpen(self, name, flags):
+        self.arquivo = HTTPRangeFile(self.base_url, self.config)
+        return self.arquivo
+
+    def xAccess(self, pathname, flags):
+        # Sem journal nem WAL no servidor
+        return False
+
+    def xFullPathname(self, name):
+        return name
+
+
+def measure(base_url, config):
+    """Roda cada consulta com o cache vazio; retorna requisições e bytes por consulta."""
+    vfs = HTTPRangeVFS(base_url, config)
+    resultados = {}
+    for nome, sql in CONSULTAS.items():
+        conn = apsw.Connection("file:guia.sqlite?immutable=1",
+                               flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI, vfs="http_range")
+        linhas = len(conn.execute(sql).fetchall())
+        arquivo = vfs.arquivo
+        resultados[nome] = {"linhas": linhas, "requisicoes": arquivo.requisicoes, "bytes": arquivo.bytes}
+        conn.close()
+    vfs.unregister()
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pasta", nargs="?", type=Path, default=HTTP_DIR,
+                        help="pasta com o config.json gerado por --http-range")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    config_path = args.pasta / "config.json"
+    if not config_path.exists():
+        parser.error(f"{config_path} não existe; rode python3 build_sqlite_db.py --http-range antes")
+    config = json.loads(config_path.read_text(encoding="utf-8"))
+
+    handler = partial(RangeRequestHandler, directory=str(args.pasta))
+    servidor = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        resultados = measure(f"http://127.0.0.1:{servidor.server_address[1]}", config)
+    finally:
+        servidor.shutdown()
+
+    total = config["databaseLengthBytes"]
+    gz = GZ_PATH.stat().st_size if GZ_PATH.exists() else None
+    if args.json:
+        print(json.dumps({"banco_bytes": total, "gz_bytes": gz, "consultas": resultados}, ensure_ascii=False, indent=2))
+        return
+    print(f"Banco: {total / 1024:.0f} KiB em páginas de {config['requestChunkSize']} bytes"
+          + (f"; download completo (.gz): {gz / 1024:.0f} KiB" if gz else ""))
+    print(f"{'consulta':42} {'linhas':>6} {'req.':>5} {'KiB':>7} {'% banco':>8}")
+    for nome, r in resultados.items():
+        print(f"{nome:42} {r['linhas']:>6} {r['requisicoes']:>5} {r['bytes'] / 1024:>7.0f} {100 * r['bytes'] / total:>7.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Teste de carga do serviço de consultas (query_service.py).
+
+Sobe o serviço num processo à parte sobre o guia.sqlite local (ou usa um já
+rodando com ``--url``) e dispara requisições de vários clientes simultâneos
+durante um tempo fixo. Cada cliente sorteia consultas de um catálogo que
+imita o uso do site (filtros padrão, uma UF, busca textual, facetas, páginas
+seguintes). Uma parte das requisições repete uma consulta já feita pelo mesmo
+cliente com ``If-None-Match``, como um cliente com cache faria.
+
+Informa requisições por segundo, latência (p50, p95, p99) e a contagem por
+status HTTP.
+
+Uso:
+    python3 build_sqlite_db.py
+    python3 benchmarks/carga_query_service.py [--clientes 8] [--segundos 10] [--json]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CONSULTAS = [
+    "/api/graduacao?grau=Bacharelado&grau=Licenciatura&modalidade=Educa%C3%A7%C3%A3o%20Presencial",
+    "/api/graduacao?uf={uf}&contar=1",
+    "/api/graduacao?q=engenharia&uf={uf}",
+    "/api/graduacao/facetas?coluna=municipio",
+    "/api/pos?nivel_programa__contem=MESTRADO&nivel_programa__contem=DOUTORADO",
+    "/api/pos?uf={uf}&nota_conceito=5&nota_conceito=6&nota_conceito=7",
+    "/api/pos?q=computa%C3%A7%C3%A3o&contar=1",
+    "/api/especializacao?carga_horaria__min=360&carga_horaria__max=720&uf={uf}",
+    "/api/especializacao?q=sa%C3%BAde&limite=200",
+]
+UFS = ["MG", "SP", "RJ", "BA", "PE", "RS", "PR", "PA", "CE", "DF"]
+
+# Fração das requisições que revalidam uma resposta já recebida (If-None-Match)
+REVALIDACOES = 0.3
+
+
+def percentile(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def client(url, fim, semente, latencias, status, lock):
+    rng = random.Random(semente)
+    vistos = {}
+    locais_latencias = []
+    locais_status = Counter()
+    while time.perf_counter() < fim:
+        cabecalhos = {}
+        if vistos and rng.random() < REVALIDACOES:
+            caminho = rng.choice(list(vistos))
+            # Páginas seguintes entram sem ETag: ainda não foram pedidas
+            if vistos[caminho]:
+                cabecalhos["If-None-Match"] = vistos[caminho]
+        else:
+            caminho = rng.choice(CONSULTAS).format(uf=rng.choice(UFS))
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url + caminho, headers=cabecalhos)) as resposta:
+                corpo = json.loads(resposta.read())
+                codigo = resposta.status
+                vistos[caminho] = resposta.headers["ETag"]
+                # Página seguinte, quando houver, como um cliente paginando
+                if corpo.get("proximo") and rng.random() < 0.5:
+                    separador = "&" if "?" in caminho else "?"
+                    vistos[f"{caminho}{separador}apos={corpo['proximo']}"] = ""
+        except urllib.error.HTTPError as erro:
+            codigo = erro.code
+        locais_latencias.append(time.perf_counter() - inicio)
+        locais_status[codigo] += 1
+    with lock:
+        latencias.extend(locais_latencias)
+        status.update(locais_status)
+
+
+def wait_ready(url, processo, espera=30):
+    limite = time.time() + espera
+    while time.time() < limite:
+        if processo is not None and processo.poll() is not None:
+            sys.exit("o serviço terminou antes de responder")
+        try:
+            urllib.request.urlopen(url + "/api").read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit(f"o serviço não respondeu em {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="serviço já rodando (padrão: sobe um local)")
+    parser.add_argument("--porta", type=int, default=8799)
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--json", action="store_true", help="imprime o resultado em JSON")
+    args = parser.parse_args()
+
+    processo = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.porta}"
+        processo = subprocess.Popen([sys.executable, str(ROOT / "query_service.py"), "--porta", str(args.porta)],
+                                    stdout=subprocess.DEVNULL)
+    try:
+        wait_ready(url, processo)
+        latencias, status, lock = [], Counter(), threading.Lock()
+        fim = time.perf_counter() + args.segundos
+        clientes = [threading.Thread(target=client, args=(url, fim, i, latencias, status, lock))
+                    for i in range(args.clientes)]
+        for c in clientes:
+            c.start()
+        for c in clientes:
+            c.join()
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+
+    resultado = {
+        "clientes": args.clientes,
+        "segundos": args.segundos,
+        "requisicoes": len(latencias),
+        "req_por_segundo": len(latencias) / args.segundos,
+        "p50_ms": percentile(latencias, 50) * 1000,
+        "p95_ms": percentile(latencias, 95) * 1000,
+        "p99_ms": percentile(latencias, 99) * 1000,
+        "media_ms": statistics.fmean(latencias) * 1000,
+        "status": {str(k): v for k, v in sorted(status.items())},
+    }
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        return
+    print(f"{resultado['requisicoes']} requisições de {args.clientes} clientes em {args.segundos:.0f} s: "
+          f"{resultado['req_por_segundo']:.0f} req/s")
+    print(f"latência p50 {resultado['p50_ms']:.1f} ms, p95 {resultado['p95_ms']:.1f} ms, "
+          f"p99 {resultado['p99_ms']:.1f} ms")
+    print("status: " + ", ".join(f"{k}: {v}" for k, v in resultado["status"].items()))
+
+
+if __name__ == "__main__":
+    main()
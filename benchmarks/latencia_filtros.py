@@ -0,0 +1,183 @@
+"""
+Mede a latência por interação da ordenação e dos filtros de intervalo do app.py.
+
+Compara, nas mesmas seleções de filtros:
+
+- ordenação: ``df.iloc[linhas].sort_values(...)`` a cada interação (antes)
+  contra a ordem de exibição pré-calculada no ``FacetIndex``, aplicada como
+  máscara sobre a permutação (depois);
+- intervalos (carga horária e duração da especialização): comparação na coluna
+  inteira com ``Series.between`` e união das listas de cada valor distinto
+  (antes) contra duas buscas binárias nas posições ordenadas pelo valor
+  (depois);
+- busca por nome: ``str.contains`` na coluna inteira do DataFrame a cada
+  tecla (antes) contra o índice de trigramas sobre os nomes distintos
+  (search_index.py), que também acha nomes com acentos e erros de digitação.
+
+O cache de resultados (result_cache.py) não entra na medição: cada repetição
+recalcula o resultado do zero, como numa combinação de filtros ainda não vista.
+
+Uso:
+    python3 benchmarks/latencia_filtros.py [--repeticoes 200] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from datasets import ARQUIVOS_CSV, load_dataset  # noqa: E402
+from facet_index import FacetIndex  # noqa: E402
+from filter_spec import FILTROS, compile_bitmap  # noqa: E402
+from search_index import TrigramIndex  # noqa: E402
+
+ORDEM_EXIBICAO = {
+    'graduacao': ['Nome_Curso', 'Nome_IES', 'UF', 'Municipio', 'Modalidade_Ensino'],
+    'mestrado_doutorado': ['Nome_Programa', 'Sigla_IES', 'UF', 'Municipio', 'Modalidade'],
+}
+
+CENARIOS_ORDENACAO = {
+    'graduação, filtros padrão': ('graduacao', {'Grau': ['Bacharelado', 'Licenciatura'],
+                                                'Modalidade_Ensino': ['Educação Presencial']}),
+    'graduação, sem filtros': ('graduacao', {}),
+    'graduação, uma UF': ('graduacao', {'Grau': ['Bacharelado', 'Licenciatura'],
+                                        'Modalidade_Ensino': ['Educação Presencial'], 'UF': ['MG']}),
+    'pós, filtros padrão': ('mestrado_doutorado', {'Nivel_Programa': ['MESTRADO', 'DOUTORADO']}),
+    'pós, uma UF': ('mestrado_doutorado', {'Nivel_Programa': ['MESTRADO', 'DOUTORADO'], 'UF': ['SP']}),
+}
+
+CENARIOS_INTERVALO = {
+    'carga horária 360-720': ('CARGA_HORARIA', 360, 720),
+    'carga horária 360-4000': ('CARGA_HORARIA', 360, 4000),
+    'duração 6-24 meses': ('DURACAO_MESES', 6, 24),
+}
+
+# Coluna com o nome de cada base e textos digitados na caixa de busca
+COLUNAS_BUSCA = {
+    'graduacao': 'Nome_Curso',
+    'especializacao': 'NOME_ESPECIALIZACAO',
+    'mestrado_doutorado': 'Nome_Programa',
+}
+CONSULTAS_BUSCA = ['fisica', 'ciencia da compotacao', 'engenharia eletrica', 'saude publica']
+
+
+def median_ms(funcao, repeticoes):
+    funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000
+
+
+def measure_sorting(repeticoes):
+    resultados = {}
+    indices = {}
+    for nome, (nome_base, selecoes) in CENARIOS_ORDENACAO.items():
+        if nome_base not in indices:
+            df = load_dataset(nome_base, ARQUIVOS_CSV[nome_base])
+            colunas = [filtro['coluna'] for filtro in FILTROS[nome_base]['filtros']]
+            indices[nome_base] = df, FacetIndex(df, colunas, ORDEM_EXIBICAO[nome_base])
+        df, facetas = indices[nome_base]
+        bitmap = compile_bitmap(facetas, nome_base, selecoes)
+        ordem = ORDEM_EXIBICAO[nome_base]
+
+        antes = df.iloc[facetas.rows(bitmap)].sort_values(by=ordem)
+        depois = df.iloc[facetas.ordered_rows(bitmap)]
+        assert antes.index.equals(depois.index), nome
+
+        resultados[nome] = {
+            'linhas': len(depois),
+            'antes_ms': median_ms(lambda: df.iloc[facetas.rows(bitmap)].sort_values(by=ordem), repeticoes),
+            'depois_ms': median_ms(lambda: df.iloc[facetas.ordered_rows(bitmap)], repeticoes),
+        }
+    return resultados
+
+
+def measure_ranges(repeticoes):
+    df = load_dataset('especializacao', ARQUIVOS_CSV['especializacao'])
+    colunas = [filtro['coluna'] for filtro in FILTROS['especializacao']['filtros']]
+    facetas = FacetIndex(df, colunas)
+    resultados = {}
+    for nome, (coluna, minimo, maximo) in CENARIOS_INTERVALO.items():
+        def coluna_inteira():
+            return np.packbits(df[coluna].between(minimo, maximo).to_numpy(), bitorder='little')
+
+        def uniao_listas():
+            valores = facetas.options(coluna)
+            return facetas._select_positions(coluna, [i for i, v in enumerate(valores) if minimo <= v <= maximo])
+
+        def busca_binaria():
+            return facetas.select_range(coluna, minimo, maximo)
+
+        esperado = coluna_inteira()
+        assert np.array_equal(esperado, uniao_listas()) and np.array_equal(esperado, busca_binaria()), nome
+        resultados[nome] = {
+            'linhas': facetas.count(esperado),
+            'coluna_inteira_ms': median_ms(coluna_inteira, repeticoes),
+            'uniao_listas_ms': median_ms(uniao_listas, repeticoes),
+            'busca_binaria_ms': median_ms(busca_binaria, repeticoes),
+        }
+    return resultados
+
+
+def measure_search(repeticoes):
+    resultados = {}
+    for nome_base, coluna in COLUNAS_BUSCA.items():
+        serie = load_dataset(nome_base, ARQUIVOS_CSV[nome_base])[coluna]
+        inicio = time.perf_counter()
+        indice = TrigramIndex(sorted(serie.dropna().unique()))
+        construcao_ms = (time.perf_counter() - inicio) * 1000
+        for consulta in CONSULTAS_BUSCA:
+            resultados[f'{nome_base}, {consulta}'] = {
+                'nomes': len(indice.valores),
+                'construcao_ms': construcao_ms,
+                'encontrados': len(indice.search(consulta)),
+                'str_contains_ms': median_ms(
+                    lambda: serie[serie.str.contains(consulta, case=False, regex=False, na=False)].unique(),
+                    repeticoes),
+                'trigramas_ms': median_ms(lambda: indice.search(consulta), repeticoes),
+            }
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeticoes', type=int, default=200)
+    parser.add_argument('--json', action='store_true', help='imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    ordenacao = measure_sorting(args.repeticoes)
+    intervalos = measure_ranges(args.repeticoes)
+    busca = measure_search(args.repeticoes)
+    if args.json:
+        print(json.dumps({'ordenacao': ordenacao, 'intervalos': intervalos, 'busca': busca},
+                         ensure_ascii=False, indent=2))
+        return
+
+    print(f"Mediana de {args.repeticoes} repetições, em ms")
+    print(f"{'ordenação':32} {'linhas':>6} {'sort_values':>12} {'permutação':>11}")
+    for nome, r in ordenacao.items():
+        print(f"{nome:32} {r['linhas']:>6} {r['antes_ms']:>12.2f} {r['depois_ms']:>11.2f}")
+    print()
+    print(f"{'intervalo':32} {'linhas':>6} {'between':>12} {'listas':>11} {'binária':>9}")
+    for nome, r in intervalos.items():
+        print(f"{nome:32} {r['linhas']:>6} {r['coluna_inteira_ms']:>12.3f} "
+              f"{r['uniao_listas_ms']:>11.3f} {r['busca_binaria_ms']:>9.3f}")
+    print()
+    print(f"{'busca por nome':44} {'nomes':>6} {'achados':>7} {'contains':>9} {'trigramas':>9}")
+    for nome, r in busca.items():
+        print(f"{nome:44} {r['nomes']:>6} {r['encontrados']:>7} {r['str_contains_ms']:>9.3f} "
+              f"{r['trigramas_ms']:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+"""
+Suíte de desempenho com dados sintéticos: tratamento, build do SQLite e consultas.
+
+Gera, numa pasta temporária, arquivos originais sintéticos do MEC e da CAPES
+em várias escalas (1×, 10×, 100× o tamanho atual) e mede, para cada escala:
+
+- cada etapa do pipeline (``filtrar_dados_capes_csv``, ``filtrar_dados_mec_csv``,
+  ``filtrar_cursos_especializacao``, ``build_sqlite_db.build`` e a carga das
+  bases no app, com snapshot e ``FacetIndex``): tempo, pico de memória (RSS)
+  e linhas por segundo. Cada etapa roda num processo Python novo, para que o
+  pico de memória seja só dela;
+- um catálogo fixo de consultas de filtro (``CONSULTAS``), com p50 e p95 em três
+  caminhos: máscara do pandas (``compile_mask``), bitmap do app
+  (``compile_bitmap`` + ``ordered_rows``) e SQLite (``compile_where``, contagem
+  mais a primeira página, como o site faz).
+
+Os dados sintéticos são sorteados, com reposição, das linhas reais: linhas
+inteiras, para manter a distribuição de cada coluna e as combinações entre
+elas (município com UF, curso com grau). A CAPES é sorteada do arquivo
+original, que já traz programas privados e fora de funcionamento. Os arquivos
+originais do MEC não ficam no repositório, então são remontados a partir dos
+CSVs tratados, no esquema original (colunas descartadas incluídas), somados a
+linhas que os filtros devem descartar (IES privadas, cursos extintos) na
+proporção de ``FRACAO_DESCARTADA``. Cópias repetidas de uma linha recebem um
+código (ou nome) diferente, para que as chaves do build continuem únicas.
+
+O resultado sai em JSON (``--saida``); ``--comparar`` mostra a razão entre os
+tempos desta execução e os de uma execução anterior.
+
+Uso:
+    python3 benchmarks/suite_sintetica.py [--escalas 1 10 100] [--repeticoes 50]
+                                           [--saida resultado.json] [--comparar anterior.json]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PASTA_CAPES = ROOT / 'dados' / 'CAPES_originais'
+PASTA_MEC = ROOT / 'dados' / 'MEC_originais'
+CAPES_ORIGINAL = PASTA_CAPES / 'br-capes-colsucup-prog-2021-2022-11-30.csv'
+
+# Arquivos sintéticos, no formato dos originais, dentro da pasta de cada escala
+ARQUIVOS = {
+    'capes': 'capes.csv',
+    'codigos_capes': 'codigos_capes.csv',
+    'graduacao': 'graduacao.csv',
+    'dicionario_graduacao': 'dicionario_codigos.csv',
+    'especializacao': 'especializacao.csv',
+}
+
+# Fração das linhas originais do MEC que os filtros descartam. É uma
+# aproximação: a maioria dos cursos cadastrados no e-MEC é de IES privadas
+FRACAO_DESCARTADA = {'graduacao': 0.75, 'especializacao': 0.75}
+CATEGORIAS_DESCARTADAS = ['Privada com fins lucrativos', 'Privada sem fins lucrativos', 'Pública Municipal']
+SITUACOES_DESCARTADAS = {'graduacao': 'Extinto', 'especializacao': 'Extinto'}
+# As IES privadas sintéticas têm códigos a partir deste, longe dos das públicas
+CODIGO_IES_PRIVADAS = 1_000_000
+
+CONSULTAS = {
+    'graduação, filtros padrão': ('graduacao', {'Grau': ['Bacharelado', 'Licenciatura'],
+                                                'Modalidade_Ensino': ['Educação Presencial']}),
+    'graduação, uma UF': ('graduacao', {'Grau': ['Bacharelado', 'Licenciatura'],
+                                        'Modalidade_Ensino': ['Educação Presencial'], 'UF': ['MG']}),
+    'graduação, um município': ('graduacao', {'UF': ['SP'], 'Municipio': ['São Paulo']}),
+    'pós, filtros padrão': ('mestrado_doutorado', {'Nivel_Programa': ['MESTRADO', 'DOUTORADO']}),
+    'pós, notas 6 e 7': ('mestrado_doutorado', {'Nivel_Programa': ['DOUTORADO'], 'Nota_Conceito': ['6', '7']}),
+    'especialização, carga 360-720': ('especializacao', {'CARGA_HORARIA': (360, 720)}),
+    'especialização, UF e EaD': ('especializacao', {'UF': ['RJ'], 'MODALIDADE': ['Educação a Distância'],
+                                                    'DURACAO_MESES': (6, 24)}),
+}
+
+# Colunas do FacetIndex e ordem de exibição de cada base, como em app.py
+INDICES_APP = {
+    'graduacao': (('Grau', 'Modalidade_Ensino', 'UF', 'Municipio', 'Nome_IES', 'Nome_Curso'),
+                  ('Nome_Curso', 'Nome_IES', 'UF', 'Municipio', 'Modalidade_Ensino')),
+    'mestrado_doutorado': (('Nivel_Programa', 'Area_Conhecimento', 'Nota_Conceito', 'UF', 'Municipio',
+                            'Sigla_IES', 'Nome_IES', 'Nome_Programa'),
+                           ('Nome_Programa', 'Sigla_IES', 'UF', 'Municipio', 'Modalidade')),
+    'especializacao': (('Area_Conhecimento', 'MODALIDADE', 'NOME_IES', 'NOME_ESPECIALIZACAO', 'CARGA_HORARIA',
+                        'DURACAO_MESES', 'MUNICIPIO', 'UF'), ()),
+}
+
+TAMANHO_PAGINA = 50
+
+# Linhas sintéticas montadas por vez: a memória da geração não cresce com a escala
+LINHAS_POR_BLOCO = 200_000
+
+
+# Geração dos dados sintéticos
+
+def read_text_csv(caminho, sep='\t'):
+    # Tudo como texto e sem converter "NA" em vazio: o arquivo sai igual ao lido
+    return pd.read_csv(caminho, sep=sep, dtype=str, keep_default_na=False)
+
+
+def sampled_blocks(modelo, n, rng):
+    """``n`` linhas sorteadas com reposição, em blocos, com o número da repetição de cada uma."""
+    sorteadas = rng.integers(0, len(modelo), n)
+    repeticao = pd.Series(sorteadas).groupby(sorteadas).cumcount().to_numpy()
+    for inicio in range(0, n, LINHAS_POR_BLOCO):
+        fim = inicio + LINHAS_POR_BLOCO
+        yield modelo.iloc[sorteadas[inicio:fim]].reset_index(drop=True), repeticao[inicio:fim]
+
+
+def write_blocks(blocos, destino, sep):
+    linhas = 0
+    for i, df in enumerate(blocos):
+        df.to_csv(destino, sep=sep, index=False, header=(i == 0), mode='w' if i == 0 else 'a')
+        linhas += len(df)
+    return linhas
+
+
+def with_suffix(serie, repeticao, formato):
+    # A primeira cópia mantém o valor original
+    sufixos = np.where(repeticao > 0, [formato.format(r) for r in repeticao], '')
+    return serie + sufixos
+
+
+def codes(serie):
+    return (pd.factorize(serie)[0] + 1).astype(str)
+
+
+def private_ies(n_ies, rng, n):
+    # IES que não aparecem na graduação pública: três privadas para cada pública
+    sorteadas = rng.integers(0, 3 * n_ies, n)
+    nomes = np.array([f"FACULDADE PARTICULAR SINTÉTICA {i:05d}" for i in sorteadas])
+    return nomes, (CODIGO_IES_PRIVADAS + sorteadas).astype(str)
+
+
+def ies_codes():
+    # Os CSVs tratados não trazem o CODIGO_IES: cada IES pública ganha um, o mesmo nas duas bases do MEC
+    nomes = read_text_csv(ROOT / 'graduacao_univ_publicas.csv')['Nome da IES'].unique()
+    return {nome: str(i + 1) for i, nome in enumerate(nomes)}
+
+
+def graduacao_template():
+    """Linhas públicas e ativas da graduação no esquema original do MEC."""
+    dicionario = pd.read_csv(PASTA_MEC / 'dicionario_codigos.csv', sep='\t')
+    originais = dict(zip(dicionario['Nome'], dicionario['Código']))
+    df = read_text_csv(ROOT / 'graduacao_univ_publicas.csv').rename(columns=originais)
+    df['CODIGO_IES'] = df['NOME_IES'].map(ies_codes())
+    df['CODIGO_AREA_OCDE_CINE'] = codes(df['AREA_OCDE'])
+    df['AREA_OCDE_CINE'] = df['AREA_OCDE']
+    df['CODIGO_MUNICIPIO'] = codes(df['MUNICIPIO'] + '/' + df['UF'])
+    df['CARGA_HORARIA'] = '3200'
+    return df[list(dicionario['Código'])]
+
+
+def especializacao_template():
+    """Linhas públicas e ativas da especialização no esquema original do MEC."""
+    df = read_text_csv(ROOT / 'especializacao_univ_publicas.csv').rename(columns={'Area_Conhecimento': 'OCDE_CINE'})
+    df['CODIGO_IES'] = df['NOME_IES'].map(ies_codes())
+    df['CODIGO_ESPECIALIZACAO'] = codes(df['NOME_ESPECIALIZACAO'])
+    df['CODIGO_OCDE_CINE'] = codes(df['OCDE_CINE'])
+    df['CODIGO_MUNICIPIO'] = codes(df['MUNICIPIO'] + '/' + df['UF'])
+    return df[['CODIGO_IES', 'NOME_IES', 'CODIGO_ESPECIALIZACAO', 'NOME_ESPECIALIZACAO', 'CODIGO_OCDE_CINE',
+               'OCDE_CINE', 'CARGA_HORARIA', 'DURACAO_MESES', 'MODALIDADE', 'VAGAS', 'CODIGO_MUNICIPIO',
+               'MUNICIPIO', 'UF', 'REGIAO', 'SITUACAO']]
+
+
+def mec_rows(nome, modelo, escala, rng):
+    """Blocos de linhas sintéticas do MEC: as que passam nos filtros e as que devem ser descartadas."""
+    total = round(escala * len(modelo) / (1 - FRACAO_DESCARTADA[nome]))
+    n_ies = modelo['NOME_IES'].nunique()
+    for df, repeticao in sampled_blocks(modelo, total, rng):
+        descartadas = rng.random(len(df)) < FRACAO_DESCARTADA[nome]
+        # Metade das descartadas é de IES privada, metade de curso extinto em IES pública
+        privadas = descartadas & (rng.random(len(df)) < 0.5)
+        df.loc[privadas, 'NOME_IES'], df.loc[privadas, 'CODIGO_IES'] = private_ies(n_ies, rng, int(privadas.sum()))
+        df.loc[descartadas & ~privadas, 'SITUACAO' if nome == 'especializacao' else 'SITUACAO_CURSO'] = \
+            SITUACOES_DESCARTADAS[nome]
+        if nome == 'graduacao':
+            df.loc[privadas, 'CATEGORIA_ADMINISTRATIVA'] = rng.choice(CATEGORIAS_DESCARTADAS, int(privadas.sum()))
+            # Chave do build: (código do curso, município)
+            df['CODIGO_CURSO'] = (df['CODIGO_CURSO'].astype(np.int64) + repeticao * 100_000_000).astype(str)
+        else:
+            # A especialização não tem código: a chave usa o nome do curso
+            df['NOME_ESPECIALIZACAO'] = with_suffix(df['NOME_ESPECIALIZACAO'], repeticao, ' ({})')
+        yield df
+
+
+def capes_rows(escala, rng):
+    modelo = read_text_csv(CAPES_ORIGINAL)
+    for df, repeticao in sampled_blocks(modelo, round(escala * len(modelo)), rng):
+        df['CD_PROGRAMA_IES'] = with_suffix(df['CD_PROGRAMA_IES'], repeticao, 'S{}')
+        yield df
+
+
+def generate(pasta, escala, semente=0):
+    """Grava os arquivos sintéticos de uma escala em ``pasta``; retorna as linhas de cada um."""
+    rng = np.random.default_rng(semente)
+    pasta.mkdir(parents=True, exist_ok=True)
+    shutil.copy(PASTA_CAPES / 'codigos_capes.csv', pasta / ARQUIVOS['codigos_capes'])
+    shutil.copy(PASTA_MEC / 'dicionario_codigos.csv', pasta / ARQUIVOS['dicionario_graduacao'])
+    return {
+        'capes': write_blocks(capes_rows(escala, rng), pasta / ARQUIVOS['capes'], '\t'),
+        'graduacao': write_blocks(mec_rows('graduacao', graduacao_template(), escala, rng),
+                                  pasta / ARQUIVOS['graduacao'], ','),
+        'especializacao': write_blocks(mec_rows('especializacao', especializacao_template(), escala, rng),
+                                       pasta / ARQUIVOS['especializacao'], ','),
+    }
+
+
+# Etapas, cada uma executada num processo próprio (ver run_stage)
+
+def stage_capes(pasta):
+    from tratamento_dados import filtrar_dados_capes_csv
+    return filtrar_dados_capes_csv(pasta / ARQUIVOS['capes'], pasta / ARQUIVOS['codigos_capes'],
+                                   pasta / 'mestrado_doutorado_univ_publicas.csv')
+
+
+def stage_graduacao(pasta):
+    from tratamento_dados import filtrar_dados_mec_csv
+    return filtrar_dados_mec_csv(pasta / ARQUIVOS['graduacao'], pasta / ARQUIVOS['dicionario_graduacao'],
+                                 pasta / 'graduacao_univ_publicas.csv')
+
+
+def stage_especializacao(pasta):
+    # Inclui a dimensão de instituições; a especialização é filtrada pelas IES da graduação
+    from tratamento_dados import (criar_dataframe_ies_publicas, criar_dimensao_instituicoes,
+                                  filtrar_cursos_especializacao)
+    criar_dimensao_instituicoes(pasta / 'graduacao_univ_publicas.csv', pasta / 'mestrado_doutorado_univ_publicas.csv',
+                                pasta / 'instituicoes.csv')
+    df_ies_publicas = criar_dataframe_ies_publicas(pasta / 'graduacao_univ_publicas.csv')
+    return filtrar_cursos_especializacao(df_ies_publicas, pasta / ARQUIVOS['especializacao'],
+                                         pasta / 'especializacao_univ_publicas.csv')
+
+
+def use_folder(pasta):
+    """Aponta os caminhos de build_sqlite_db e datasets para a pasta sintética."""
+    import build_sqlite_db
+    import datasets
+
+    build_sqlite_db.ROOT = pasta
+    build_sqlite_db.DATA_DIR = pasta / 'data'
+    build_sqlite_db.DB_PATH = build_sqlite_db.DATA_DIR / 'guia.sqlite'
+    build_sqlite_db.GZ_PATH = build_sqlite_db.DATA_DIR / 'guia.sqlite.gz'
+    build_sqlite_db.VERSAO_PATH = build_sqlite_db.DATA_DIR / 'guia.versao.json'
+    build_sqlite_db.HTTP_DIR = build_sqlite_db.DATA_DIR / 'http'
+    build_sqlite_db.PERFIS_PATH = build_sqlite_db.DATA_DIR / 'guia_perfis.sqlite'
+    build_sqlite_db.STATE_PATH = pasta / 'estado_build.sqlite'
+    datasets.SNAPSHOT_DIR = pasta / 'snapshots'
+    datasets.ARQUIVOS_CSV = {nome_base: pasta / csv.name for nome_base, csv in datasets.ARQUIVOS_CSV.items()}
+    return build_sqlite_db, datasets
+
+
+def stage_build(pasta):
+    build_sqlite_db, _ = use_folder(pasta)
+    # As bases sintéticas não têm municípios do IBGE
+    build_sqlite_db.build()
+    with sqlite3.connect(build_sqlite_db.DB_PATH) as conn:
+        return sum(conn.execute(f"SELECT COUNT(*) FROM {nome}").fetchone()[0] for nome in build_sqlite_db.TABELAS)
+
+
+def load_app_bases(datasets):
+    from facet_index import FacetIndex
+
+    bases = {}
+    for nome_base, (colunas, ordem) in INDICES_APP.items():
+        df = datasets.load_dataset(nome_base, datasets.ARQUIVOS_CSV[nome_base])
+        bases[nome_base] = df, FacetIndex(df, colunas, ordem)
+    return bases
+
+
+def stage_app(pasta):
+    _, datasets = use_folder(pasta)
+    shutil.rmtree(datasets.SNAPSHOT_DIR, ignore_errors=True)
+    return sum(len(df) for df, _ in load_app_bases(datasets).values())
+
+
+def percentile(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def latency_ms(funcao, repeticoes):
+    funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {'p50_ms': percentile(tempos, 50) * 1000, 'p95_ms': percentile(tempos, 95) * 1000}
+
+
+def measure_queries(pasta, repeticoes):
+    from filter_spec import FILTROS, compile_bitmap, compile_mask, compile_where
+    from query_service import ORDEM_EXIBICAO
+
+    build_sqlite_db, datasets = use_folder(pasta)
+    bases = load_app_bases(datasets)
+    conn = sqlite3.connect(f"file:{build_sqlite_db.DB_PATH}?mode=ro", uri=True)
+    resultados = {}
+    for nome, (nome_base, selecoes) in CONSULTAS.items():
+        df, facetas = bases[nome_base]
+        tabela = FILTROS[nome_base]['tabela']
+        where, params = compile_where(nome_base, selecoes)
+        ordem = ', '.join(ORDEM_EXIBICAO[tabela] + ['id'])
+
+        def sqlite_page():
+            total = conn.execute(f"SELECT COUNT(*) FROM {tabela} {where}", params).fetchone()[0]
+            conn.execute(f"SELECT * FROM {tabela} {where} ORDER BY {ordem} LIMIT {TAMANHO_PAGINA}", params).fetchall()
+            return total
+
+        linhas = int(compile_mask(df, nome_base, selecoes).sum())
+        assert sqlite_page() == linhas == facetas.count(compile_bitmap(facetas, nome_base, selecoes)), nome
+        resultados[nome] = {
+            'linhas': linhas,
+            'mascara': latency_ms(lambda: np.flatnonzero(compile_mask(df, nome_base, selecoes)), repeticoes),
+            'bitmap': latency_ms(lambda: facetas.ordered_rows(compile_bitmap(facetas, nome_base, selecoes)),
+                                 repeticoes),
+            'sqlite': latency_ms(sqlite_page, repeticoes),
+        }
+    conn.close()
+    return resultados
+
+
+ETAPAS = {
+    'capes': stage_capes,
+    'graduacao': stage_graduacao,
+    'especializacao': stage_especializacao,
+    'build_sqlite': stage_build,
+    'carga_app': stage_app,
+}
+
+
+def peak_rss_mb():
+    # No Linux o ru_maxrss sobrevive ao exec e herdaria o pico do processo pai
+    # (que gerou os dados); o VmHWM é só deste processo
+    with contextlib.suppress(OSError):
+        with open('/proc/self/status') as fh:
+            for linha in fh:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024
+
+
+def run_stage(etapa, pasta, repeticoes):
+    """Executado no processo filho: mede a etapa e imprime o resultado em JSON."""
+    sys.path.insert(0, str(ROOT / 'dados'))
+    import build_sqlite_db  # noqa: F401  (importações fora da medição)
+    import datasets  # noqa: F401
+    import tratamento_dados  # noqa: F401
+
+    resultado = {'rss_inicial_mb': peak_rss_mb()}
+    # As mensagens das etapas vão para stderr: stdout leva só o JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        inicio = time.perf_counter()
+        if etapa == 'consultas':
+            resultado['consultas'] = measure_queries(pasta, repeticoes)
+        else:
+            resultado['linhas_saida'] = ETAPAS[etapa](pasta)
+        resultado['segundos'] = time.perf_counter() - inicio
+    resultado['pico_rss_mb'] = peak_rss_mb()
+    print(json.dumps(resultado))
+
+
+def spawn_stage(etapa, pasta, repeticoes):
+    saida = subprocess.run([sys.executable, __file__, '--etapa', etapa, '--pasta', str(pasta),
+                            '--repeticoes', str(repeticoes)],
+                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+    return json.loads(saida.stdout)
+
+
+def run_scale(escala, repeticoes, semente, pasta_base=None):
+    with tempfile.TemporaryDirectory(dir=pasta_base) as temporaria:
+        pasta = Path(temporaria)
+        inicio = time.perf_counter()
+        linhas = generate(pasta, escala, semente)
+        resultado = {'linhas_geradas': linhas, 'segundos_geracao': time.perf_counter() - inicio, 'etapas': {}}
+        entradas = {'capes': linhas['capes'], 'graduacao': linhas['graduacao'],
+                    'especializacao': linhas['especializacao']}
+        for etapa in ETAPAS:
+            medida = spawn_stage(etapa, pasta, repeticoes)
+            # Build e carga do app leem os CSVs tratados: a entrada é a saída das etapas anteriores
+            linhas_entrada = entradas.get(etapa, medida['linhas_saida'])
+            medida['linhas_por_segundo'] = linhas_entrada / medida['segundos']
+            resultado['etapas'][etapa] = medida
+        consultas = spawn_stage('consultas', pasta, repeticoes)
+        resultado['consultas'] = consultas['consultas']
+        resultado['pico_rss_consultas_mb'] = consultas['pico_rss_mb']
+    return resultado
+
+
+def compare(atual, anterior):
+    """Razão atual/anterior dos tempos das etapas e do p95 das consultas."""
+    print(f"{'escala':>6} {'medida':48} {'razão':>7}")
+    for escala, resultado in atual['escalas'].items():
+        antigo = anterior['escalas'].get(escala)
+        if antigo is None:
+            continue
+        for etapa, medida in resultado['etapas'].items():
+            if etapa in antigo['etapas']:
+                print(f"{escala:>5}× {etapa:48} {medida['segundos'] / antigo['etapas'][etapa]['segundos']:>7.2f}")
+        for nome, medida in resultado['consultas'].items():
+            for caminho in ('mascara', 'bitmap', 'sqlite'):
+                if nome in antigo['consultas']:
+                    razao = medida[caminho]['p95_ms'] / antigo['consultas'][nome][caminho]['p95_ms']
+                    print(f"{escala:>5}× {f'{nome} ({caminho})':48} {razao:>7.2f}")
+
+
+def print_summary(resultado):
+    for escala, r in resultado['escalas'].items():
+        print(f"Escala {escala}×: {r['linhas_geradas']} linhas geradas")
+        print(f"  {'etapa':16} {'segundos':>9} {'pico RSS (MB)':>14} {'linhas/s':>11}")
+        for etapa, m in r['etapas'].items():
+            print(f"  {etapa:16} {m['segundos']:>9.2f} {m['pico_rss_mb']:>14.0f} {m['linhas_por_segundo']:>11.0f}")
+        print(f"  {'consulta (p50/p95 em ms)':34} {'linhas':>7} {'máscara':>13} {'bitmap':>13} {'sqlite':>13}")
+        for nome, m in r['consultas'].items():
+            colunas = ' '.join(f"{m[c]['p50_ms']:>6.2f}/{m[c]['p95_ms']:<6.2f}" for c in ('mascara', 'bitmap', 'sqlite'))
+            print(f"  {nome:34} {m['linhas']:>7} {colunas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10],
+                        help='múltiplos do tamanho atual das bases (padrão: 1 10; 100 leva alguns minutos e uns 4 GB de memória)')
+    parser.add_argument('--repeticoes', type=int, default=50, help='repetições de cada consulta')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--pasta', type=Path, help='onde gravar os dados sintéticos (padrão: pasta temporária)')
+    parser.add_argument('--saida', type=Path, help='grava o resultado em JSON neste arquivo')
+    parser.add_argument('--comparar', type=Path, help='resultado JSON de uma execução anterior')
+    parser.add_argument('--json', action='store_true', help='imprime o resultado em JSON')
+    parser.add_argument('--etapa', choices=[*ETAPAS, 'consultas'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.etapa:
+        run_stage(args.etapa, args.pasta, args.repeticoes)
+        return
+
+    resultado = {
+        'ambiente': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                     'sqlite': sqlite3.sqlite_version, 'cpus': os.cpu_count(), 'sistema': platform.platform()},
+        'semente': args.semente,
+        'repeticoes': args.repeticoes,
+        'escalas': {str(escala): run_scale(escala, args.repeticoes, args.semente, args.pasta)
+                    for escala in args.escalas},
+    }
+    if args.saida:
+        args.saida.write_text(json.dumps(resultado, ensure_ascii=False, indent=2))
+    if args.json:
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    else:
+        print_summary(resultado)
+    if args.comparar:
+        print()
+        compare(resultado, json.loads(args.comparar.read_text()))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,27 +2,152 @@
 Gera um banco SQLite único com as três bases (graduação, especialização e pós).
 
 Uso:
-    python3 build_sqlite_db.py
+    python3 build_sqlite_db.py                # recria o banco do zero
+    python3 build_sqlite_db.py --incremental  # aplica só as linhas que mudaram
+    python3 build_sqlite_db.py --normalizado  # dimensões + fatos (arquivo menor)
+    python3 build_sqlite_db.py --normalizado --http-range [--chunk-kb 1024]
+    python3 build_sqlite_db.py --estrito      # para se faltar alguma entrada
 
-O arquivo resultante é salvo em webapp/public/data/guia.sqlite e pode ser
-publicado diretamente no GitHub Pages.
+O build completo grava num arquivo novo com pragmas de carga em massa (sem
+journal, cache grande, ``PAGE_SIZE`` fixo), tabelas com tipos declarados e
+índices criados depois da carga; em seguida roda ``ANALYZE`` e ``VACUUM``.
+O banco fica em docs/public/data/guia.sqlite e a versão comprimida, que é a
+que o site baixa, em docs/public/data/guia.sqlite.gz. A versão e o esquema
+desse .gz vão para docs/public/data/guia.versao.json, que o site usa como
+chave da cópia guardada no navegador.
+
+No modo incremental cada linha é identificada por uma chave estável
+(codigo_curso/codigo_programa, ou uma chave composta na especialização) e por
+um hash do seu conteúdo. Esse controle fica num banco à parte
+(dados/estado_build.sqlite), para não pesar no arquivo publicado. Só as
+inserções, atualizações e remoções são aplicadas, numa única transação, e
+registradas em ``log_alteracoes``; os índices existentes são mantidos.
+
+No modo normalizado os textos repetidos (instituição, município/UF/região,
+área, modalidade, grau/nível) vão para tabelas ``dim_*`` e as tabelas
+``<tabela>_fatos`` guardam só as chaves inteiras. Views com os nomes e colunas
+de sempre (graduacao, pos, especializacao) mantêm as consultas existentes
+funcionando. Como as views não aceitam escrita, um ``--incremental`` sobre esse
+banco refaz o build completo normalizado.
+
+Com ``--http-range`` o script grava também uma cópia para leitura por HTTP
+Range, sempre no esquema plano: o .gz publicado é o normalizado (menor
+download inteiro), mas por Range as consultas pelas views do normalizado
+baixam mais páginas que pelos índices das tabelas planas.
+
+A tabela ``historico_notas`` guarda a nota de cada programa de pós em cada ano
+de avaliação da CAPES (historico_notas_capes.csv, gerado por
+dados/tratamento_dados.py a partir das partições anuais). Sem esse arquivo,
+ela traz só o ano da base atual.
+
+A tabela ``instituicoes`` tem uma linha por IES, com o código e-MEC
+(``codigo_ies``) e o da CAPES (``codigo_capes_ies``), e as três bases guardam
+o ``id_ies`` dela: cruzar as bases por instituição é uma junção por inteiro
+indexada. Os ids ficam guardados no estado do build (``ids_dimensoes``) e não
+mudam de um build para o outro; eles não entram no hash das linhas, e o
+incremental só religa as linhas cujo id mudou.
+
+A dimensão vem de instituicoes.csv, gerado por dados/tratamento_dados.py. Sem
+esse arquivo o build avisa e monta a dimensão com as IES da pós (pelos códigos
+da CAPES) e as da graduação e da especialização ligadas pelo nome, e a tabela
+``metadados`` registra ``vinculo_ies = 'nome'`` (``'codigo'`` na junção pelos
+códigos). O ``codigo_ies`` dessas linhas vem então da IES a que foram ligadas.
+Com ``--estrito`` o build para em vez de seguir assim.
+
+As tabelas ``perfil_ies`` (chave ``id_ies``) e ``perfil_municipio`` (chave
+``uf`` + ``municipio_chave``, o nome normalizado) trazem os perfis de
+profiles.py: cursos de cada base, mestrados, doutorados, vagas e as contagens
+por grau/nível, modalidade, área e nota da CAPES. O resumo de uma instituição
+ou cidade é a leitura de uma linha pela chave primária. Elas ficam num banco à
+parte, docs/public/data/guia_perfis.sqlite, lido pelo query_service.py: o site
+não as usa, e no guia.sqlite.gz seriam bytes baixados à toa. Em todo build só
+os perfis que mudaram são regravados.
+
+A tabela ``municipios`` tem uma linha por UF + município normalizado, com o
+centróide do arquivo de coordenadas do IBGE (ver geo_index.py), e as três
+bases guardam o ``id_municipio`` dela (estável entre builds, como o
+``id_ies``). A tabela virtual R*Tree
+``municipios_rtree`` indexa esses centróides: "cursos a até N km" é uma busca
+no retângulo em volta do círculo, seguida da distância exata e de uma junção
+pelo ``id_municipio``. O arquivo é baixado por
+``python3 dados/tratamento_dados.py --baixar-coordenadas``. Sem ele o build
+avisa, os municípios ficam sem coordenadas, a R*Tree fica vazia e a tabela
+``metadados`` registra ``coordenadas = 'ausentes'`` (``'ibge'`` com o
+arquivo). Com ``--estrito`` o build para em vez de seguir assim.
 """
 
+import argparse
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import shutil
 import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+from filter_spec import write_spec
+from geo_index import ARQUIVO_COORDENADAS, load_centroids, municipality_keys
+from profiles import build_profiles
+from search_index import normalize
+
 ROOT = Path(__file__).parent
-DATA_DIR = ROOT / "webapp" / "public" / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+DATA_DIR = ROOT / "docs" / "public" / "data"
 DB_PATH = DATA_DIR / "guia.sqlite"
+GZ_PATH = DATA_DIR / "guia.sqlite.gz"
+# Versão do .gz publicado; o site a usa como chave do banco guardado no navegador
+VERSAO_PATH = DATA_DIR / "guia.versao.json"
+STATE_PATH = ROOT / "dados" / "estado_build.sqlite"
+HTTP_DIR = DATA_DIR / "http"
+# Perfis por IES e por município, fora do .gz (só o query_service.py os lê)
+PERFIS_PATH = DATA_DIR / "guia_perfis.sqlite"
+
+# Entre 1 KiB e 64 KiB, páginas de 4 KiB deram o menor .gz: páginas maiores
+# deixam mais espaço livre no fim de cada folha da B-tree
+PAGE_SIZE = 4096
+
+# Busca textual (FTS5): sem acento e sem caixa ("ciencias" acha "CIÊNCIAS").
+# Buscas por prefixo ("eng*") funcionam sem índice de prefixo, percorrendo o
+# intervalo de termos do índice, o que é instantâneo nestas bases; um índice
+# prefix='2 3' aumentaria o .gz em ~340 KB. Para ativá-lo, informe os
+# tamanhos aqui (ex.: "2 3").
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+FTS_PREFIXOS = ""
+
+# Cópia para leitura por HTTP Range: o cliente (ex.: sql.js-httpvfs) pede
+# blocos do tamanho da página, e páginas de 1 KiB trazem menos bytes que não
+# serão usados a cada consulta
+HTTP_PAGE_SIZE = 1024
+HTTP_SUFIXO = 3  # guia.sqlite.000, guia.sqlite.001, ...
+
+# Pragmas da carga em massa; o arquivo temporário só vira o banco definitivo
+# depois de completo, então não há o que proteger com journal ou fsync
+PRAGMAS_CARGA = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -262144,  # 256 MiB
+    "temp_store": "MEMORY",
+    "locking_mode": "EXCLUSIVE",
+}
+
+# No --incremental, ANALYZE numa tabela só quando mudou mais que esta fração
+# das linhas, e VACUUM só quando as páginas livres passam desta fração do
+# arquivo; abaixo disso as estatísticas e o .gz quase não mudam
+FRACAO_ANALYZE = 0.1
+FRACAO_VACUUM = 0.1
 
 
 def load_graduacao():
     df = pd.read_csv(ROOT / "graduacao_univ_publicas.csv", sep="\t")
     df = df.rename(
         columns={
+            "Código da Instituição de Educação Superior (IES)": "codigo_ies",
             "Nome da IES": "nome_ies",
             "Categoria da IES": "categoria_ies",
             "Organização acadêmica": "organizacao_academica",
@@ -85,6 +210,7 @@ def load_especializacao():
     df = pd.read_csv(ROOT / "especializacao_univ_publicas.csv", sep="\t")
     df = df.rename(
         columns={
+            "CODIGO_IES": "codigo_ies",
             "NOME_IES": "nome_ies",
             "NOME_ESPECIALIZACAO": "nome_especializacao",
             "Area_Conhecimento": "area_conhecimento",
@@ -102,60 +228,1148 @@ def load_especializacao():
     return df
 
 
-def write_table(conn, name, df, indexes):
-    df.to_sql(name, conn, if_exists="replace", index=False)
-    for idx_name, cols in indexes.items():
-        joined = ",".join(cols)
-        conn.execute(f"CREATE INDEX IF NOT EXISTS {idx_name} ON {name}({joined});")
-
 
-def build():
-    conn = sqlite3.connect(DB_PATH)
 
-    graduacao = load_graduacao()
-    pos = load_pos()
-    especializacao = load_especializacao()
-
-    write_table(
-        conn,
-        "graduacao",
-        graduacao,
-        {
+TABELAS = {
+    "graduacao": {
+        "load": load_graduacao,
+        "colunas": {
+            "id_ies": "INTEGER",
+            "codigo_ies": "INTEGER",
+            "nome_ies": "TEXT",
+            "categoria_ies": "TEXT",
+            "organizacao_academica": "TEXT",
+            "codigo_curso": "INTEGER",
+            "nome_curso": "TEXT",
+            "grau": "TEXT",
+            "area_conhecimento": "TEXT",
+            "modalidade": "TEXT",
+            "situacao": "TEXT",
+            "vagas_autorizadas": "INTEGER",
+            "id_municipio": "INTEGER",
+            "municipio": "TEXT",
+            "uf": "TEXT",
+            "regiao": "TEXT",
+        },
+        # O mesmo curso pode ser ofertado em mais de um município
+        "chave": ["codigo_curso", "municipio"],
+        "ordem": ["uf", "area_conhecimento", "grau", "nome_curso"],
+        "texto": ["nome_curso", "nome_ies", "area_conhecimento"],
+        "facetas": ["nome_curso", "area_conhecimento", "nome_ies", "uf", "municipio", "grau", "modalidade"],
+        "faixas": ["vagas_autorizadas"],
+        "dimensoes": {
+            "dim_ies": ["nome_ies"],
+            "dim_municipio": ["municipio", "uf", "regiao"],
+            "dim_area": ["area_conhecimento"],
+            "dim_modalidade": ["modalidade"],
+            "dim_grau": ["grau"],
+        },
+        "indexes": {
             "idx_graduacao_uf": ["uf"],
             "idx_graduacao_municipio": ["municipio"],
             "idx_graduacao_area": ["area_conhecimento"],
             "idx_graduacao_nome_ies": ["nome_ies"],
             "idx_graduacao_nome_curso": ["nome_curso"],
+            "idx_graduacao_ies": ["id_ies"],
+            "idx_graduacao_id_municipio": ["id_municipio"],
         },
-    )
-    write_table(
-        conn,
-        "pos",
-        pos,
-        {
+    },
+    "pos": {
+        "load": load_pos,
+        "colunas": {
+            "ano_referencia": "INTEGER",
+            "grande_area": "TEXT",
+            "area_conhecimento": "TEXT",
+            "area_basica": "TEXT",
+            "subarea": "TEXT",
+            "especialidade": "TEXT",
+            "codigo_area_avaliacao": "INTEGER",
+            "area_avaliacao": "TEXT",
+            "id_ies": "INTEGER",
+            "codigo_capes_ies": "INTEGER",
+            "codigo_emec_ies": "TEXT",
+            "sigla_ies": "TEXT",
+            "nome_ies": "TEXT",
+            "indicador_rede": "TEXT",
+            "siglas_rede": "TEXT",
+            "status_juridico": "TEXT",
+            "dependencia": "TEXT",
+            "organizacao_academica": "TEXT",
+            "regiao": "TEXT",
+            "uf": "TEXT",
+            "id_municipio": "INTEGER",
+            "municipio": "TEXT",
+            "modalidade": "TEXT",
+            "codigo_programa": "TEXT",
+            "nome_programa": "TEXT",
+            "nome_programa_en": "TEXT",
+            "nivel_programa": "TEXT",
+            "nota_conceito": "TEXT",
+            "ano_inicio_programa": "INTEGER",
+            "ano_inicio_curso": "TEXT",
+            "situacao_programa": "TEXT",
+            "link": "TEXT",
+        },
+        "chave": ["codigo_programa"],
+        "ordem": ["uf", "area_conhecimento", "nivel_programa", "nome_programa"],
+        "texto": ["nome_programa", "nome_ies", "sigla_ies", "area_conhecimento"],
+        "facetas": ["nome_programa", "nivel_programa", "area_conhecimento", "nota_conceito", "modalidade", "uf",
+                    "municipio", "sigla_ies", "nome_ies"],
+        "faixas": [],
+        "dimensoes": {
+            "dim_ies": ["nome_ies"],
+            "dim_municipio": ["municipio", "uf", "regiao"],
+            "dim_area": ["area_conhecimento"],
+            "dim_modalidade": ["modalidade"],
+            "dim_grau": ["nivel_programa"],
+        },
+        "indexes": {
             "idx_pos_uf": ["uf"],
             "idx_pos_municipio": ["municipio"],
             "idx_pos_area": ["area_conhecimento"],
             "idx_pos_sigla": ["sigla_ies"],
             "idx_pos_nivel": ["nivel_programa"],
+            "idx_pos_ies": ["id_ies"],
+            "idx_pos_id_municipio": ["id_municipio"],
         },
-    )
-    write_table(
-        conn,
-        "especializacao",
-        especializacao,
-        {
+    },
+    "especializacao": {
+        "load": load_especializacao,
+        "colunas": {
+            "id_ies": "INTEGER",
+            "codigo_ies": "INTEGER",
+            "nome_ies": "TEXT",
+            "nome_especializacao": "TEXT",
+            "area_conhecimento": "TEXT",
+            "carga_horaria": "INTEGER",
+            "duracao_meses": "INTEGER",
+            "modalidade": "TEXT",
+            "vagas": "INTEGER",
+            "id_municipio": "INTEGER",
+            "municipio": "TEXT",
+            "uf": "TEXT",
+            "regiao": "TEXT",
+            "situacao": "TEXT",
+            "categoria_ies": "TEXT",
+        },
+        # A base de especialização não traz código do curso
+        "chave": ["nome_ies", "nome_especializacao", "municipio", "uf", "modalidade", "carga_horaria", "duracao_meses"],
+        "ordem": ["uf", "area_conhecimento", "modalidade", "nome_especializacao"],
+        "texto": ["nome_especializacao", "nome_ies", "area_conhecimento"],
+        "facetas": ["nome_especializacao", "area_conhecimento", "nome_ies", "modalidade", "uf", "municipio"],
+        "faixas": ["carga_horaria", "duracao_meses"],
+        "dimensoes": {
+            "dim_ies": ["nome_ies"],
+            "dim_municipio": ["municipio", "uf", "regiao"],
+            "dim_area": ["area_conhecimento"],
+            "dim_modalidade": ["modalidade"],
+        },
+        "indexes": {
             "idx_especializacao_uf": ["uf"],
             "idx_especializacao_municipio": ["municipio"],
             "idx_especializacao_area": ["area_conhecimento"],
             "idx_especializacao_modalidade": ["modalidade"],
+            "idx_especializacao_ies": ["id_ies"],
+            "idx_especializacao_id_municipio": ["id_municipio"],
         },
+    },
+}
+
+
+def load_historico_notas(pos):
+    """Nota/conceito de cada programa por ano, uma linha por (codigo_programa, ano)."""
+    arquivo = ROOT / "historico_notas_capes.csv"
+    if arquivo.exists():
+        df = pd.read_csv(arquivo, sep="\t", dtype={"codigo_programa": str, "ano": "int64", "nota_conceito": str})
+    else:
+        df = pos[["codigo_programa", "ano_referencia", "nota_conceito"]].rename(columns={"ano_referencia": "ano"})
+    df = df.drop_duplicates(["codigo_programa", "ano"], keep="last")
+    return df.sort_values(["codigo_programa", "ano"]).reset_index(drop=True)
+
+
+# Esfera da IES no status jurídico da CAPES, na categoria usada pelo MEC
+CATEGORIAS_CAPES = {"FEDERAL": "Pública Federal", "ESTADUAL": "Pública Estadual", "MUNICIPAL": "Pública Municipal"}
+
+
+def load_instituicoes(bases, estrito=False):
+    """Dimensão de instituições, uma linha por IES, com ``id_ies`` estável entre builds.
+
+    Vem de instituicoes.csv. Sem ele, a dimensão é montada pelos códigos da pós
+    e pelos nomes das IES da graduação e da especialização, ou
+    ``FileNotFoundError`` com ``estrito``.
+    """
+    arquivo = ROOT / "instituicoes.csv"
+    if arquivo.exists():
+        df = pd.read_csv(arquivo, sep="\t", dtype={"codigo_ies": "Int64", "codigo_capes_ies": "Int64"})
+    elif estrito:
+        raise FileNotFoundError(f"{arquivo} não existe: gere-o com python3 dados/tratamento_dados.py")
+    else:
+        # CSVs tratados antes de o CODIGO_IES ser mantido: só a pós tem códigos
+        print(f"Aviso: {arquivo.name} não existe; graduação e especialização ligadas às IES pelo nome "
+              "(vinculo_ies = 'nome'). Gere-o com python3 dados/tratamento_dados.py")
+        pos = bases["pos"]
+        df = pd.DataFrame({
+            "codigo_ies": pd.to_numeric(pos["codigo_emec_ies"], errors="coerce").astype("Int64"),
+            "codigo_capes_ies": pos["codigo_capes_ies"].astype("Int64"),
+            "sigla_ies": pos["sigla_ies"],
+            "nome_ies": pos["nome_ies"],
+            "categoria_ies": pos["status_juridico"].map(CATEGORIAS_CAPES),
+            "organizacao_academica": pos["organizacao_academica"],
+        }).drop_duplicates("codigo_capes_ies")
+        mec = pd.concat([bases["graduacao"][["nome_ies", "categoria_ies", "organizacao_academica"]],
+                         bases["especializacao"][["nome_ies", "categoria_ies"]]]).drop_duplicates("nome_ies")
+        conhecidas = set(df["nome_ies"].map(normalize))
+        mec = mec[~mec["nome_ies"].map(normalize).isin(conhecidas)]
+        df = pd.concat([df, mec], ignore_index=True)
+    # Ids novos em ordem previsível: pelo código e-MEC, depois o da CAPES e o
+    # nome, sem código por último. As IES já vistas mantêm o id de antes
+    df = df.sort_values(["codigo_ies", "codigo_capes_ies", "nome_ies"], na_position="last", kind="stable")
+    df.insert(0, "id_ies", stable_ids("instituicoes", institution_keys(df)))
+    df = df.reset_index(drop=True)[
+        ["id_ies", "codigo_ies", "codigo_capes_ies", "sigla_ies", "nome_ies", "categoria_ies", "organizacao_academica"]]
+    # Como as linhas foram ligadas às IES; vai para a tabela metadados
+    df.attrs["vinculo_ies"] = "codigo" if arquivo.exists() else "nome"
+    return df
+
+
+def institution_keys(df):
+    """Chave natural de cada IES: código e-MEC, senão o da CAPES, senão o nome."""
+    return np.where(df["codigo_ies"].notna(), "emec:" + df["codigo_ies"].astype("string"),
+                    np.where(df["codigo_capes_ies"].notna(), "capes:" + df["codigo_capes_ies"].astype("string"),
+                             "nome:" + df["nome_ies"].astype("string"))).tolist()
+
+
+def institution_ids(df, instituicoes):
+    """``id_ies`` de cada linha: pelos códigos e-MEC ou da CAPES e, sem eles, pelo nome."""
+    ids = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    for coluna in ("codigo_capes_ies", "codigo_ies"):
+        if coluna in df.columns:
+            lookup = instituicoes.dropna(subset=[coluna]).drop_duplicates(coluna).set_index(coluna)["id_ies"]
+            ids = ids.fillna(pd.to_numeric(df[coluna], errors="coerce").map(lookup).astype("Int64"))
+    faltando = ids.isna()
+    if faltando.any():
+        por_nome = dict(zip(instituicoes["nome_ies"].map(normalize), instituicoes["id_ies"]))
+        nomes = df.loc[faltando, "nome_ies"]
+        chaves = {nome: por_nome.get(normalize(nome)) for nome in nomes.dropna().unique()}
+        ids[faltando] = nomes.map(chaves).astype("Int64")
+    return ids
+
+
+def load_municipios(bases, centroides):
+    """Dimensão de municípios, uma linha por UF + nome normalizado, com ``id_municipio`` estável (``stable_ids``).
+
+    ``latitude`` e ``longitude`` vêm dos ``centroides`` (geo_index.load_centroids)
+    e ficam vazias para os municípios fora do arquivo ou sem ele.
+    """
+    nomes = pd.concat([pd.DataFrame({"chave": municipality_keys(df["uf"], df["municipio"]).to_numpy(),
+                                     "municipio": df["municipio"].to_numpy()}) for df in bases.values()])
+    # Nome para exibir: o do IBGE e, fora dele, o primeiro encontrado (graduação, pós, especialização)
+    df = nomes.dropna().drop_duplicates("chave").sort_values("chave").reset_index(drop=True)
+    partes = df["chave"].str.split("|", n=1, expand=True)
+    df.insert(0, "municipio_chave", partes[1])
+    df.insert(0, "uf", partes[0])
+    df.insert(0, "id_municipio", stable_ids("municipios", df["chave"].tolist()))
+    if centroides is not None:
+        coordenadas = centroides.reindex(df["chave"])
+        df["municipio"] = coordenadas["nome"].fillna(df.set_index("chave")["municipio"]).to_numpy()
+        df["latitude"] = coordenadas["latitude"].to_numpy()
+        df["longitude"] = coordenadas["longitude"].to_numpy()
+    else:
+        df["latitude"] = df["longitude"] = np.nan
+    df = df.drop(columns="chave")
+    df.attrs["coordenadas"] = "ibge" if centroides is not None else "ausentes"
+    return df
+
+
+def municipality_ids(df, municipios):
+    """``id_municipio`` de cada linha, pela UF e pelo nome normalizado."""
+    lookup = pd.Series(municipios["id_municipio"].to_numpy(),
+                       index=municipios["uf"] + "|" + municipios["municipio_chave"])
+    return municipality_keys(df["uf"], df["municipio"]).map(lookup).astype("Int64")
+
+
+# Número de faixas do histograma de cada coluna numérica em ``faixas``
+FAIXAS_HISTOGRAMA = 10
+
+# Dimensões do modo --normalizado: colunas de cada uma. Em "dimensoes" cada
+# tabela diz quais colunas suas correspondem a essas (na mesma ordem); o pos
+# guarda o nível do programa em dim_grau.
+DIMENSOES = {
+    "dim_ies": ["nome_ies"],
+    "dim_municipio": ["municipio", "uf", "regiao"],
+    "dim_area": ["area_conhecimento"],
+    "dim_modalidade": ["modalidade"],
+    "dim_grau": ["grau"],
+}
+
+
+def create_control_tables(conn, schema="estado"):
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.controle_linhas (
+            tabela TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            hash INTEGER NOT NULL,
+            row_id INTEGER NOT NULL,
+            PRIMARY KEY (tabela, chave)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.ids_dimensoes (
+            dimensao TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (dimensao, chave)
+        ) WITHOUT ROWID
+        """
     )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.builds (
+            build_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            executado_em TEXT NOT NULL,
+            modo TEXT NOT NULL,
+            versao TEXT NOT NULL,
+            insercoes INTEGER NOT NULL,
+            atualizacoes INTEGER NOT NULL,
+            remocoes INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema}.log_alteracoes (
+            build_id INTEGER NOT NULL REFERENCES builds(build_id),
+            tabela TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            operacao TEXT NOT NULL CHECK (operacao IN ('insert', 'update', 'delete'))
+        )
+        """
+    )
+
+
+def stable_ids(dimensao, chaves):
+    """Ids inteiros de ``chaves`` (naturais) que se mantêm de um build para o outro.
+
+    Os ids já atribuídos ficam em ``ids_dimensoes`` de dados/estado_build.sqlite;
+    chaves novas ganham os próximos, na ordem recebida, e os de chaves que
+    sumiram não são reaproveitados. Sem o arquivo, os ids são 1..n.
+    """
+    conn = sqlite3.connect(STATE_PATH)
+    try:
+        create_control_tables(conn, schema="main")
+        atuais = dict(conn.execute("SELECT chave, id FROM ids_dimensoes WHERE dimensao = ?", (dimensao,)))
+        novas = [chave for chave in dict.fromkeys(chaves) if chave not in atuais]
+        inicio = max(atuais.values(), default=0) + 1
+        atuais.update(zip(novas, range(inicio, inicio + len(novas))))
+        conn.executemany("INSERT INTO ids_dimensoes (dimensao, chave, id) VALUES (?, ?, ?)",
+                         ((dimensao, chave, atuais[chave]) for chave in novas))
+        conn.commit()
+    finally:
+        conn.close()
+    return np.array([atuais[chave] for chave in chaves], dtype=np.int64)
+
+
+def row_keys(df, columns):
+    """Chave estável de cada linha; repetições da mesma chave ganham um ordinal."""
+    parts = df[columns].astype(object).where(df[columns].notna(), None)
+    ordinal = df.groupby(columns, dropna=False, sort=False).cumcount()
+    return [json.dumps(list(values) + [int(n)], ensure_ascii=False, default=str)
+            for values, n in zip(parts.itertuples(index=False, name=None), ordinal)]
+
+
+# Chaves das dimensões guardadas nas linhas: ficam fora do hash de conteúdo e
+# são conferidas à parte no incremental (ver relink_rows)
+IDS_SUBSTITUTOS = ["id_ies", "id_municipio"]
+
+
+def row_hashes(df):
+    """Hash de 64 bits do conteúdo de cada linha (determinístico entre execuções)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy().view(np.int64)
+
+
+def content_hashes(df):
+    """``row_hashes`` sem as chaves das dimensões: trocar o id de uma IES ou de um município não muda as linhas."""
+    return row_hashes(df.drop(columns=IDS_SUBSTITUTOS, errors="ignore"))
+
+
+def sql_rows(df):
+    columns = []
+    for _, serie in df.items():
+        if serie.hasnans:
+            serie = serie.astype(object).where(serie.notna(), None)
+        columns.append(serie.tolist())
+    return list(zip(*columns))
+
+
+def schema_version(normalizado, vinculo_ies, coordenadas):
+    """Impressão digital do esquema gravado: tabelas, colunas, índices, FTS e o código que as cria.
+
+    Entra na versão junto com os dados; assim, mudar só o esquema (uma coluna,
+    um índice, o formato normalizado) também troca a versão e o ETag do .gz.
+    """
+    declarado = {
+        "tabelas": {name: {k: v for k, v in cfg.items() if k != "load"} for name, cfg in TABELAS.items()},
+        "dimensoes": DIMENSOES,
+        "fts": [FTS_TOKENIZER, FTS_PREFIXOS],
+        "page_size": PAGE_SIZE,
+        "esquema": "normalizado" if normalizado else "plano",
+        "vinculo_ies": vinculo_ies,
+        "coordenadas": coordenadas,
+    }
+    digest = hashlib.sha256(json.dumps(declarado, sort_keys=True).encode())
+    for funcao in (create_table, create_indexes, create_fts, fact_columns, write_normalized, write_facets,
+                   write_history, write_institutions, write_municipalities, write_metadata):
+        digest.update(inspect.getsource(funcao).encode())
+    return digest.hexdigest()
+
+
+def data_version(hashes_by_table, esquema):
+    digest = hashlib.sha256(esquema.encode())
+    for name in sorted(hashes_by_table):
+        digest.update(name.encode())
+        digest.update(np.sort(hashes_by_table[name]).tobytes())
+    return digest.hexdigest()
+
+
+def load_frames(estrito=False):
+    """Lê as três bases com as colunas na ordem declarada e as linhas em ``ordem``.
+
+    Linhas vizinhas com os mesmos textos (UF, área, grau) ficam nas mesmas
+    páginas, o que deixa o .gz bem menor que na ordem original dos CSVs.
+    Devolve também as dimensões de instituições e de municípios, às quais as
+    linhas são ligadas. Sem o arquivo de coordenadas os municípios ficam sem
+    centróide, ou ``FileNotFoundError`` com ``estrito``.
+    """
+    bases = {name: cfg["load"]() for name, cfg in TABELAS.items()}
+    instituicoes = load_instituicoes(bases, estrito)
+    centroides = load_centroids()
+    if centroides is None and estrito:
+        raise FileNotFoundError(
+            f"{ARQUIVO_COORDENADAS} não existe: baixe-o com python3 dados/tratamento_dados.py --baixar-coordenadas")
+    if centroides is None:
+        print(f"Aviso: {ARQUIVO_COORDENADAS.name} não existe; municípios sem coordenadas, R*Tree vazia e sem "
+              "buscas por distância (coordenadas = 'ausentes'). Baixe-o com "
+              "python3 dados/tratamento_dados.py --baixar-coordenadas")
+    municipios = load_municipios(bases, centroides)
+    frames = {}
+    for name, cfg in TABELAS.items():
+        df = bases[name].assign(id_ies=institution_ids(bases[name], instituicoes),
+                                id_municipio=municipality_ids(bases[name], municipios))
+        # Colunas ausentes no CSV (o codigo_ies das bases antigas do MEC) ficam vazias
+        df = df.reindex(columns=list(cfg["colunas"]))
+        if "codigo_ies" in df.columns:
+            # Sem o CODIGO_IES no CSV, o código e-MEC vem da IES ligada pelo nome (a CAPES o informa)
+            codigos = df["id_ies"].map(instituicoes.set_index("id_ies")["codigo_ies"])
+            df["codigo_ies"] = pd.to_numeric(df["codigo_ies"], errors="coerce").astype("Int64").fillna(codigos)
+        frames[name] = df.sort_values(cfg["ordem"], kind="stable").reset_index(drop=True)
+    return frames, instituicoes, municipios
+
+
+def create_table(conn, name, colunas):
+    # "id" é apelido do rowid: os ids sobrevivem ao VACUUM e o controle
+    # incremental pode continuar apontando para eles
+    definitions = ",\n    ".join(f'"{col}" {tipo}' for col, tipo in colunas.items())
+    conn.execute(f"CREATE TABLE {name} (\n    id INTEGER PRIMARY KEY,\n    {definitions}\n)")
+
+
+def create_indexes(conn, name, indexes):
+    for idx_name, cols in indexes.items():
+        joined = ",".join(cols)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {idx_name} ON {name}({joined});")
+
+
+def insert_rows(conn, name, df):
+    quoted = ", ".join(f'"{c}"' for c in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    conn.executemany(f"INSERT INTO {name} (id, {quoted}) VALUES (?, {placeholders})",
+                     ((i + 1,) + row for i, row in enumerate(sql_rows(df))))
+
+
+def create_fts(conn, name, colunas, gatilhos=True):
+    """Tabela FTS5 de conteúdo externo sobre ``colunas``, ligada pelo id.
+
+    O texto não é duplicado: a tabela FTS guarda só o índice e lê o conteúdo
+    da tabela base (ou da view, no modo normalizado). Os gatilhos mantêm o
+    índice em dia no modo incremental.
+    """
+    fts = f"{name}_fts"
+    cols = ", ".join(colunas)
+    new_cols = ", ".join(f"new.{c}" for c in colunas)
+    old_cols = ", ".join(f"old.{c}" for c in colunas)
+    # columnsize=0: o bm25() recalcula o tamanho de cada texto quando precisa,
+    # em vez de guardar mais uma tabela no arquivo
+    opcoes = f"content='{name}', content_rowid='id', tokenize='{FTS_TOKENIZER}', columnsize=0"
+    if FTS_PREFIXOS:
+        opcoes += f", prefix='{FTS_PREFIXOS}'"
+    conn.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, {opcoes})")
+    conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+    if not gatilhos:
+        return
+    conn.execute(
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {name} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_cols}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_cols}); END"
+    )
+
 
-    conn.commit()
-    conn.close()
-    print(f"Base SQLite gerada em {DB_PATH}")
+def dimension_values(frames):
+    """Ids das dimensões: cada tupla distinta (nas três bases) ganha um inteiro."""
+    valores = {dim: set() for dim in DIMENSOES}
+    for name, cfg in TABELAS.items():
+        for dim, cols in cfg["dimensoes"].items():
+            valores[dim].update(sql_rows(frames[name][cols]))
+    # Nulos por último; a ordem alfabética deixa os ids previsíveis
+    chave = lambda tupla: tuple((v is None, "" if v is None else v) for v in tupla)  # noqa: E731
+    return {dim: {tupla: i + 1 for i, tupla in enumerate(sorted(tuplas, key=chave))}
+            for dim, tuplas in valores.items()}
+
+
+def fact_columns(name):
+    """Colunas da tabela de fatos: chaves das dimensões e o que sobrou da base."""
+    cfg = TABELAS[name]
+    cobertas = {col for cols in cfg["dimensoes"].values() for col in cols}
+    colunas = {f"{dim[4:]}_id": f"INTEGER NOT NULL REFERENCES {dim}(id)" for dim in cfg["dimensoes"]}
+    colunas.update({col: tipo for col, tipo in cfg["colunas"].items() if col not in cobertas})
+    return colunas
+
+
+def write_normalized(conn, frames):
+    """Dimensões + tabelas ``<tabela>_fatos`` + views com os nomes de sempre."""
+    ids = dimension_values(frames)
+    for dim, lookup in ids.items():
+        definitions = ", ".join(f'"{col}" TEXT' for col in DIMENSOES[dim])
+        conn.execute(f"CREATE TABLE {dim} (id INTEGER PRIMARY KEY, {definitions})")
+        placeholders = ", ".join("?" for _ in DIMENSOES[dim])
+        conn.executemany(f"INSERT INTO {dim} VALUES (?, {placeholders})",
+                         ((i,) + tupla for tupla, i in lookup.items()))
+
+    for name, cfg in TABELAS.items():
+        df = frames[name]
+        colunas = fact_columns(name)
+        fatos = pd.DataFrame(index=df.index)
+        for dim, cols in cfg["dimensoes"].items():
+            fatos[f"{dim[4:]}_id"] = [ids[dim][tupla] for tupla in sql_rows(df[cols])]
+        fatos = pd.concat([fatos, df[[c for c in colunas if c in df.columns]]], axis=1)
+        create_table(conn, f"{name}_fatos", colunas)
+        insert_rows(conn, f"{name}_fatos", fatos)
+
+        # A view devolve as colunas na ordem e com os nomes da tabela plana
+        origem = {}
+        joins = []
+        for dim, cols in cfg["dimensoes"].items():
+            joins.append(f"JOIN {dim} ON {dim}.id = f.{dim[4:]}_id")
+            for col_dim, col in zip(DIMENSOES[dim], cols):
+                origem[col] = f"{dim}.{col_dim}"
+        selecao = ", ".join(f"{origem.get(col, 'f.' + col)} AS {col}" for col in cfg["colunas"])
+        conn.execute(f"CREATE VIEW {name} AS SELECT f.id AS id, {selecao} FROM {name}_fatos f {' '.join(joins)}")
+
+        # Índices sobre colunas que foram para uma dimensão passam a ser sobre
+        # a chave dessa dimensão na tabela de fatos
+        dimensao_da_coluna = {col: f"{dim[4:]}_id" for dim, cols in cfg["dimensoes"].items() for col in cols}
+        indexados = set()
+        for idx_name, cols in cfg["indexes"].items():
+            cols = [dimensao_da_coluna.get(col, col) for col in cols]
+            if tuple(cols) not in indexados:
+                indexados.add(tuple(cols))
+                create_indexes(conn, f"{name}_fatos", {idx_name: cols})
+        # A view não aceita gatilhos; o modo normalizado não tem incremental
+        create_fts(conn, name, cfg["texto"], gatilhos=False)
+
+
+def write_facets(conn, frames, tabelas=None):
+    """Tabelas ``facetas`` e ``faixas``: opções e limites dos filtros prontos.
+
+    ``facetas`` tem, para cada coluna filtrável, os valores distintos (sem
+    nulos nem vazios) na ordem do ``ORDER BY`` do SQLite e quantas linhas têm
+    cada um; ``faixas`` tem mínimo, máximo e um histograma das colunas
+    numéricas. O site preenche os filtros com uma leitura dessas tabelas em vez
+    de um ``SELECT DISTINCT`` por coluna.
+
+    Só as bases em ``tabelas`` (padrão: todas) são recalculadas, e só as linhas
+    que mudaram são regravadas. Retorna (gravadas, removidas).
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS facetas (
+            tabela TEXT NOT NULL,
+            coluna TEXT NOT NULL,
+            ordem INTEGER NOT NULL,
+            valor TEXT NOT NULL,
+            contagem INTEGER NOT NULL,
+            PRIMARY KEY (tabela, coluna, ordem)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS faixas (
+            tabela TEXT NOT NULL,
+            coluna TEXT NOT NULL,
+            minimo INTEGER NOT NULL,
+            maximo INTEGER NOT NULL,
+            histograma TEXT NOT NULL,
+            PRIMARY KEY (tabela, coluna)
+        ) WITHOUT ROWID
+        """
+    )
+    tabelas = list(TABELAS) if tabelas is None else list(tabelas)
+    facetas, faixas = [], []
+    for name in tabelas:
+        df = frames[name]
+        for coluna in TABELAS[name]["facetas"]:
+            contagens = df[coluna][df[coluna].notna() & (df[coluna] != "")].value_counts()
+            # sorted() compara por código Unicode, igual à ordem BINARY do SQLite
+            valores = sorted(contagens.index)
+            facetas.extend((name, coluna, ordem, valor, int(contagens[valor])) for ordem, valor in enumerate(valores))
+        for coluna in TABELAS[name]["faixas"]:
+            serie = df[coluna].dropna()
+            if serie.empty:
+                continue
+            contagens, limites = np.histogram(serie, bins=FAIXAS_HISTOGRAMA)
+            histograma = [[float(de), float(ate), int(n)]
+                          for de, ate, n in zip(limites[:-1], limites[1:], contagens)]
+            faixas.append((name, coluna, int(serie.min()), int(serie.max()), json.dumps(histograma)))
+
+    # Só as linhas das bases recalculadas entram na comparação
+    onde = "WHERE tabela IN (SELECT value FROM json_each(?))"
+    gravadas_f, removidas_f = sync_rows(conn, "facetas", ["tabela", "coluna", "ordem", "valor", "contagem"], 3,
+                                        facetas, onde, (json.dumps(tabelas),))
+    gravadas_h, removidas_h = sync_rows(conn, "faixas", ["tabela", "coluna", "minimo", "maximo", "histograma"], 2,
+                                        faixas, onde, (json.dumps(tabelas),))
+    return gravadas_f + gravadas_h, removidas_f + removidas_h
+
+
+def write_history(conn, historico):
+    # Sem rowid: a chave (programa, ano) é a própria tabela, sem índice à parte
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS historico_notas (
+            codigo_programa TEXT NOT NULL,
+            ano INTEGER NOT NULL,
+            nota_conceito TEXT,
+            PRIMARY KEY (codigo_programa, ano)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute("DELETE FROM historico_notas")
+    conn.executemany("INSERT INTO historico_notas VALUES (?, ?, ?)", sql_rows(historico))
+
+
+def write_institutions(conn, instituicoes):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS instituicoes (
+            id_ies INTEGER PRIMARY KEY,
+            codigo_ies INTEGER,
+            codigo_capes_ies INTEGER,
+            sigla_ies TEXT,
+            nome_ies TEXT NOT NULL,
+            categoria_ies TEXT,
+            organizacao_academica TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_instituicoes_codigo_ies ON instituicoes(codigo_ies)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_instituicoes_codigo_capes ON instituicoes(codigo_capes_ies)")
+    conn.execute("DELETE FROM instituicoes")
+    conn.executemany("INSERT INTO instituicoes VALUES (?, ?, ?, ?, ?, ?, ?)", sql_rows(instituicoes))
+
+
+def write_municipalities(conn, municipios):
+    """Tabela ``municipios`` e a R*Tree ``municipios_rtree`` sobre os centróides conhecidos."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS municipios (
+            id_municipio INTEGER PRIMARY KEY,
+            uf TEXT NOT NULL,
+            municipio_chave TEXT NOT NULL,
+            municipio TEXT NOT NULL,
+            latitude REAL,
+            longitude REAL
+        )
+        """
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_municipios_chave ON municipios(uf, municipio_chave)")
+    # Cada centróide é um retângulo de tamanho zero; a R*Tree guarda float32
+    # arredondado para fora, e a distância exata sai da tabela municipios
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS municipios_rtree "
+                 "USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+    conn.execute("DELETE FROM municipios")
+    conn.execute("DELETE FROM municipios_rtree")
+    conn.executemany("INSERT INTO municipios VALUES (?, ?, ?, ?, ?, ?)", sql_rows(municipios))
+    conn.execute("INSERT INTO municipios_rtree SELECT id_municipio, latitude, latitude, longitude, longitude "
+                 "FROM municipios WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+
+
+def load_profiles(frames, instituicoes):
+    """Tabelas de perfis: por instituição (com nome e sigla da dimensão) e por município."""
+    bases = {"graduacao": frames["graduacao"], "especializacao": frames["especializacao"],
+             "mestrado_doutorado": frames["pos"]}
+    ies = build_profiles(bases, "sqlite", "ies")
+    ies.index = ies.index.astype("int64")
+    ies = instituicoes.set_index("id_ies")[["nome_ies", "sigla_ies"]].join(ies, how="inner")
+    municipios = build_profiles(bases, "sqlite", "municipio").rename(columns={"nome": "municipio"})
+    partes = municipios.index.to_series().str.split("|", n=1, expand=True)
+    municipios.insert(0, "municipio_chave", partes[1])
+    municipios.insert(0, "uf", partes[0])
+    return {
+        "perfil_ies": ies.rename_axis("id_ies").reset_index(),
+        "perfil_municipio": municipios.reset_index(drop=True),
+    }
+
+
+# Colunas da chave primária de cada tabela de perfis (as primeiras do DataFrame)
+CHAVES_PERFIS = {"perfil_ies": ["id_ies"], "perfil_municipio": ["uf", "municipio_chave"]}
+
+
+def write_profiles(conn, perfis):
+    """Grava as tabelas de perfis aplicando só as linhas novas, alteradas ou removidas.
+
+    Retorna {tabela: (gravadas, removidas)}. Se as colunas mudaram, a tabela é refeita.
+    """
+    totais = {}
+    for tabela, df in perfis.items():
+        chave = CHAVES_PERFIS[tabela]
+        existentes = [row[1] for row in conn.execute(f"PRAGMA main.table_info({tabela})")]
+        if existentes and existentes != list(df.columns):
+            conn.execute(f"DROP TABLE {tabela}")
+        definitions = ", ".join(
+            f'"{col}" {"INTEGER" if pd.api.types.is_integer_dtype(df[col]) else "TEXT"}'
+            + (" NOT NULL" if col in chave else "")
+            for col in df.columns)
+        # Sem rowid: a chave primária é a própria tabela
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {tabela} ({definitions}, "
+                     f"PRIMARY KEY ({', '.join(chave)})) WITHOUT ROWID")
+
+        totais[tabela] = sync_rows(conn, tabela, list(df.columns), len(chave), sql_rows(df))
+    return totais
+
+
+def sync_rows(conn, tabela, colunas, n_chave, linhas, onde="", params=()):
+    """Deixa em ``tabela`` (nas linhas de ``onde``) exatamente ``linhas``, regravando só as diferentes.
+
+    As ``n_chave`` primeiras ``colunas`` são a chave primária. Retorna (gravadas, removidas).
+    """
+    quoted = ", ".join(f'"{c}"' for c in colunas)
+    atuais = {row[:n_chave]: row for row in conn.execute(f"SELECT {quoted} FROM {tabela} {onde}", params)}
+    novas = {row[:n_chave]: row for row in linhas}
+    removidas = [k for k in atuais if k not in novas]
+    gravadas = [row for k, row in novas.items() if atuais.get(k) != row]
+    condicao = " AND ".join(f'"{c}" = ?' for c in colunas[:n_chave])
+    conn.executemany(f"DELETE FROM {tabela} WHERE {condicao}", removidas)
+    placeholders = ", ".join("?" for _ in colunas)
+    conn.executemany(f"INSERT OR REPLACE INTO {tabela} ({quoted}) VALUES ({placeholders})", gravadas)
+    return len(gravadas), len(removidas)
+
+
+def write_profiles_database(perfis, destino=PERFIS_PATH):
+    """Aplica os perfis no banco à parte (criado se não existir); retorna o mesmo que ``write_profiles``.
+
+    Roda em todo build, mesmo sem mudanças no guia.sqlite: o arquivo pode não
+    existir ainda, e só as linhas diferentes são regravadas.
+    """
+    conn = sqlite3.connect(destino)
+    try:
+        with conn:
+            totais = write_profiles(conn, perfis)
+    finally:
+        conn.close()
+    for tabela, (gravadas, removidas) in totais.items():
+        print(f"{tabela}: {gravadas} perfis gravados, {removidas} removidos")
+    return totais
+
+
+def write_metadata(conn, versao, normalizado=False, vinculo_ies="codigo", coordenadas="ibge"):
+    conn.execute("CREATE TABLE IF NOT EXISTS metadados (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)")
+    # Só a versão dos dados, o esquema, o vínculo das IES ("codigo", pela
+    # instituicoes.csv, ou "nome") e a origem das coordenadas ("ibge" ou
+    # "ausentes"), sem data do build: bancos com os mesmos dados geram o mesmo
+    # .gz, e a versão serve de identificador para os clientes
+    conn.executemany(
+        "INSERT OR REPLACE INTO metadados (chave, valor) VALUES (?, ?)",
+        [("versao", versao), ("esquema", "normalizado" if normalizado else "plano"), ("vinculo_ies", vinculo_ies),
+         ("coordenadas", coordenadas)],
+    )
+
+
+def database_schema(path):
+    """Esquema registrado no banco ("plano" ou "normalizado"), se houver."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT valor FROM metadados WHERE chave = 'esquema'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+
+def write_database(frames, historico, instituicoes, municipios, versao, destino, normalizado=False):
+    """Grava o banco completo num arquivo novo e o coloca no lugar de ``destino``."""
+    temporario = destino.with_name(destino.name + ".tmp")
+    temporario.unlink(missing_ok=True)
+    conn = sqlite3.connect(temporario, isolation_level=None)
+    try:
+        # page_size só vale se definido antes da primeira tabela
+        conn.execute(f"PRAGMA page_size = {PAGE_SIZE}")
+        for pragma, valor in PRAGMAS_CARGA.items():
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+
+        conn.execute("BEGIN")
+        if normalizado:
+            write_normalized(conn, frames)
+        else:
+            for name, cfg in TABELAS.items():
+                create_table(conn, name, cfg["colunas"])
+                insert_rows(conn, name, frames[name])
+            # Índices depois da carga: cada um é montado de uma vez a partir de
+            # uma ordenação, em vez de crescer linha a linha
+            for name, cfg in TABELAS.items():
+                create_indexes(conn, name, cfg["indexes"])
+                create_fts(conn, name, cfg["texto"])
+        write_history(conn, historico)
+        write_institutions(conn, instituicoes)
+        write_municipalities(conn, municipios)
+        write_facets(conn, frames)
+        write_metadata(conn, versao, normalizado, instituicoes.attrs["vinculo_ies"], municipios.attrs["coordenadas"])
+        conn.execute("COMMIT")
+
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+    os.replace(temporario, destino)
+
+
+def compress_database(origem=DB_PATH, destino=GZ_PATH):
+    """Gera o .gz que o site baixa (nível 9, sem data no cabeçalho)."""
+    temporario = destino.with_name(destino.name + ".tmp")
+    with open(origem, "rb") as src, open(temporario, "wb") as raw:
+        # mtime=0 deixa o artefato idêntico quando o banco não muda
+        with gzip.GzipFile(filename="", mode="wb", compresslevel=9, fileobj=raw, mtime=0) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(temporario, destino)
+    return destino.stat().st_size
+
+
+def write_version_file(versao, normalizado, destino):
+    """Grava a versão e o esquema do .gz publicado em ``guia.versao.json``.
+
+    O docs/app.js baixa esse arquivo (pequeno, sem cache) antes do banco e só
+    reaproveita a cópia guardada no IndexedDB se ela for da mesma versão.
+    """
+    conteudo = {"versao": versao, "esquema": "normalizado" if normalizado else "plano"}
+    destino.write_text(json.dumps(conteudo, indent=2) + "\n", encoding="utf-8")
+
+
+def write_http_range(versao, chunk_bytes=None, origem=DB_PATH, destino=HTTP_DIR):
+    """Cópia sem compressão, alinhada em páginas, para leitura por HTTP Range.
+
+    Grava ``guia.sqlite`` (ou pedaços de ``chunk_bytes`` bytes,
+    ``guia.sqlite.000``...) e um ``config.json`` no formato do sql.js-httpvfs.
+    Como as linhas já estão agrupadas por UF, área e grau e o VACUUM grava cada
+    tabela e índice em páginas seguidas, os filtros mais comuns leem trechos
+    contíguos do arquivo.
+    """
+    if chunk_bytes is not None and chunk_bytes % HTTP_PAGE_SIZE:
+        raise ValueError(f"O tamanho dos pedaços deve ser múltiplo de {HTTP_PAGE_SIZE} bytes")
+    destino.mkdir(parents=True, exist_ok=True)
+    for antigo in destino.glob("guia.sqlite*"):
+        antigo.unlink()
+
+    arquivo = destino / "guia.sqlite"
+    shutil.copyfile(origem, arquivo)
+    conn = sqlite3.connect(arquivo, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA page_size = {HTTP_PAGE_SIZE}")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    tamanho = arquivo.stat().st_size
+
+    config = {"requestChunkSize": HTTP_PAGE_SIZE, "databaseLengthBytes": tamanho, "versao": versao}
+    if chunk_bytes is None:
+        config.update(serverMode="full", url="guia.sqlite")
+    else:
+        with open(arquivo, "rb") as src:
+            for n, bloco in enumerate(iter(lambda: src.read(chunk_bytes), b"")):
+                (destino / f"guia.sqlite.{n:0{HTTP_SUFIXO}d}").write_bytes(bloco)
+        arquivo.unlink()
+        config.update(serverMode="chunked", serverChunkSize=chunk_bytes,
+                      urlPrefix="guia.sqlite.", suffixLength=HTTP_SUFIXO)
+    (destino / "config.json").write_text(json.dumps(config, indent=2) + "\n", encoding="utf-8")
+    return tamanho
+
+
+def record_full_table(conn, name, keys, hashes):
+    # Os ids da carga completa seguem a ordem das linhas (1..n)
+    conn.execute("DELETE FROM estado.controle_linhas WHERE tabela = ?", (name,))
+    conn.executemany(
+        "INSERT INTO estado.controle_linhas (tabela, chave, hash, row_id) VALUES (?, ?, ?, ?)",
+        ((name, key, int(h), i + 1) for i, (key, h) in enumerate(zip(keys, hashes))),
+    )
+
+
+def apply_changes(conn, name, df, keys, hashes, build_id):
+    """Aplica inserções/atualizações/remoções de uma tabela; retorna as contagens."""
+    current = {key: (h, row_id) for key, h, row_id in conn.execute(
+        "SELECT chave, hash, row_id FROM estado.controle_linhas WHERE tabela = ?", (name,))}
+    new_positions = {key: i for i, key in enumerate(keys)}
+
+    deleted = [key for key in current if key not in new_positions]
+    inserted = [key for key in keys if key not in current]
+    updated = [key for key in keys if key in current and current[key][0] != int(hashes[new_positions[key]])]
+
+    columns = list(df.columns)
+    quoted = ", ".join(f'"{c}"' for c in columns)
+    placeholders = ", ".join("?" for _ in columns)
+    assignments = ", ".join(f'"{c}" = ?' for c in columns)
+
+    if deleted:
+        conn.executemany(f"DELETE FROM {name} WHERE id = ?", ((current[key][1],) for key in deleted))
+        conn.executemany("DELETE FROM estado.controle_linhas WHERE tabela = ? AND chave = ?",
+                         ((name, key) for key in deleted))
+    if updated:
+        positions = [new_positions[key] for key in updated]
+        values = sql_rows(df.iloc[positions])
+        conn.executemany(
+            f"UPDATE {name} SET {assignments} WHERE id = ?",
+            (row + (current[key][1],) for row, key in zip(values, updated)),
+        )
+        conn.executemany(
+            "UPDATE estado.controle_linhas SET hash = ? WHERE tabela = ? AND chave = ?",
+            ((int(hashes[new_positions[key]]), name, key) for key in updated),
+        )
+    if inserted:
+        positions = [new_positions[key] for key in inserted]
+        for row, key, position in zip(sql_rows(df.iloc[positions]), inserted, positions):
+            row_id = conn.execute(f"INSERT INTO {name} ({quoted}) VALUES ({placeholders})", row).lastrowid
+            conn.execute(
+                "INSERT INTO estado.controle_linhas (tabela, chave, hash, row_id) VALUES (?, ?, ?, ?)",
+                (name, key, int(hashes[position]), row_id),
+            )
+
+    conn.executemany(
+        "INSERT INTO estado.log_alteracoes (build_id, tabela, chave, operacao) VALUES (?, ?, ?, ?)",
+        [(build_id, name, key, "delete") for key in deleted]
+        + [(build_id, name, key, "update") for key in updated]
+        + [(build_id, name, key, "insert") for key in inserted],
+    )
+    return len(inserted), len(updated), len(deleted)
+
+
+def relink_rows(conn, name, df, keys):
+    """Atualiza as chaves das dimensões (``IDS_SUBSTITUTOS``) que mudaram; retorna quantas linhas."""
+    row_ids = dict(conn.execute("SELECT chave, row_id FROM estado.controle_linhas WHERE tabela = ?", (name,)))
+    atribuicoes = ", ".join(f"{coluna} = ?" for coluna in IDS_SUBSTITUTOS)
+    diferentes = " OR ".join(f"{coluna} IS NOT ?" for coluna in IDS_SUBSTITUTOS)
+    # rowcount não inclui as linhas que os gatilhos do FTS alteram
+    return conn.executemany(
+        f"UPDATE {name} SET {atribuicoes} WHERE id = ? AND ({diferentes})",
+        (ids + (row_ids[key],) + ids for ids, key in zip(sql_rows(df[IDS_SUBSTITUTOS]), keys)),
+    ).rowcount
+
+
+def can_apply_incremental(conn):
+    """O incremental precisa do banco publicado (com as tabelas FTS e as colunas
+    de agora) e do controle de todas as tabelas."""
+    tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+    tracked = {row[0] for row in conn.execute("SELECT DISTINCT tabela FROM estado.controle_linhas")}
+    expected = set(TABELAS) | {f"{name}_fts" for name in TABELAS}
+    if not (expected <= tables and set(TABELAS) <= tracked):
+        return False
+    return all([row[1] for row in conn.execute(f"PRAGMA main.table_info({name})")] == ["id", *cfg["colunas"]]
+               for name, cfg in TABELAS.items())
+
+
+def start_build(conn, modo, versao):
+    return conn.execute(
+        "INSERT INTO estado.builds (executado_em, modo, versao, insercoes, atualizacoes, remocoes) "
+        "VALUES (?, ?, ?, 0, 0, 0)",
+        (datetime.now(timezone.utc).isoformat(timespec="seconds"), modo, versao),
+    ).lastrowid
+
+
+def finish_build(conn, build_id, totals):
+    conn.execute(
+        "UPDATE estado.builds SET insercoes = ?, atualizacoes = ?, remocoes = ? WHERE build_id = ?",
+        (*map(int, totals), build_id),
+    )
+
+
+def build(incremental=False, normalizado=False, http_range=False, chunk_bytes=None, estrito=False):
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    # Tipos dos filtros que o buildWhere do site lê (ver filter_spec.py)
+    write_spec(DATA_DIR / "filtros.json")
+
+    frames, instituicoes, municipios = load_frames(estrito)
+    historico = load_historico_notas(frames["pos"])
+    hashes = {name: content_hashes(df) for name, df in frames.items()}
+    perfis = load_profiles(frames, instituicoes)
+
+    conn = None
+    if incremental and DB_PATH.exists() and database_schema(DB_PATH) == "normalizado":
+        # As tabelas do banco normalizado são views; refaz no mesmo esquema
+        print("O banco atual é normalizado e não aceita o modo incremental; fazendo o build completo")
+        normalizado = True
+    elif incremental and DB_PATH.exists():
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("ATTACH DATABASE ? AS estado", (str(STATE_PATH),))
+        create_control_tables(conn)
+        if not can_apply_incremental(conn):
+            print("Sem controle de linhas (ou com outras colunas) no banco atual; fazendo o build completo")
+            conn.close()
+            conn = None
+
+    # O esquema só fica definido aqui: um --incremental sobre o normalizado vira build completo
+    versao = data_version({**hashes, "historico_notas": row_hashes(historico),
+                           "instituicoes": row_hashes(instituicoes), "municipios": row_hashes(municipios)},
+                          schema_version(normalizado, instituicoes.attrs["vinculo_ies"],
+                                         municipios.attrs["coordenadas"]))
+
+    if conn is not None:
+        anterior = conn.execute("SELECT valor FROM metadados WHERE chave = 'versao'").fetchone()
+        build_id = start_build(conn, "incremental", versao)
+        totals = np.zeros(3, dtype=int)
+        relinked = 0
+        alteradas = {}
+        for name, df in frames.items():
+            keys = row_keys(df, TABELAS[name]["chave"])
+            counts = apply_changes(conn, name, df, keys, hashes[name], build_id)
+            religadas = relink_rows(conn, name, df, keys)
+            print(f"{name}: {counts[0]} inserções, {counts[1]} atualizações, {counts[2]} remoções, "
+                  f"{religadas} religadas às dimensões")
+            totals += counts
+            relinked += religadas
+            if any(counts):
+                alteradas[name] = sum(counts)
+        finish_build(conn, build_id, totals)
+        # Só o histórico de notas ou as dimensões (instituições, coordenadas) podem ter mudado
+        changed = totals.any() or relinked or anterior is None or anterior[0] != versao
+        if changed:
+            write_history(conn, historico)
+            write_institutions(conn, instituicoes)
+            write_municipalities(conn, municipios)
+            # Religar ids não muda as colunas das facetas: só as bases com linhas alteradas
+            gravadas, removidas = write_facets(conn, frames, alteradas)
+            print(f"facetas e faixas: {gravadas} linhas gravadas, {removidas} removidas")
+            write_metadata(conn, versao, vinculo_ies=instituicoes.attrs["vinculo_ies"],
+                           coordenadas=municipios.attrs["coordenadas"])
+            # Os gatilhos já atualizaram o FTS; junta os segmentos novos
+            for name in alteradas:
+                conn.execute(f"INSERT INTO {name}_fts({name}_fts) VALUES ('optimize')")
+        # Dados, controle e log numa única transação (banco principal + estado)
+        conn.commit()
+        if not changed:
+            conn.close()
+            write_version_file(versao, False, VERSAO_PATH)
+            write_profiles_database(perfis, PERFIS_PATH)
+            print(f"Nada mudou; {DB_PATH.name} e {GZ_PATH.name} mantidos (versão {versao[:12]})")
+            return
+        # Fora da transação: atualiza as estatísticas das bases que mudaram
+        # muito e devolve as páginas liberadas pelas remoções antes de comprimir
+        for name, mudancas in alteradas.items():
+            if mudancas > FRACAO_ANALYZE * len(frames[name]):
+                conn.execute(f"ANALYZE main.{name}")
+        livres = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        paginas = conn.execute("PRAGMA main.page_count").fetchone()[0]
+        if livres > FRACAO_VACUUM * paginas:
+            conn.execute("VACUUM main")
+        else:
+            print(f"VACUUM dispensado: {livres} de {paginas} páginas livres")
+        conn.close()
+        tamanho = compress_database(DB_PATH, GZ_PATH)
+    else:
+        write_database(frames, historico, instituicoes, municipios, versao, DB_PATH, normalizado)
+        # O zlib libera o GIL: o .gz é gerado enquanto o controle do modo
+        # incremental é gravado
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            compressao = executor.submit(compress_database, DB_PATH, GZ_PATH)
+            conn = sqlite3.connect(DB_PATH)
+            conn.execute("ATTACH DATABASE ? AS estado", (str(STATE_PATH),))
+            create_control_tables(conn)
+            build_id = start_build(conn, "completo", versao)
+            for name, df in frames.items():
+                record_full_table(conn, name, row_keys(df, TABELAS[name]["chave"]), hashes[name])
+            finish_build(conn, build_id, (sum(len(df) for df in frames.values()), 0, 0))
+            conn.commit()
+            conn.close()
+            tamanho = compressao.result()
+
+    write_version_file(versao, normalizado, VERSAO_PATH)
+    write_profiles_database(perfis, PERFIS_PATH)
+    print(f"Base SQLite gerada em {DB_PATH} (versão {versao[:12]}); "
+          f"{GZ_PATH.name}: {tamanho / 1024:.0f} KiB")
+    if http_range:
+        # A cópia para HTTP Range usa sempre o esquema plano: nele os filtros
+        # leem os índices das próprias tabelas e baixam bem menos páginas que
+        # pelas views do normalizado (ver benchmarks/bytes_http_range.py)
+        origem = DB_PATH
+        if normalizado:
+            origem = DATA_DIR / "guia-plano.sqlite"
+            write_database(frames, historico, instituicoes, municipios, versao, origem)
+        try:
+            tamanho = write_http_range(versao, chunk_bytes, origem, HTTP_DIR)
+        finally:
+            if origem != DB_PATH:
+                origem.unlink()
+        print(f"Cópia para HTTP Range em {HTTP_DIR} ({tamanho / 1024:.0f} KiB, páginas de {HTTP_PAGE_SIZE} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o banco SQLite do Guia das Federais.")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument(
+        "--incremental",
+        action="store_true",
+        help="aplica apenas as linhas inseridas, alteradas ou removidas desde o último build",
+    )
+    modo.add_argument(
+        "--normalizado",
+        action="store_true",
+        help="grava dimensões (IES, município, área, modalidade, grau) e tabelas de fatos com views de compatibilidade",
+    )
+    parser.add_argument(
+        "--http-range",
+        action="store_true",
+        help=f"grava também uma cópia sem compressão e um config.json em {HTTP_DIR.relative_to(ROOT)} "
+             "para clientes que leem o banco por HTTP Range",
+    )
+    parser.add_argument(
+        "--chunk-kb",
+        type=int,
+        help="com --http-range, divide a cópia em pedaços deste tamanho (KiB)",
+    )
+    parser.add_argument(
+        "--estrito",
+        action="store_true",
+        help="para com erro se faltar instituicoes.csv ou o arquivo de coordenadas dos municípios, em vez de "
+             "ligar as IES pelo nome e gerar o banco sem as buscas por distância",
+    )
+    args = parser.parse_args()
+    if args.chunk_kb is not None and not args.http_range:
+        parser.error("--chunk-kb só vale junto com --http-range")
+    chunk_bytes = args.chunk_kb * 1024 if args.chunk_kb is not None else None
+    try:
+        build(incremental=args.incremental, normalizado=args.normalizado, http_range=args.http_range,
+              chunk_bytes=chunk_bytes, estrito=args.estrito)
+    except FileNotFoundError as erro:
+        sys.exit(f"Erro: {erro}")
 
 
 if __name__ == "__main__":
-    build()
+    main()
@@ -1,144 +1,543 @@
 # %%
 # Esta seção importa e trata os dados obtidos via Capes https://dadosabertos.capes.gov.br/dataset/2017-a-2020-programas-da-pos-graduacao-stricto-sensu-no-brasil
 # São referentes exclusivamente ao Mestrado e Doutorado
+#
+# As três etapas deste script leem os arquivos originais em pedaços (chunks) e gravam o resultado
+# no CSV de saída à medida que cada pedaço é filtrado. Assim a memória usada fica limitada ao
+# tamanho de um pedaço, não importa o tamanho dos arquivos do MEC/CAPES.
+import json
+from collections import defaultdict
+from pathlib import Path
+
 import pandas as pd
 
-def filtrar_dados_capes_csv(arquivo_dados_pos, arquivo_codigos_pos):
-    try:
-        # Carregar o arquivo que contém o glossário/dicionário das colunas
-        glossario = pd.read_csv(arquivo_codigos_pos, header=None, sep='\t', usecols=[1, 2])
-        glossario_dict = dict(zip(glossario[1], glossario[2]))
+# Quantidade de linhas lidas por vez dos arquivos originais
+TAMANHO_CHUNK = 20000
+
+URL_SUCUPIRA = "https://sucupira.capes.gov.br/sucupira/public/consultas/coleta/programa/viewPrograma.jsf?cd_programa="
+
+
+def gravar_chunks(chunks, arquivo_saida):
+    # Grava os pedaços já tratados um após o outro no CSV de saída (cabeçalho só no primeiro)
+    total_linhas = 0
+    with open(arquivo_saida, 'w', encoding='utf-8', newline='') as saida:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(saida, index=None, sep='\t', header=(i == 0))
+            total_linhas += len(chunk)
+    return total_linhas
+
 
-        # Carregar o arquivo com os dados dos programas (separador de tabulação, sem índice e sem cabeçalho)
-        dados_pos = pd.read_csv(arquivo_dados_pos, sep='\t', index_col=False)
+def chunks_capes(arquivo_dados_pos, arquivo_codigos_pos):
+    # Carregar o arquivo que contém o glossário/dicionário das colunas
+    glossario = pd.read_csv(arquivo_codigos_pos, header=None, sep='\t', usecols=[1, 2])
+    glossario_dict = dict(zip(glossario[1], glossario[2]))
 
-        # Filtrar os dados para selecionar somente os programas em funcionamento, de instituições públicas ou em rede (na maioria das vezes os programas em rede tem participação das IES públicas)
-        dados_filtrados = dados_pos.loc[(dados_pos['DS_SITUACAO_PROGRAMA'] == 'EM FUNCIONAMENTO') & 
-                               ((dados_pos['DS_DEPENDENCIA_ADMINISTRATIVA'] == 'PÚBLICA') | 
-                                (dados_pos['SG_ENTIDADE_ENSINO_REDE'] == 'SIM')),
-                               dados_pos.columns[:-3]] #Dispensando as ultimas colunas porque não tem informação útil
+    # Dispensando as ultimas colunas porque não tem informação útil (nem chegam a ser lidas)
+    colunas = pd.read_csv(arquivo_dados_pos, sep='\t', index_col=False, nrows=0).columns
+    colunas_uteis = list(colunas[:-3])
 
-        # Substituir os cabeçalhos das colunas pelo conteúdo do glossário
-        dados_filtrados.columns = [glossario_dict.get(col, col) for col in dados_filtrados.columns]
+    def chunks_filtrados():
+        # Tudo é lido como texto para que cada pedaço tenha os mesmos tipos e o valor original seja preservado
+        leitor = pd.read_csv(arquivo_dados_pos, sep='\t', index_col=False, usecols=colunas_uteis,
+                             dtype=str, chunksize=TAMANHO_CHUNK)
+        for chunk in leitor:
+            # Filtrar os dados para selecionar somente os programas em funcionamento, de instituições públicas ou em rede (na maioria das vezes os programas em rede tem participação das IES públicas)
+            chunk = chunk.loc[(chunk['DS_SITUACAO_PROGRAMA'] == 'EM FUNCIONAMENTO') &
+                              ((chunk['DS_DEPENDENCIA_ADMINISTRATIVA'] == 'PÚBLICA') |
+                               (chunk['SG_ENTIDADE_ENSINO_REDE'] == 'SIM')),
+                              colunas_uteis]
 
-        # Adicionar a coluna "Link" com o link completo para acessar os detalhes do programa diretamente na plataforma sucupira
-        dados_filtrados['Link'] = dados_filtrados['Código do programa de pós-graduação'].apply(
-            lambda x: "https://sucupira.capes.gov.br/sucupira/public/consultas/coleta/programa/viewPrograma.jsf?cd_programa=" + str(x)
-        )
+            # Substituir os cabeçalhos das colunas pelo conteúdo do glossário
+            chunk.columns = [glossario_dict.get(col, col) for col in chunk.columns]
 
+            # Adicionar a coluna "Link" com o link completo para acessar os detalhes do programa diretamente na plataforma sucupira
+            chunk['Link'] = URL_SUCUPIRA + chunk['Código do programa de pós-graduação'].astype(str)
+            yield chunk
 
-        return dados_filtrados
+    return chunks_filtrados()
 
-    except Exception as e:
-        return f"Ocorreu um erro: {e}"
 
-# É necessário ajustar os nomes dos arquivos se novas versões da base de dados forem disponibilizadas
-arquivo_codigos_pos = 'CAPES_originais/codigos_capes.csv'
-arquivo_dados_pos = 'CAPES_originais/br-capes-colsucup-prog-2021-2022-11-30.csv'
-dados_resultantes_pos = filtrar_dados_capes_csv(arquivo_dados_pos, arquivo_codigos_pos)
-dados_resultantes_pos.to_csv("../mestrado_doutorado_univ_publicas.csv", index=None, sep='\t')
+def filtrar_dados_capes_csv(arquivo_dados_pos, arquivo_codigos_pos, arquivo_saida):
+    return gravar_chunks(chunks_capes(arquivo_dados_pos, arquivo_codigos_pos), arquivo_saida)
+
+
+# Coluna (já com o nome do glossário) que separa as partições anuais
+COLUNA_ANO_CAPES = 'Ano de referência do Coleta'
+
+
+def particionar_capes_por_ano(arquivo_dados_pos, arquivo_codigos_pos, pasta_particoes):
+    # Mesmo tratamento de filtrar_dados_capes_csv, mas cada ano de referência vai para a sua partição:
+    # pasta_particoes/ano=AAAA/<nome do arquivo original>.csv. Um arquivo da CAPES pode trazer vários
+    # anos (como o de 2017 a 2020); a memória continua limitada ao tamanho de um pedaço.
+    nome = Path(arquivo_dados_pos).stem + '.csv'
+    # Partições antigas deste arquivo saem antes: um ano que sumiu do arquivo não pode ficar para trás
+    for antiga in Path(pasta_particoes).glob(f'ano=*/{nome}'):
+        antiga.unlink()
+
+    arquivos = {}
+    linhas = defaultdict(int)
+    try:
+        for chunk in chunks_capes(arquivo_dados_pos, arquivo_codigos_pos):
+            for ano, parte in chunk.groupby(COLUNA_ANO_CAPES, sort=False):
+                if ano not in arquivos:
+                    destino = Path(pasta_particoes) / f'ano={ano}' / nome
+                    destino.parent.mkdir(parents=True, exist_ok=True)
+                    arquivos[ano] = open(destino, 'w', encoding='utf-8', newline='')
+                parte.to_csv(arquivos[ano], index=None, sep='\t', header=(linhas[ano] == 0))
+                linhas[ano] += len(parte)
+    finally:
+        for saida in arquivos.values():
+            saida.close()
+    return dict(linhas)
+
+
+def juntar_particoes_capes(pasta_particoes, arquivo_dados_pos, arquivo_saida):
+    # A base do app é o arquivo da CAPES mais recente, que a etapa anual já filtrou e dividiu por ano:
+    # em vez de ler o original de novo, junta as partições dele (mesmas colunas, cabeçalho só uma vez)
+    nome = Path(arquivo_dados_pos).stem + '.csv'
+    particoes = sorted(Path(pasta_particoes).glob(f'ano=*/{nome}'), key=lambda particao: particao.parent.name)
+    total_linhas = 0
+    with open(arquivo_saida, 'w', encoding='utf-8', newline='') as saida:
+        for i, particao in enumerate(particoes):
+            with open(particao, encoding='utf-8', newline='') as entrada:
+                cabecalho = entrada.readline()
+                if i == 0:
+                    saida.write(cabecalho)
+                for linha in entrada:
+                    saida.write(linha)
+                    total_linhas += 1
+    return total_linhas
+
+
+def historico_notas_capes(pasta_particoes, arquivos_dados_pos, arquivo_saida):
+    # Tabela compacta com a nota de cada programa em cada ano: só duas colunas de cada partição são lidas.
+    # Entram só as partições dos arquivos informados; se mais de um trouxer o mesmo ano, vale o mais
+    # recente (último em ordem de nome).
+    colunas = {'Código do programa de pós-graduação': 'codigo_programa',
+               'Nota/Conceito do programa de pós-graduação': 'nota_conceito'}
+    particoes = {}
+    for arquivo in sorted(arquivos_dados_pos, key=lambda arquivo: Path(arquivo).name):
+        for particao in Path(pasta_particoes).glob(f'ano=*/{Path(arquivo).stem}.csv'):
+            particoes[int(particao.parent.name.split('=', 1)[1])] = particao
+    anos = []
+    for ano, particao in sorted(particoes.items()):
+        df = pd.read_csv(particao, sep='\t', usecols=list(colunas), dtype=str).rename(columns=colunas)
+        df.insert(1, 'ano', ano)
+        anos.append(df)
+    historico = pd.concat(anos, ignore_index=True) if anos else pd.DataFrame(columns=['codigo_programa', 'ano', 'nota_conceito'])
+    historico = historico.drop_duplicates(['codigo_programa', 'ano'], keep='last').sort_values(['codigo_programa', 'ano'])
+    historico.to_csv(arquivo_saida, index=None, sep='\t')
+    return len(historico)
+
 #%%
 # Esta seção importa e trata os dados obtidos via MEC https://dadosabertos.mec.gov.br/indicadores-sobre-ensino-superior
 # São referentes exclusivamente à Graduação
 import pandas as pd
 
-def filtrar_dados_mec_csv(arquivo_dados_graduacao, arquivo_codigos_graduacao):
-    try:
-        # Carregar o arquivo B.csv que contém o glossário/dicionário
-        glossario = pd.read_csv(arquivo_codigos_graduacao,  sep='\t', usecols=[0, 1])
-        glossario_dict = dict(zip(glossario['Código'], glossario['Nome']))
+# Categorias de IES mantidas na graduação e na dimensão de instituições
+CATEGORIAS_PUBLICAS = ["Pública Federal", "Pública Estadual"]
+
 
-        # Preparar um DataFrame vazio para armazenar os dados filtrados
-        dados_filtrados = pd.DataFrame()
+def filtrar_dados_mec_csv(arquivo_dados_graduacao, arquivo_codigos_graduacao, arquivo_saida):
+    # Carregar o arquivo B.csv que contém o glossário/dicionário
+    glossario = pd.read_csv(arquivo_codigos_graduacao,  sep='\t', usecols=[0, 1])
+    glossario_dict = dict(zip(glossario['Código'], glossario['Nome']))
 
-        categorias_publicas = ["Pública Federal", "Pública Estadual"]
+    # Colunas descartadas já na leitura (o CODIGO_IES fica: é a chave da dimensão de instituições)
+    colunas_para_descartar = {'CODIGO_AREA_OCDE_CINE', 'AREA_OCDE_CINE','CODIGO_MUNICIPIO', 'CARGA_HORARIA'}
 
+    def chunks_filtrados():
         # Processar o arquivo A.csv em pedaços para evitar carregar tudo na memória
-        chunksize = 10000  # Ajuste este valor conforme a necessidade
-        for chunk in pd.read_csv(arquivo_dados_graduacao, sep=',', chunksize=chunksize):
+        leitor = pd.read_csv(arquivo_dados_graduacao, sep=',', usecols=lambda col: col not in colunas_para_descartar,
+                             dtype=str, chunksize=TAMANHO_CHUNK)
+        for chunk in leitor:
             # Filtrar os dados conforme as condições
-            chunk_filtrado = chunk.loc[(chunk['CATEGORIA_ADMINISTRATIVA'].isin(categorias_publicas)) & (chunk['SITUACAO_CURSO'] == 'Em atividade')]
-
-            # Descartar as colunas especificadas
-            colunas_para_descartar = ['CODIGO_IES', 'CODIGO_AREA_OCDE_CINE', 'AREA_OCDE_CINE','CODIGO_MUNICIPIO', 'CARGA_HORARIA']
-            chunk_filtrado = chunk_filtrado.drop(columns=colunas_para_descartar)
-
-            # Adicionar o chunk filtrado ao DataFrame final
-            dados_filtrados = pd.concat([dados_filtrados, chunk_filtrado], ignore_index=True)
-
-        # Substituir os cabeçalhos das colunas do arquivo A.csv pelos valores correspondentes do arquivo B.csv
-        dados_filtrados.columns = [glossario_dict.get(col, col) for col in dados_filtrados.columns]
+            chunk = chunk.loc[(chunk['CATEGORIA_ADMINISTRATIVA'].isin(CATEGORIAS_PUBLICAS)) & (chunk['SITUACAO_CURSO'] == 'Em atividade')]
 
-        return dados_filtrados
+            # Substituir os cabeçalhos das colunas do arquivo A.csv pelos valores correspondentes do arquivo B.csv
+            chunk.columns = [glossario_dict.get(col, col) for col in chunk.columns]
+            yield chunk
 
-    except Exception as e:
-        return f"Ocorreu um erro: {e}"
+    return gravar_chunks(chunks_filtrados(), arquivo_saida)
 
 
-arquivo_codigos_graduacao = 'MEC_originais/dicionario_codigos.csv'
-arquivo_dados_graduacao = 'MEC_originais/PDA_Dados_Cursos_Graduacao_Brasil.csv'
-dados_resultantes_graduacao = filtrar_dados_mec_csv(arquivo_dados_graduacao, arquivo_codigos_graduacao)
-dados_resultantes_graduacao.to_csv("../graduacao_univ_publicas.csv", index=None, sep='\t')
 # %%
 # Esta seção importa e trata os dados obtidos via MEC https://dadosabertos.mec.gov.br/indicadores-sobre-ensino-superior/item/182-cursos-de-especializacao-do-brasil
 # São referentes exclusivamente à Pós-graduação lato senso (a especializacao)
-# Como não exisitia uma informação sobre a Categoria da IES nesta base de dados, foi necessário utilizar o resultado da seção anterior como referência pra conseguir filtrar 
+# Como não exisitia uma informação sobre a Categoria da IES nesta base de dados, foi necessário utilizar o resultado da seção anterior como referência pra conseguir filtrar (pelo CODIGO_IES)
 import pandas as pd
 
 # Script para ler e processar os dados dos CSVs
 
-# Função para ler o arquivo CSV e criar o dataframe "IES_publicas"
+# Colunas com os códigos da IES nos CSVs tratados: o código e-MEC é o mesmo CODIGO_IES dos arquivos do MEC
+COLUNA_CODIGO_IES_GRADUACAO = 'Código da Instituição de Educação Superior (IES)'
+COLUNA_CODIGO_EMEC_CAPES = 'Código e-Mec da Instituição de Ensino Superior'
+COLUNA_CODIGO_CAPES = 'Código da Instituição de Ensino Superior na CAPES'
+
+# A CAPES informa a esfera da IES no status jurídico; vira a mesma categoria usada pelo MEC
+CATEGORIAS_CAPES = {'FEDERAL': 'Pública Federal', 'ESTADUAL': 'Pública Estadual', 'MUNICIPAL': 'Pública Municipal'}
+
+
+# Função para montar a dimensão de instituições, uma linha por IES, chaveada pelos códigos inteiros
+def criar_dimensao_instituicoes(dados_resultantes_graduacao, dados_resultantes_pos, arquivo_saida):
+    # IES da graduação: uma linha por CODIGO_IES, com nome, categoria e organização acadêmica do MEC
+    graduacao = pd.read_csv(dados_resultantes_graduacao, sep='\t', dtype={COLUNA_CODIGO_IES_GRADUACAO: 'Int64'},
+                            usecols=[COLUNA_CODIGO_IES_GRADUACAO, 'Nome da IES', 'Categoria da IES',
+                                     'Organização acadêmica'])
+    graduacao = graduacao.dropna(subset=[COLUNA_CODIGO_IES_GRADUACAO]).drop_duplicates(COLUNA_CODIGO_IES_GRADUACAO)
+    graduacao.columns = ['codigo_ies', 'nome_ies', 'categoria_ies', 'organizacao_academica']
+
+    # IES da pós: uma linha por código CAPES; o código e-MEC vem como texto e "NI" (não informado) vira vazio
+    pos = pd.read_csv(dados_resultantes_pos, sep='\t', dtype=str,
+                      usecols=[COLUNA_CODIGO_EMEC_CAPES, COLUNA_CODIGO_CAPES,
+                               'Sigla da Instituição de Ensino Superior do programa de pós-graduação',
+                               'Instituição de Ensino Superior do programa de pós-graduação',
+                               'Status Jurídico da Instituição de Ensino Superior'])
+    pos = pd.DataFrame({
+        'codigo_ies': pd.to_numeric(pos[COLUNA_CODIGO_EMEC_CAPES], errors='coerce').astype('Int64'),
+        'codigo_capes_ies': pd.to_numeric(pos[COLUNA_CODIGO_CAPES], errors='coerce').astype('Int64'),
+        'sigla_ies': pos['Sigla da Instituição de Ensino Superior do programa de pós-graduação'],
+        'nome_ies_capes': pos['Instituição de Ensino Superior do programa de pós-graduação'],
+        'categoria_capes': pos['Status Jurídico da Instituição de Ensino Superior'].map(CATEGORIAS_CAPES),
+    }).drop_duplicates('codigo_capes_ies')
+
+    # Junção pelo código e-MEC; IES só da graduação ou só da pós (sem código e-MEC) continuam na dimensão
+    com_codigo = pos['codigo_ies'].notna()
+    dimensao = pd.concat([
+        graduacao.merge(pos[com_codigo].drop_duplicates('codigo_ies'), on='codigo_ies', how='outer'),
+        pos[~com_codigo],
+    ], ignore_index=True)
+    dimensao['nome_ies'] = dimensao['nome_ies'].fillna(dimensao['nome_ies_capes'])
+    dimensao['categoria_ies'] = dimensao['categoria_ies'].fillna(dimensao['categoria_capes'])
+    dimensao = dimensao[['codigo_ies', 'codigo_capes_ies', 'sigla_ies', 'nome_ies', 'categoria_ies',
+                         'organizacao_academica']]
+    dimensao = dimensao.sort_values(['codigo_ies', 'codigo_capes_ies'], na_position='last')
+    dimensao.to_csv(arquivo_saida, index=None, sep='\t')
+    return len(dimensao)
+
+
+# Função para ler a dimensão de instituições e criar o dataframe "IES_publicas" (código e categoria)
 def criar_dataframe_ies_publicas(dados_resultantes_graduacao):
-    # Ler o arquivo CSV
-    df_graduacao = pd.read_csv(dados_resultantes_graduacao,sep='\t')
+    # As IES públicas são as da base de graduação já filtrada (categorias de CATEGORIAS_PUBLICAS), como antes
+    # da dimensão de instituições; só a chave passou do nome para o CODIGO_IES. As IES que aparecem só na
+    # CAPES ficam de fora, mesmo que a dimensão as classifique como públicas
+    df_graduacao = pd.read_csv(dados_resultantes_graduacao, sep='\t', usecols=[COLUNA_CODIGO_IES_GRADUACAO, "Categoria da IES"],
+                               dtype={COLUNA_CODIGO_IES_GRADUACAO: 'Int64'})
 
-    # Selecionar valores únicos da coluna "Nome da IES" e os valores correspondentes da coluna "Categoria da IES"
-    df_ies_publicas = df_graduacao.drop_duplicates(subset=["Nome da IES"])[["Nome da IES", "Categoria da IES"]]
-    
-    # Renomear o dataframe
-    df_ies_publicas.rename(columns={"Nome da IES": "NOME_IES", "Categoria da IES": "Categoria_IES"}, inplace=True)
+    # Selecionar valores únicos do código e os valores correspondentes da coluna "Categoria da IES"
+    df_ies_publicas = df_graduacao.dropna(subset=[COLUNA_CODIGO_IES_GRADUACAO]).drop_duplicates(COLUNA_CODIGO_IES_GRADUACAO)
 
-    return df_ies_publicas
+    # Renomear as colunas para as da base de especialização
+    return df_ies_publicas.rename(columns={COLUNA_CODIGO_IES_GRADUACAO: "CODIGO_IES", "Categoria da IES": "Categoria_IES"})
 
-# Função para ler o arquivo CSV "PDA_Cursos_Especializacao_Brasil.csv" e filtrar as linhas com correspondência no dataframe "IES_publicas"
-def filtrar_cursos_especializacao(df_ies_publicas,arquivo_dados_especializacao):
-    # Ler o arquivo CSV
-    df_especializacao = pd.read_csv(arquivo_dados_especializacao,sep=',')
+# Função para ler o arquivo CSV "PDA_Cursos_Especializacao_Brasil.csv", filtrar as linhas com correspondência no dataframe "IES_publicas" e gravar o resultado
+def filtrar_cursos_especializacao(df_ies_publicas,arquivo_dados_especializacao, arquivo_saida):
+    # Descartar as colunas especificadas (já na leitura); o CODIGO_IES fica para as junções
+    colunas_para_descartar = {'CODIGO_ESPECIALIZACAO', 'CODIGO_OCDE_CINE', 'CODIGO_MUNICIPIO'}
 
-    # Filtrar as linhas onde a coluna "Nome da IES" tenha correspondência no dataframe "IES_publicas"
-    df_especializacao_filtrado = df_especializacao[df_especializacao["NOME_IES"].isin(df_ies_publicas["NOME_IES"])]
+    # Colunas numéricas como inteiro que aceita vazio; o resto é lido como texto
+    tipos = defaultdict(lambda: str, {'CODIGO_IES': 'Int64', 'CARGA_HORARIA': 'Int64', 'DURACAO_MESES': 'Int64',
+                                      'VAGAS': 'Int64'})
 
-    # Filtrar os dados conforme as condições
-    df_especializacao_filtrado = df_especializacao_filtrado.loc[(df_especializacao_filtrado['SITUACAO'] == 'Ativo')]
+    def chunks_filtrados():
+        leitor = pd.read_csv(arquivo_dados_especializacao, sep=',', usecols=lambda col: col not in colunas_para_descartar,
+                             dtype=tipos, chunksize=TAMANHO_CHUNK)
+        for chunk in leitor:
+            # Filtrar as linhas cujo CODIGO_IES esteja no dataframe "IES_publicas" e que estejam ativas
+            chunk = chunk.loc[chunk["CODIGO_IES"].isin(df_ies_publicas["CODIGO_IES"]) & (chunk['SITUACAO'] == 'Ativo')].copy()
 
-    # Descartar as colunas especificadas
-    colunas_para_descartar = ['CODIGO_IES','CODIGO_ESPECIALIZACAO', 'CODIGO_OCDE_CINE', 'CODIGO_MUNICIPIO']
-    df_especializacao_filtrado = df_especializacao_filtrado.drop(columns=colunas_para_descartar)
+            # Como existem muitos dados de duração que são absurdos (como 480 meses) eu estou modificando qualquer coisa acima de 48 meses para 48
+            chunk.loc[(chunk['DURACAO_MESES'] > 48).fillna(False), 'DURACAO_MESES'] = 48
 
-    # Como existem muitos dados de duração que são absurdos (como 480 meses) eu estou modificando qualquer coisa acima de 48 meses para 48
-    df_especializacao_filtrado.loc[df_especializacao_filtrado['DURACAO_MESES'] > 48, 'DURACAO_MESES'] = 48
+            # Como existem muitos dados de carga horária que não condizem com a realidade, estou definindo como 30hrs/mes para qualquer curso que extrapole um valor razoavel
+            carga_excessiva = (chunk['CARGA_HORARIA'] > 720).fillna(False)
+            chunk.loc[carga_excessiva, 'CARGA_HORARIA'] = chunk.loc[carga_excessiva, 'DURACAO_MESES']*30
 
-    # Como existem muitos dados de carga horária que não condizem com a realidade, estou definindo como 30hrs/mes para qualquer curso que extrapole um valor razoavel
-    df_especializacao_filtrado.loc[df_especializacao_filtrado['CARGA_HORARIA'] > 720, 'CARGA_HORARIA'] = df_especializacao_filtrado['DURACAO_MESES']*30
+            chunk.rename(columns={"OCDE_CINE": "Area_Conhecimento"}, inplace=True)
 
+            # Junção dos dataframes pelo código da IES
+            yield chunk.merge(df_ies_publicas, on="CODIGO_IES", how="left")
 
-    df_especializacao_filtrado.rename(columns={"OCDE_CINE": "Area_Conhecimento"}, inplace=True)
-
-    # Junção dos dataframes baseada na coluna "Nome da IES" / "Nome_IES"
-    df_especializacao_filtrado_unificado = df_especializacao_filtrado.merge(df_ies_publicas,left_on="NOME_IES", right_on="NOME_IES",how="left")
-
-
-    return df_especializacao_filtrado_unificado
+    return gravar_chunks(chunks_filtrados(), arquivo_saida)
 #%%
-# Executando as funções
-arquivo_dados_resultantes_graduacao = "../graduacao_univ_publicas.csv"
-df_ies_publicas = criar_dataframe_ies_publicas(arquivo_dados_resultantes_graduacao)
+# Esta seção baixa os centróides dos municípios, usados nas buscas por distância (geo_index.py e a
+# tabela municipios do guia.sqlite). A tabela vem do projeto kelvins/municipios-brasileiros, que traz
+# a latitude e a longitude de cada município a partir dos dados do IBGE, com o código IBGE e o da UF.
+# Não é uma etapa: não depende dos arquivos originais e só muda quando o IBGE cria ou renomeia municípios.
+# Rode com --baixar-coordenadas e versione o CSV e o .fonte.json com a data do download. Sem acesso ao
+# GitHub, passe o endereço de um espelho ou o caminho de uma cópia local do mesmo municipios.csv.
+from datetime import date
+
+URL_COORDENADAS = 'https://raw.githubusercontent.com/kelvins/municipios-brasileiros/main/csv/municipios.csv'
+
+
+def baixar_coordenadas_municipios(url, arquivo_saida):
+    coordenadas = pd.read_csv(url, usecols=['codigo_ibge', 'nome', 'latitude', 'longitude', 'codigo_uf'])
+    coordenadas = coordenadas.sort_values('codigo_ibge')
+    coordenadas.to_csv(arquivo_saida, index=None, float_format='%.6f')
+
+    # Origem e data do download ao lado do CSV, para o readme e para saber quando atualizar
+    fonte = {'url': url, 'baixado_em': date.today().isoformat(), 'municipios': len(coordenadas)}
+    Path(arquivo_saida).with_suffix('.fonte.json').write_text(json.dumps(fonte, indent=2) + '\n')
+    return len(coordenadas)
 #%%
-df_ies_publicas.head()
-#%%
-arquivo_dados_especializacao = "MEC_originais/PDA_Cursos_Especializacao_Brasil.csv"
-dados_resultantes_especializacao = filtrar_cursos_especializacao(df_ies_publicas,arquivo_dados_especializacao)
-dados_resultantes_especializacao.to_csv("../especializacao_univ_publicas.csv", index=None, sep='\t')
-# Exibir os dataframes resultantes
-dados_resultantes_especializacao.head()
-
+# Execução das etapas
+#
+# As etapas formam um pequeno grafo: CAPES e MEC graduação são independentes e rodam em paralelo
+# (a base da pós, etapa capes, só junta as partições do arquivo anual mais recente);
+# a dimensão de instituições junta as duas pelo código e-MEC, e a especialização depende da graduação
+# (via criar_dataframe_ies_publicas, que pega as IES públicas da graduação pelo CODIGO_IES).
+# Cada arquivo anual da CAPES é uma etapa própria (capes_<ano...>), que grava as partições por ano em
+# dados/capes_por_ano/; elas rodam em paralelo, e o histórico de notas (historico_capes) depende de todas.
+# Um arquivo anual novo só processa a própria partição: as dos outros anos não mudaram e são puladas.
+# Cada etapa guarda a impressão digital das suas entradas e do seu código; se nada mudou desde a
+# última execução bem-sucedida e o arquivo de saída existe, a etapa é pulada.
+#
+# Uso:
+#     python3 dados/tratamento_dados.py                # roda o que estiver desatualizado
+#     python3 dados/tratamento_dados.py --forcar       # reprocessa tudo
+#     python3 dados/tratamento_dados.py capes          # só a etapa indicada (e o que depender dela)
+import argparse
+import functools
+import hashlib
+import inspect
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+PASTA_DADOS = Path(__file__).resolve().parent if '__file__' in globals() else Path.cwd()
+PASTA_SAIDA = PASTA_DADOS.parent
+ARQUIVO_ESTADO = PASTA_DADOS / '.estado_etl.json'
+
+# É necessário ajustar os nomes dos arquivos do MEC se novas versões da base de dados forem disponibilizadas.
+# Da CAPES entram todos os arquivos anuais de programas em CAPES_originais; o mais recente (último em ordem
+# de nome, que começa pelo ano) alimenta o app
+arquivo_codigos_pos = PASTA_DADOS / 'CAPES_originais/codigos_capes.csv'
+arquivos_dados_pos_anuais = sorted(PASTA_DADOS.glob('CAPES_originais/br-capes-colsucup-prog-*.csv'))
+arquivo_dados_pos = (arquivos_dados_pos_anuais[-1] if arquivos_dados_pos_anuais
+                     else PASTA_DADOS / 'CAPES_originais/br-capes-colsucup-prog-2021-2022-11-30.csv')
+pasta_particoes_capes = PASTA_DADOS / 'capes_por_ano'
+arquivo_codigos_graduacao = PASTA_DADOS / 'MEC_originais/dicionario_codigos.csv'
+arquivo_dados_graduacao = PASTA_DADOS / 'MEC_originais/PDA_Dados_Cursos_Graduacao_Brasil.csv'
+arquivo_dados_especializacao = PASTA_DADOS / 'MEC_originais/PDA_Cursos_Especializacao_Brasil.csv'
+
+arquivo_saida_pos = PASTA_SAIDA / 'mestrado_doutorado_univ_publicas.csv'
+arquivo_saida_graduacao = PASTA_SAIDA / 'graduacao_univ_publicas.csv'
+arquivo_saida_especializacao = PASTA_SAIDA / 'especializacao_univ_publicas.csv'
+arquivo_saida_historico = PASTA_SAIDA / 'historico_notas_capes.csv'
+arquivo_saida_instituicoes = PASTA_SAIDA / 'instituicoes.csv'
+arquivo_coordenadas = PASTA_DADOS / 'municipios_coordenadas.csv'
+
+
+def etapa_capes():
+    return juntar_particoes_capes(pasta_particoes_capes, arquivo_dados_pos, arquivo_saida_pos)
+
+
+def manifesto_capes_anual(arquivo):
+    return pasta_particoes_capes / f'{Path(arquivo).stem}.json'
+
+
+def etapa_capes_anual(arquivo):
+    # O manifesto (anos e linhas gravados a partir deste arquivo) marca a etapa como concluída
+    # O hash de cada partição faz o histórico ser refeito quando o conteúdo de um ano muda
+    linhas = particionar_capes_por_ano(arquivo, arquivo_codigos_pos, pasta_particoes_capes)
+    particoes = {
+        str(ano): {'linhas': n, 'sha256': hashlib.sha256(
+            (pasta_particoes_capes / f'ano={ano}' / f'{Path(arquivo).stem}.csv').read_bytes()).hexdigest()}
+        for ano, n in linhas.items()
+    }
+    manifesto_capes_anual(arquivo).write_text(json.dumps(particoes, indent=2, sort_keys=True))
+    return sum(linhas.values())
+
+
+def etapa_historico_capes():
+    return historico_notas_capes(pasta_particoes_capes, arquivos_dados_pos_anuais, arquivo_saida_historico)
+
+
+def etapa_graduacao():
+    return filtrar_dados_mec_csv(arquivo_dados_graduacao, arquivo_codigos_graduacao, arquivo_saida_graduacao)
+
+
+def etapa_instituicoes():
+    return criar_dimensao_instituicoes(arquivo_saida_graduacao, arquivo_saida_pos, arquivo_saida_instituicoes)
+
+
+def etapa_especializacao():
+    df_ies_publicas = criar_dataframe_ies_publicas(arquivo_saida_graduacao)
+    return filtrar_cursos_especializacao(df_ies_publicas, arquivo_dados_especializacao, arquivo_saida_especializacao)
+
+
+# Para cada etapa: função executada, arquivos lidos, arquivo gerado, etapas das quais depende e
+# funções cujo código entra na impressão digital (mudar o código também invalida a etapa)
+ETAPAS_CAPES_ANUAIS = {
+    f"capes_{arquivo.stem.removeprefix('br-capes-colsucup-prog-')}": {
+        'funcao': functools.partial(etapa_capes_anual, arquivo),
+        'entradas': [arquivo, arquivo_codigos_pos],
+        'saida': manifesto_capes_anual(arquivo),
+        'depende_de': [],
+        'codigo': [etapa_capes_anual, particionar_capes_por_ano, chunks_capes],
+    }
+    for arquivo in arquivos_dados_pos_anuais
+}
+
+ETAPAS = {
+    **ETAPAS_CAPES_ANUAIS,
+    # Só relê as partições (três colunas de cada); cada ano novo é processado uma vez, na sua etapa anual
+    'historico_capes': {
+        'funcao': etapa_historico_capes,
+        'entradas': [manifesto_capes_anual(arquivo) for arquivo in arquivos_dados_pos_anuais],
+        'saida': arquivo_saida_historico,
+        'depende_de': list(ETAPAS_CAPES_ANUAIS),
+        'codigo': [etapa_historico_capes, historico_notas_capes],
+    },
+    # O arquivo mais recente é lido uma vez só, na sua etapa anual; aqui só as partições dele são juntadas
+    'capes': {
+        'funcao': etapa_capes,
+        'entradas': [manifesto_capes_anual(arquivo_dados_pos)],
+        'saida': arquivo_saida_pos,
+        'depende_de': [nome for nome in ETAPAS_CAPES_ANUAIS
+                       if nome == f"capes_{arquivo_dados_pos.stem.removeprefix('br-capes-colsucup-prog-')}"],
+        'codigo': [etapa_capes, juntar_particoes_capes],
+    },
+    'graduacao': {
+        'funcao': etapa_graduacao,
+        'entradas': [arquivo_dados_graduacao, arquivo_codigos_graduacao],
+        'saida': arquivo_saida_graduacao,
+        'depende_de': [],
+        'codigo': [etapa_graduacao, filtrar_dados_mec_csv, gravar_chunks],
+    },
+    'instituicoes': {
+        'funcao': etapa_instituicoes,
+        'entradas': [arquivo_saida_graduacao, arquivo_saida_pos],
+        'saida': arquivo_saida_instituicoes,
+        'depende_de': ['graduacao', 'capes'],
+        'codigo': [etapa_instituicoes, criar_dimensao_instituicoes],
+    },
+    'especializacao': {
+        'funcao': etapa_especializacao,
+        'entradas': [arquivo_dados_especializacao, arquivo_saida_graduacao],
+        'saida': arquivo_saida_especializacao,
+        'depende_de': ['graduacao'],
+        'codigo': [etapa_especializacao, criar_dataframe_ies_publicas, filtrar_cursos_especializacao, gravar_chunks],
+    },
+}
+
+
+def impressao_digital_etapa(nome):
+    etapa = ETAPAS[nome]
+    digest = hashlib.sha256(f"chunk={TAMANHO_CHUNK}".encode())
+    for funcao in etapa['codigo']:
+        digest.update(inspect.getsource(funcao).encode())
+    for arquivo in etapa['entradas']:
+        digest.update(str(arquivo).encode())
+        with open(arquivo, 'rb') as fh:
+            for bloco in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(bloco)
+    return digest.hexdigest()
+
+
+def carregar_estado():
+    if ARQUIVO_ESTADO.exists():
+        return json.loads(ARQUIVO_ESTADO.read_text())
+    return {}
+
+
+def salvar_estado(estado):
+    ARQUIVO_ESTADO.write_text(json.dumps(estado, indent=2, sort_keys=True))
+
+
+def selecionar_etapas(pedidas):
+    # As etapas pedidas e todas as que dependem delas, direta ou indiretamente
+    selecionadas = set(pedidas or ETAPAS)
+    mudou = True
+    while mudou:
+        mudou = False
+        for nome, etapa in ETAPAS.items():
+            if nome not in selecionadas and selecionadas.intersection(etapa['depende_de']):
+                selecionadas.add(nome)
+                mudou = True
+    return selecionadas
+
+
+def executar_etapas(pedidas=None, forcar=False, max_processos=None):
+    """Executa as etapas respeitando as dependências; retorna os nomes das que falharam."""
+    selecionadas = selecionar_etapas(pedidas)
+    estado = carregar_estado()
+    concluidas, falhas = set(ETAPAS) - selecionadas, set()
+    pendentes = set(selecionadas)
+    em_execucao = {}
+
+    with ProcessPoolExecutor(max_workers=max_processos) as executor:
+        while pendentes or em_execucao:
+            prontas = [nome for nome in sorted(pendentes) if set(ETAPAS[nome]['depende_de']) <= concluidas]
+            for nome in prontas:
+                pendentes.discard(nome)
+                etapa = ETAPAS[nome]
+                try:
+                    # A impressão é calculada só agora, depois que as dependências terminaram
+                    impressao = impressao_digital_etapa(nome)
+                except OSError as e:
+                    print(f"[{nome}] falhou: {e}")
+                    falhas.add(nome)
+                    continue
+                if not forcar and estado.get(nome) == impressao and Path(etapa['saida']).exists():
+                    print(f"[{nome}] sem mudanças, pulando")
+                    concluidas.add(nome)
+                    continue
+                print(f"[{nome}] processando...")
+                em_execucao[executor.submit(etapa['funcao'])] = (nome, impressao)
+
+            # Etapas cujas dependências falharam não podem mais rodar
+            for nome in sorted(pendentes):
+                if falhas.intersection(ETAPAS[nome]['depende_de']):
+                    print(f"[{nome}] não executada: dependência falhou")
+                    pendentes.discard(nome)
+                    falhas.add(nome)
+
+            if not em_execucao:
+                continue
+            terminadas, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in terminadas:
+                nome, impressao = em_execucao.pop(futuro)
+                try:
+                    linhas = futuro.result()
+                except Exception as e:
+                    print(f"[{nome}] falhou: {e}")
+                    falhas.add(nome)
+                    continue
+                print(f"[{nome}] {linhas} linhas gravadas em {ETAPAS[nome]['saida']}")
+                estado[nome] = impressao
+                salvar_estado(estado)
+                concluidas.add(nome)
+
+    return falhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trata os dados originais do MEC e da CAPES.")
+    parser.add_argument('etapas', nargs='*', help=f"etapas a executar: {', '.join(ETAPAS)} (padrão: todas)")
+    parser.add_argument('--forcar', action='store_true', help="reprocessa mesmo sem mudanças nas entradas")
+    parser.add_argument('--processos', type=int, default=None, help="número máximo de processos em paralelo")
+    parser.add_argument('--baixar-coordenadas', nargs='?', const=URL_COORDENADAS, metavar='ORIGEM',
+                        help=f"baixa os centróides dos municípios para {arquivo_coordenadas.name} e sai; "
+                             f"ORIGEM é outro endereço ou uma cópia local do arquivo (padrão: {URL_COORDENADAS})")
+    args = parser.parse_args(argv)
+    if args.baixar_coordenadas:
+        try:
+            municipios = baixar_coordenadas_municipios(args.baixar_coordenadas, arquivo_coordenadas)
+        except OSError as erro:
+            # URLError (sem rede, endereço errado) e arquivo local inexistente
+            print(f"Erro ao baixar {args.baixar_coordenadas}: {erro}", file=sys.stderr)
+            return 1
+        print(f"{municipios} municípios gravados em {arquivo_coordenadas}")
+        return 0
+    desconhecidas = set(args.etapas) - set(ETAPAS)
+    if desconhecidas:
+        parser.error(f"etapas desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+    falhas = executar_etapas(args.etapas, forcar=args.forcar, max_processos=args.processos)
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Leitura das três bases tratadas usadas pelo app.py e snapshot colunar delas.
+
+A leitura do CSV (renomear colunas, tratar nulos, compactar) só acontece quando
+o snapshot não existe ou está desatualizado. O resultado é gravado em formato
+Arrow IPC (Feather v2) sem compressão, que pode ser mapeado em memória: o
+processo lê apenas as páginas que usa e vários processos do Streamlit na mesma
+máquina compartilham as mesmas páginas do cache do sistema operacional.
+
+Cada snapshot guarda a impressão digital (SHA-256) do CSV de origem e da
+configuração de leitura; se o CSV mudar, o snapshot é refeito automaticamente.
+
+Uso (gera os snapshots antes de subir o app):
+    python3 datasets.py
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).parent
+SNAPSHOT_DIR = ROOT / "dados" / "snapshots"
+
+# Aumente quando a leitura/limpeza das bases mudar, para invalidar os snapshots antigos
+VERSAO_SNAPSHOT = "1"
+CHAVE_METADADOS = b"guia_impressao_digital"
+
+# Modo compacto (GUIA_DADOS_COMPACTOS=1): mantém só as colunas usadas pela interface,
+# guarda os textos repetidos como categorias e reduz o tamanho dos inteiros.
+# Os downloads continuam com todas as colunas, lidas da base completa.
+MODO_COMPACTO = os.environ.get('GUIA_DADOS_COMPACTOS', '0') == '1'
+
+# Colunas com até esta proporção de valores distintos viram categorias
+LIMITE_CATEGORIA = 0.5
+
+COLUNAS_COMPACTAS = {
+    'mestrado_doutorado': ['Nome_Programa', 'Sigla_IES', 'Nome_IES', 'UF', 'Municipio', 'Area_Conhecimento',
+                           'Nota_Conceito', 'Nivel_Programa', 'Modalidade', 'Link'],
+    'graduacao': ['Nome_Curso', 'Nome_IES', 'UF', 'Municipio', 'Modalidade_Ensino', 'Grau', 'Area_Conhecimento',
+                  'Vagas autorizadas'],
+    'especializacao': ['NOME_ESPECIALIZACAO', 'NOME_IES', 'MUNICIPIO', 'UF', 'MODALIDADE', 'DURACAO_MESES',
+                       'CARGA_HORARIA', 'Area_Conhecimento', 'VAGAS'],
+}
+
+ARQUIVOS_CSV = {
+    'mestrado_doutorado': ROOT / 'mestrado_doutorado_univ_publicas.csv',
+    'graduacao': ROOT / 'graduacao_univ_publicas.csv',
+    'especializacao': ROOT / 'especializacao_univ_publicas.csv',
+}
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def compact_dataframe(df, nome_base):
+    memoria_antes = memory_mb(df)
+    df = df[COLUNAS_COMPACTAS[nome_base]].copy()
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_integer_dtype(serie):
+            df[coluna] = pd.to_numeric(serie, downcast='unsigned' if serie.min() >= 0 else 'integer')
+        elif not pd.api.types.is_numeric_dtype(serie) and serie.nunique() <= len(serie) * LIMITE_CATEGORIA:
+            # Categorias em ordem alfabética: ordenar pela categoria dá o mesmo resultado que pelo texto
+            df[coluna] = pd.Categorical(serie, categories=sorted(serie.dropna().unique()))
+    logger.info("[%s] compactação: %.1f MB -> %.1f MB", nome_base, memoria_antes, memory_mb(df))
+    return df
+
+
+# Função para ler os dados do CSV da pos-graduacao
+def parse_mestrado_doutorado(csv_file, compacto=False):
+    df = pd.read_csv(csv_file,sep='\t',index_col=None)
+
+
+    colunas_novas = {
+    'Sigla da Instituição de Ensino Superior do programa de pós-graduação': 'Sigla_IES',
+    'Nome do programa de pós-graduação': 'Nome_Programa',
+    'Área de conhecimento do programa de pós-graduação': 'Area_Conhecimento',
+    'Sigla da Unidade da Federação do programa': 'UF',
+    'Município sede do programa de pós-graduação': 'Municipio',
+    'Modalidade do programa de pós-graduação': 'Modalidade',
+    'Nível do programa de pós-graduação': 'Nivel_Programa',
+    'Nota/Conceito do programa de pós-graduação': 'Nota_Conceito',
+    'Instituição de Ensino Superior do programa de pós-graduação': 'Nome_IES'
+    }
+    df.rename(columns=colunas_novas, inplace=True)
+    df['Nota_Conceito'] = df['Nota_Conceito'].fillna("Não informado").astype(str)
+
+    if compacto:
+        df = compact_dataframe(df, 'mestrado_doutorado')
+    return df
+
+
+# Função para ler os dados do CSV da graduacao
+def parse_graduacao(csv_file, compacto=False):
+    df = pd.read_csv(csv_file, sep='\t', index_col=None)
+
+    # Novo mapeamento de colunas
+    colunas_novas = {
+        'Nome da IES': 'Nome_IES',
+        'Nome do curso': 'Nome_Curso',
+        'Grau': 'Grau',
+        'Área OCDE': 'Area_Conhecimento',
+        'Modalidade de ensino (presencial ou EaD)': 'Modalidade_Ensino',
+        'Município': 'Municipio',
+        'UF': 'UF',
+        }
+
+    df.rename(columns=colunas_novas, inplace=True)
+
+    # Você pode adicionar aqui qualquer outra operação que deseje realizar no DataFrame
+    # Por exemplo, tratar colunas com valores nulos, converter tipos de dados, etc.
+
+    if compacto:
+        df = compact_dataframe(df, 'graduacao')
+    return df
+
+
+def parse_especializacao(csv_file, compacto=False):
+    df = pd.read_csv(csv_file, sep='\t', index_col=None)
+    if compacto:
+        df = compact_dataframe(df, 'especializacao')
+    return df
+
+
+PARSERS = {
+    'mestrado_doutorado': parse_mestrado_doutorado,
+    'graduacao': parse_graduacao,
+    'especializacao': parse_especializacao,
+}
+
+
+def source_fingerprint(csv_file, compacto):
+    """Impressão digital do CSV de origem somada à configuração de leitura."""
+    digest = hashlib.sha256()
+    digest.update(f"{VERSAO_SNAPSHOT}|compacto={compacto}|".encode())
+    with open(csv_file, 'rb') as fh:
+        for bloco in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def source_stamp(arquivo):
+    """Carimbo barato do arquivo, ``(mtime_ns, tamanho)``, ou ``None`` se ele não existir.
+
+    Serve de chave para os caches do app.py: muda quando o arquivo é trocado,
+    sem ler o conteúdo a cada execução.
+    """
+    try:
+        info = os.stat(arquivo)
+    except FileNotFoundError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+def snapshot_path(nome_base, compacto):
+    sufixo = '-compacto' if compacto else ''
+    return SNAPSHOT_DIR / f"{nome_base}{sufixo}.arrow"
+
+
+def write_snapshot(df, destino, impressao_digital):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadados = dict(table.schema.metadata or {})
+    metadados[CHAVE_METADADOS] = impressao_digital.encode()
+    table = table.replace_schema_metadata(metadados)
+
+    # Grava num arquivo temporário e troca de uma vez, para que outro processo
+    # nunca mapeie um snapshot pela metade
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh, pa.ipc.new_file(fh, table.schema) as writer:
+            writer.write_table(table)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+def read_snapshot(origem, impressao_digital):
+    """Mapeia o snapshot em memória; retorna ``None`` se faltar ou estiver velho."""
+    if not origem.exists():
+        return None
+    reader = pa.ipc.open_file(pa.memory_map(str(origem), 'r'))
+    metadados = reader.schema.metadata or {}
+    if metadados.get(CHAVE_METADADOS) != impressao_digital.encode():
+        return None
+    # Colunas numéricas e de texto (com pandas usando strings Arrow) apontam
+    # direto para as páginas mapeadas, sem cópia
+    return reader.read_all().to_pandas(split_blocks=True)
+
+
+def load_dataset(nome_base, csv_file, compacto=MODO_COMPACTO):
+    """Carrega a base pelo snapshot colunar, refazendo-o se o CSV mudou."""
+    impressao_digital = source_fingerprint(csv_file, compacto)
+    destino = snapshot_path(nome_base, compacto)
+    df = read_snapshot(destino, impressao_digital)
+    if df is None:
+        df = PARSERS[nome_base](csv_file, compacto)
+        write_snapshot(df, destino, impressao_digital)
+        df = read_snapshot(destino, impressao_digital)
+    # Versão dos dados, usada como chave dos caches derivados (exportações)
+    df.attrs['versao'] = impressao_digital
+    logger.info("[%s] %d linhas, %d colunas, %.1f MB (compacto=%s)",
+                nome_base, len(df), len(df.columns), memory_mb(df), compacto)
+    return df
+
+
+def build_snapshots(compacto=MODO_COMPACTO):
+    for nome_base, csv_file in ARQUIVOS_CSV.items():
+        load_dataset(nome_base, csv_file, compacto)
+        print(f"Snapshot de {nome_base} atualizado em {snapshot_path(nome_base, compacto)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    build_snapshots()
@@ -1,7 +1,16 @@
 const DB_URL = "./public/data/guia.sqlite.gz";
-const DB_CACHE_KEY = "guia-sqlite-v3";
-const GRID_LIMIT = 400;
+// Versão do .gz gravada pelo build; a cópia no IndexedDB é guardada sob
+// DB_CACHE_PREFIX + versão, e as de outras versões são apagadas
+const DB_VERSION_URL = "./public/data/guia.versao.json";
+const DB_CACHE_PREFIX = "guia-sqlite-";
+// Tipo de cada filtro por tabela e coluna, gerado por filter_spec.py (o mesmo
+// que o app Streamlit e o query_service usam)
+const FILTER_SPEC_URL = "./public/data/filtros.json";
 const PAGE_SIZE = 50;
+// A grade busca blocos de uma página mais uma de folga e guarda no máximo
+// MAX_BLOCKS blocos na memória; páginas mais distantes são buscadas de novo.
+const BLOCK_SIZE = PAGE_SIZE * 2;
+const MAX_BLOCKS = 10;
 const DEFAULT_VISIBLE_COLS = 3;
 
 const datasets = {
@@ -10,6 +19,7 @@ const datasets = {
     label: "Graduação",
     table: "graduacao",
     orderBy: "nome_curso, nome_ies, municipio",
+    fts: { table: "graduacao_fts", columns: ["nome_curso", "nome_ies", "area_conhecimento"] },
     columns: [
       
       { id: "nome_ies", name: "Instituição" },
@@ -22,7 +32,7 @@ const datasets = {
       { id: "vagas_autorizadas", name: "Vagas autorizadas" },
     ],
     filters: [
-      { type: "multi", id: "grad-curso", column: "nome_curso", operator: "like", label: "Nome do curso", placeholder: "Filtrar curso" },
+      { type: "multi", id: "grad-curso", column: "nome_curso", label: "Nome do curso", placeholder: "Filtrar curso" },
       { type: "multi", id: "grad-area", column: "area_conhecimento", label: "Área de conhecimento", placeholder: "Filtrar área" },
       { type: "multi", id: "grad-ies", column: "nome_ies", label: "Instituição", placeholder: "Filtrar instituição" },
       { type: "multi", id: "grad-uf", column: "uf", label: "UF", placeholder: "Filtrar estado" },
@@ -40,6 +50,7 @@ const datasets = {
     label: "Especialização",
     table: "especializacao",
     orderBy: "nome_especializacao, nome_ies, municipio",
+    fts: { table: "especializacao_fts", columns: ["nome_especializacao", "nome_ies", "area_conhecimento"] },
     columns: [
       
       { id: "nome_ies", name: "Instituição" },
@@ -88,6 +99,7 @@ const datasets = {
     label: "Mestrado/Doutorado",
     table: "pos",
     orderBy: "nome_programa, sigla_ies, municipio",
+    fts: { table: "pos_fts", columns: ["nome_programa", "nome_ies", "sigla_ies", "area_conhecimento"] },
     columns: [
       { id: "sigla_ies", name: "Sigla Instituição" },
       { id: "nome_programa", name: "Programa" },
@@ -101,8 +113,8 @@ const datasets = {
       { id: "link", name: "Mais informações" },
     ],
     filters: [
-      { type: "multi", id: "pos-nome", column: "nome_programa", operator: "like", label: "Programa", placeholder: "Filtrar pelo nome do programa" },
-      { type: "multi", id: "pos-nivel", column: "nivel_programa", operator: "like", label: "Nível", placeholder: "Filtrar nível" },
+      { type: "multi", id: "pos-nome", column: "nome_programa", label: "Programa", placeholder: "Filtrar pelo nome do programa" },
+      { type: "multi", id: "pos-nivel", column: "nivel_programa", label: "Nível", placeholder: "Filtrar nível" },
       { type: "multi", id: "pos-area", column: "area_conhecimento", label: "Área de conhecimento", placeholder: "Filtrar área" },
       { type: "multi", id: "pos-nota", column: "nota_conceito", label: "Nota CAPES", placeholder: "Filtrar nota" },
       { type: "multi", id: "pos-modalidade", column: "modalidade", label: "Modalidade", placeholder: "Filtrar modalidade" },
@@ -118,10 +130,12 @@ const datasets = {
 };
 
 let db;
+let filterSpec;
 const gridInstances = {};
-const lastData = {};
+const lastQuery = {};
 const loadedTabs = new Set();
 const selectedColumns = {};
+const ftsAvailable = {};
 
 function buildPanels() {
   const root = document.getElementById("tabPanels");
@@ -308,7 +322,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
 async function init() {
   setStatus("Baixando base SQLite (cache em IndexedDB)...");
-  db = await loadDatabase();
+  [db, filterSpec] = await Promise.all([loadDatabase(), loadFilterSpec()]);
   setStatus("Base carregada. Monte seus filtros e consulte.");
 
   buildPanels();
@@ -325,12 +339,13 @@ async function loadDatabase() {
     locateFile: (file) => `https://cdn.jsdelivr.net/npm/sql.js@1.11.0/dist/${file}`,
   });
 
-  const cached = await localforage.getItem(DB_CACHE_KEY);
+  const cacheKey = await databaseCacheKey();
+  const cached = cacheKey ? await localforage.getItem(cacheKey) : null;
   let bytes;
   if (cached) {
     bytes = new Uint8Array(cached);
   } else {
-    const resp = await fetch(DB_URL);
+    const resp = await fetch(DB_URL, { cache: "no-cache" });
     const compressed = new Uint8Array(await resp.arrayBuffer());
     try {
       bytes = pako.ungzip(compressed);
@@ -338,37 +353,102 @@ async function loadDatabase() {
       console.error("Erro ao descompactar, usando arquivo original", err);
       bytes = compressed;
     }
-    await localforage.setItem(DB_CACHE_KEY, bytes);
+    if (cacheKey) {
+      await dropOtherVersions(cacheKey);
+      await localforage.setItem(cacheKey, bytes);
+    }
   }
 
   return new SQL.Database(bytes);
 }
 
+// Sem o arquivo de versão o banco é baixado de novo e não é guardado
+async function databaseCacheKey() {
+  try {
+    const resp = await fetch(DB_VERSION_URL, { cache: "no-cache" });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    const { versao, esquema } = await resp.json();
+    return `${DB_CACHE_PREFIX}${esquema}-${versao}`;
+  } catch (err) {
+    console.warn("Versão do banco indisponível, ignorando o cache", err);
+    return null;
+  }
+}
+
+async function dropOtherVersions(cacheKey) {
+  const keys = await localforage.keys();
+  await Promise.all(
+    keys.filter((k) => k.startsWith(DB_CACHE_PREFIX) && k !== cacheKey).map((k) => localforage.removeItem(k))
+  );
+}
+
+async function loadFilterSpec() {
+  const resp = await fetch(FILTER_SPEC_URL, { cache: "no-cache" });
+  if (!resp.ok) throw new Error(`Especificação dos filtros indisponível (${resp.status})`);
+  return resp.json();
+}
+
 async function hydrateFilters() {
+  // Bancos com as tabelas facetas/faixas preenchem tudo numa leitura;
+  // os antigos caem no DISTINCT por coluna e no MIN/MAX
+  const facets = loadFacets();
+  const ranges = loadRanges();
   await Promise.all(
     Object.entries(datasets).map(async ([key, cfg]) => {
       for (const filter of cfg.filters) {
-        if (filter.type !== "multi") continue;
-        const values = await distinctValues(cfg.table, filter.column);
-        fillSelect(filter.id, values, cfg.defaults?.[filter.id]);
+        if (filter.type === "multi") {
+          const facet = facets?.[cfg.table]?.[filter.column];
+          const values = facet ? facet.map((f) => f.value) : await distinctValues(cfg.table, filter.column);
+          const counts = facet ? new Map(facet.map((f) => [f.value, f.count])) : null;
+          fillSelect(filter.id, values, cfg.defaults?.[filter.id], counts);
+        } else if (filter.type === "range") {
+          const range = ranges?.[cfg.table]?.[filter.column] ?? columnRange(cfg.table, filter.column);
+          if (range.min !== null) document.getElementById(filter.minId).placeholder = range.min;
+          if (range.max !== null) document.getElementById(filter.maxId).placeholder = range.max;
+        }
       }
     })
   );
+}
 
-  const rangeStmt = db.prepare(
-    "SELECT MIN(carga_horaria) AS min_ch, MAX(carga_horaria) AS max_ch, MIN(duracao_meses) AS min_dm, MAX(duracao_meses) AS max_dm FROM especializacao"
-  );
-  rangeStmt.step();
-  const range = rangeStmt.getAsObject();
-  rangeStmt.free();
-  const chMin = document.getElementById("esp-carga-min");
-  const chMax = document.getElementById("esp-carga-max");
-  const duMin = document.getElementById("esp-duracao-min");
-  const duMax = document.getElementById("esp-duracao-max");
-  if (range.min_ch !== null) chMin.placeholder = range.min_ch;
-  if (range.max_ch !== null) chMax.placeholder = range.max_ch;
-  if (range.min_dm !== null) duMin.placeholder = range.min_dm;
-  if (range.max_dm !== null) duMax.placeholder = range.max_dm;
+function tableExists(name) {
+  const stmt = db.prepare("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?");
+  stmt.bind([name]);
+  const exists = stmt.step();
+  stmt.free();
+  return exists;
+}
+
+function loadFacets() {
+  if (!tableExists("facetas")) return null;
+  const facets = {};
+  const stmt = db.prepare("SELECT tabela, coluna, valor, contagem FROM facetas ORDER BY tabela, coluna, ordem");
+  while (stmt.step()) {
+    const [table, column, value, count] = stmt.get();
+    ((facets[table] ??= {})[column] ??= []).push({ value, count });
+  }
+  stmt.free();
+  return facets;
+}
+
+function loadRanges() {
+  if (!tableExists("faixas")) return null;
+  const ranges = {};
+  const stmt = db.prepare("SELECT tabela, coluna, minimo, maximo, histograma FROM faixas");
+  while (stmt.step()) {
+    const [table, column, min, max, histogram] = stmt.get();
+    (ranges[table] ??= {})[column] = { min, max, histogram: JSON.parse(histogram) };
+  }
+  stmt.free();
+  return ranges;
+}
+
+function columnRange(table, column) {
+  const stmt = db.prepare(`SELECT MIN(${column}) AS min, MAX(${column}) AS max FROM ${table}`);
+  stmt.step();
+  const range = stmt.getAsObject();
+  stmt.free();
+  return range;
 }
 
 function distinctValues(table, column) {
@@ -382,11 +462,11 @@ function distinctValues(table, column) {
   return values;
 }
 
-function fillSelect(id, values, defaults = []) {
+function fillSelect(id, values, defaults = [], counts = null) {
   const target = document.getElementById(id);
   if (!target) return;
   if (isMultiBox(target)) {
-    fillMultiBox(target, values, defaults);
+    fillMultiBox(target, values, defaults, counts);
     return;
   }
 
@@ -406,7 +486,7 @@ function isMultiBox(el) {
   return el?.dataset?.multibox === "true";
 }
 
-function fillMultiBox(container, values, defaults = []) {
+function fillMultiBox(container, values, defaults = [], counts = null) {
   const optionsWrapper = container.querySelector(".multi-options");
   if (!optionsWrapper) return;
   const search = container.querySelector(".multi-search");
@@ -431,6 +511,12 @@ function fillMultiBox(container, values, defaults = []) {
     label.setAttribute("for", checkbox.id);
     label.appendChild(checkbox);
     label.appendChild(span);
+    if (counts?.has(val)) {
+      const badge = document.createElement("span");
+      badge.className = "badge text-bg-light";
+      badge.textContent = counts.get(val);
+      label.appendChild(badge);
+    }
     optionsWrapper.appendChild(label);
   });
 
@@ -455,7 +541,7 @@ function filterMultiBox(container, term) {
   const normalized = term.trim().toLowerCase();
   let visible = 0;
   container.querySelectorAll(".form-check").forEach((row) => {
-    const text = row.textContent.toLowerCase();
+    const text = (row.querySelector(".form-check-label") ?? row).textContent.toLowerCase();
     const show = !normalized || text.includes(normalized);
     row.style.display = show ? "" : "none";
     if (show) visible++;
@@ -554,45 +640,101 @@ function resetMulti(id, defaults = []) {
   }
 }
 
+// Conta o total exato uma vez e deixa a grade buscar só os blocos que exibe
 async function runQuery(key) {
   const cfg = datasets[key];
-  const selectedIds = cfg.columns.map((c) => c.id);
   const { where, params } = buildWhere(cfg);
-  const sql = `SELECT ${selectedIds.join(", ")} FROM ${cfg.table} ${where} ORDER BY ${cfg.orderBy} LIMIT ${GRID_LIMIT}`;
+  const countStmt = db.prepare(`SELECT count(*) AS total FROM ${cfg.table} ${where}`);
+  countStmt.bind(params);
+  countStmt.step();
+  const total = countStmt.getAsObject().total;
+  countStmt.free();
+  lastQuery[key] = { where, params, total };
+  renderAgGrid(key, cfg, lastQuery[key]);
+  setStatus(`Resultados ${cfg.label}: ${total.toLocaleString("pt-BR")}.`);
+}
+
+// ORDER BY da ordenação escolhida na grade (só colunas conhecidas) ou o padrão
+function orderClause(cfg, sortModel) {
+  const known = new Set(cfg.columns.map((c) => c.id));
+  const parts = (sortModel ?? [])
+    .filter((s) => known.has(s.colId))
+    .map((s) => `${s.colId} ${s.sort === "desc" ? "DESC" : "ASC"}`);
+  // id desempata: OFFSET precisa de uma ordem total para não repetir nem pular linhas
+  return `ORDER BY ${parts.length ? parts.join(", ") : cfg.orderBy}, id`;
+}
+
+function selectRows(cfg, query, sortModel, limit = null, offset = 0) {
+  const selectedIds = cfg.columns.map((c) => c.id);
+  const page = limit === null ? "" : ` LIMIT ${limit} OFFSET ${offset}`;
+  const sql = `SELECT ${selectedIds.join(", ")} FROM ${cfg.table} ${query.where} ${orderClause(cfg, sortModel)}${page}`;
   const stmt = db.prepare(sql);
-  stmt.bind(params);
-  const rows = [];
-  while (stmt.step()) {
-    rows.push(stmt.getAsObject());
+  stmt.bind(query.params);
+  return stmt;
+}
+
+function makeDatasource(cfg, query) {
+  return {
+    rowCount: query.total,
+    getRows: (params) => {
+      const stmt = selectRows(cfg, query, params.sortModel, params.endRow - params.startRow, params.startRow);
+      const rows = [];
+      while (stmt.step()) {
+        rows.push(stmt.getAsObject());
+      }
+      stmt.free();
+      params.successCallback(rows, query.total);
+    },
+  };
+}
+
+// Bancos gerados antes das tabelas FTS5 (ou um sql.js sem FTS5) caem no LIKE
+function hasFts(cfg) {
+  if (!cfg.fts) return false;
+  if (!(cfg.table in ftsAvailable)) {
+    try {
+      db.exec(`SELECT rowid FROM ${cfg.fts.table} WHERE ${cfg.fts.table} MATCH 'a' LIMIT 1`);
+      ftsAvailable[cfg.table] = true;
+    } catch (err) {
+      console.warn(`Busca textual indisponível em ${cfg.table}, usando LIKE`, err);
+      ftsAvailable[cfg.table] = false;
+    }
   }
-  stmt.free();
-  lastData[key] = rows;
-  renderAgGrid(key, cfg, rows);
-  setStatus(`Resultados ${cfg.label}: ${rows.length}.`);
+  return ftsAvailable[cfg.table];
+}
+
+// Frase com o último termo como prefixo: "engenharia civ" acha "ENGENHARIA CIVIL"
+function ftsPhrase(term) {
+  return `"${term.replace(/"/g, '""')}"*`;
 }
 
+function textClause(cfg, column, terms) {
+  if (hasFts(cfg) && cfg.fts.columns.includes(column)) {
+    return {
+      clause: `id IN (SELECT rowid FROM ${cfg.fts.table} WHERE ${cfg.fts.table} MATCH ?)`,
+      params: [`${column} : (${terms.map(ftsPhrase).join(" OR ")})`],
+    };
+  }
+  return {
+    clause: `(${terms.map(() => `${column} LIKE ?`).join(" OR ")})`,
+    params: terms.map((t) => `%${t}%`),
+  };
+}
+
+// Tipos dos filtros vêm de filtros.json: "valores" vira IN, "contem" e os de
+// busca viram busca textual e "intervalo" vira mínimo/máximo inclusivos
 function buildWhere(cfg) {
   const clauses = [];
   const params = [];
+  const addText = (column, terms) => {
+    const text = textClause(cfg, column, terms);
+    clauses.push(text.clause);
+    params.push(...text.params);
+  };
   cfg.filters.forEach((filter) => {
-    if (filter.type === "multi") {
-      const values = getMultiValues(filter.id);
-      if (values.length) {
-        if (filter.operator === "like") {
-          clauses.push(`(${values.map(() => `${filter.column} LIKE ?`).join(" OR ")})`);
-          params.push(...values.map((v) => `%${v}%`));
-        } else {
-          clauses.push(`${filter.column} IN (${values.map(() => "?").join(", ")})`);
-          params.push(...values);
-        }
-      }
-    } else if (filter.type === "text") {
-      const text = document.getElementById(filter.id).value.trim();
-      if (text) {
-        clauses.push(`${filter.column} LIKE ?`);
-        params.push(`%${text}%`);
-      }
-    } else if (filter.type === "range") {
+    const spec = filterSpec[cfg.table]?.[filter.column];
+    if (!spec) throw new Error(`Filtro ${cfg.table}.${filter.column} fora de filtros.json`);
+    if (spec.tipo === "intervalo") {
       const minVal = document.getElementById(filter.minId).value;
       const maxVal = document.getElementById(filter.maxId).value;
       if (minVal) {
@@ -603,6 +745,18 @@ function buildWhere(cfg) {
         clauses.push(`${filter.column} <= ?`);
         params.push(Number(maxVal));
       }
+      return;
+    }
+    const values =
+      filter.type === "text"
+        ? [document.getElementById(filter.id).value.trim()].filter(Boolean)
+        : getMultiValues(filter.id);
+    if (!values.length) return;
+    if (spec.tipo === "contem" || spec.busca) {
+      addText(filter.column, values);
+    } else {
+      clauses.push(`${filter.column} IN (${values.map(() => "?").join(", ")})`);
+      params.push(...values);
     }
   });
   const where = clauses.length ? `WHERE ${clauses.join(" AND ")}` : "";
@@ -621,27 +775,31 @@ function getMultiValues(id) {
   return [];
 }
 
-function renderAgGrid(key, cfg, rows) {
+function renderAgGrid(key, cfg, query) {
   const container = document.getElementById(`grid-ag-${key}`);
   if (!container || typeof agGrid === "undefined") return;
   const colDefs = buildAgColumns(cfg.columns, new Set(getSelectedColumns(key)));
+  const datasource = makeDatasource(cfg, query);
   if (gridInstances[key]) {
     gridInstances[key].api.setColumnDefs(colDefs);
-    gridInstances[key].api.setRowData(rows);
+    gridInstances[key].api.setGridOption("datasource", datasource);
     gridInstances[key].api.sizeColumnsToFit();
     return;
   }
+  // Modelo infinito: a ordenação e a paginação são feitas no SQLite e a grade
+  // só guarda os blocos visitados. Nele todas as linhas têm a mesma altura,
+  // então textos longos aparecem inteiros no tooltip.
   const gridOptions = {
     columnDefs: colDefs,
-    rowData: rows,
+    rowModelType: "infinite",
+    datasource,
+    cacheBlockSize: BLOCK_SIZE,
+    maxBlocksInCache: MAX_BLOCKS,
     defaultColDef: {
       sortable: true,
-      filter: true,
       resizable: true,
       minWidth: 140,
       flex: 1,
-      wrapText: true,
-      autoHeight: true,
     },
     pagination: true,
     paginationPageSize: PAGE_SIZE,
@@ -676,31 +834,39 @@ function buildAgColumns(columns, selectedSet) {
     return {
       headerName: col.name,
       field: col.id,
+      tooltipField: col.id,
       hide: !safeSet.has(col.id),
     };
   });
 }
 
+// Exporta todas as linhas do filtro atual, na ordem escolhida na grade
 function downloadCsv(key) {
-  const rows = lastData[key] ?? [];
-  if (!rows.length) {
+  const query = lastQuery[key];
+  if (!query?.total) {
     alert("Nenhum dado para exportar. Rode uma consulta antes.");
     return;
   }
-  const header = datasets[key].columns.map((c) => c.id);
-  const csv = [header.join(",")].concat(
-    rows.map((row) =>
-      header
-        .map((h) => {
-          const value = row[h] ?? "";
+  const cfg = datasets[key];
+  const header = cfg.columns.map((c) => c.id);
+  const sortModel = gridInstances[key]?.api.getColumnState().filter((c) => c.sort).map((c) => ({ colId: c.colId, sort: c.sort }));
+  const stmt = selectRows(cfg, query, sortModel);
+  const csv = [header.join(",")];
+  while (stmt.step()) {
+    const row = stmt.get();
+    csv.push(
+      row
+        .map((value) => {
+          value = value ?? "";
           if (typeof value === "string" && /[,\n"]/.test(value)) {
             return `"${value.replace(/"/g, '""')}"`;
           }
           return value;
         })
         .join(",")
-    )
-  );
+    );
+  }
+  stmt.free();
   const blob = new Blob([csv.join("\n")], { type: "text/csv;charset=utf-8;" });
   const link = document.createElement("a");
   link.href = URL.createObjectURL(blob);
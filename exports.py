@@ -0,0 +1,161 @@
+"""
+Arquivos de download do app.py: bases completas e resultados filtrados.
+
+A base completa de cada aba é exportada uma única vez por versão dos dados (a
+mesma impressão digital usada pelo snapshot em datasets.py) em CSV, CSV
+comprimido com gzip e Parquet. O arquivo fica em disco ao lado dos snapshots,
+para ser reaproveitado por todos os processos do Streamlit na máquina, e os
+bytes ficam num cache LRU limitado por tamanho no processo depois do primeiro
+download.
+
+Os resultados filtrados são escritos em blocos de linhas, sem montar o CSV
+inteiro como texto antes de codificá-lo, e guardados num cache LRU limitado
+por tamanho. A chave é a base, a versão dos dados e uma assinatura das linhas
+selecionadas (na ordem de exibição), então filtros diferentes que resultam nas
+mesmas linhas reaproveitam o mesmo arquivo.
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from datasets import SNAPSHOT_DIR
+from result_cache import LRUCache
+
+EXPORT_DIR = SNAPSHOT_DIR / "exports"
+
+# formato -> (rótulo, extensão, MIME)
+FORMATOS = {
+    'csv': ('CSV', '.csv', 'text/csv'),
+    'csv.gz': ('CSV compactado (gzip)', '.csv.gz', 'application/gzip'),
+    'parquet': ('Parquet', '.parquet', 'application/vnd.apache.parquet'),
+}
+
+LINHAS_POR_BLOCO = 5000
+
+# Teto de memória dos CSVs filtrados guardados (somados) no processo
+LIMITE_CACHE_FILTRADOS = 64 * 1024 ** 2
+
+
+def write_csv(df, fh):
+    """Escreve o CSV em ``fh`` (binário) de ``LINHAS_POR_BLOCO`` em ``LINHAS_POR_BLOCO`` linhas."""
+    texto = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+    try:
+        for inicio in range(0, max(len(df), 1), LINHAS_POR_BLOCO):
+            df.iloc[inicio:inicio + LINHAS_POR_BLOCO].to_csv(texto, index=False, header=inicio == 0)
+        texto.flush()
+    finally:
+        # Devolve o arquivo binário aberto para quem chamou
+        texto.detach()
+
+
+def write_export(df, formato, fh):
+    if formato == 'csv':
+        write_csv(df, fh)
+    elif formato == 'csv.gz':
+        # mtime=0: a mesma base gera sempre o mesmo arquivo
+        with gzip.GzipFile(fileobj=fh, mode='wb', compresslevel=6, mtime=0) as comprimido:
+            write_csv(df, comprimido)
+    elif formato == 'parquet':
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), fh, row_group_size=LINHAS_POR_BLOCO)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+
+def export_bytes(df, formato='csv'):
+    buffer = io.BytesIO()
+    write_export(df, formato, buffer)
+    return buffer.getvalue()
+
+
+# Nome dos arquivos das bases completas: base, 16 primeiros dígitos da versão
+# (hexadecimal) e extensão do formato
+DIGITOS_VERSAO = 16
+
+
+def full_export_path(nome_base, versao, formato):
+    return EXPORT_DIR / f"{nome_base}-{versao[:DIGITOS_VERSAO]}{FORMATOS[formato][1]}"
+
+
+def full_export_pattern(nome_base, formato):
+    """Expressão que casa só os arquivos de ``full_export_path`` desta base e formato, de qualquer versão."""
+    return re.compile(rf"{re.escape(nome_base)}-[0-9a-f]{{{DIGITOS_VERSAO}}}{re.escape(FORMATOS[formato][1])}")
+
+
+def write_full_export(df, destino, formato):
+    # Mesmo esquema do snapshot: grava num temporário e troca de uma vez, para
+    # que outro processo nunca sirva um arquivo pela metade
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            write_export(df, formato, fh)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+
+
+# Teto de memória das bases completas guardadas (somadas) no processo
+LIMITE_CACHE_COMPLETAS = 128 * 1024 ** 2
+
+cache_completas = LRUCache(LIMITE_CACHE_COMPLETAS)
+
+# Um lock por (base, versão, formato): duas sessões pedindo o mesmo arquivo
+# esperam uma pela outra, mas exportações diferentes rodam em paralelo
+_locks_completas = {}
+_lock_locks = threading.Lock()
+
+
+def _full_export_lock(chave):
+    with _lock_locks:
+        # Locks de versões anteriores da mesma base e formato não serão mais usados
+        for antiga in [c for c in _locks_completas if c[0] == chave[0] and c[2] == chave[2] and c[1] != chave[1]]:
+            del _locks_completas[antiga]
+        return _locks_completas.setdefault(chave, threading.Lock())
+
+
+def full_export(nome_base, df, formato='csv'):
+    """Bytes da base completa, gerados uma vez por versão dos dados."""
+    versao = df.attrs['versao']
+    chave = (nome_base, versao, formato)
+
+    def gerar():
+        destino = full_export_path(nome_base, versao, formato)
+        if not destino.exists():
+            write_full_export(df, destino, formato)
+            padrao = full_export_pattern(nome_base, formato)
+            for antigo in EXPORT_DIR.iterdir():
+                if antigo != destino and padrao.fullmatch(antigo.name):
+                    antigo.unlink(missing_ok=True)
+        # Versões anteriores da mesma base não serão mais pedidas
+        cache_completas.invalidate(lambda c: c[0] == nome_base and c[2] == formato and c[1] != versao)
+        return destino.read_bytes()
+
+    with _full_export_lock(chave):
+        return cache_completas.get_or_build(chave, gerar)
+
+
+cache_filtrados = LRUCache(LIMITE_CACHE_FILTRADOS)
+
+
+def filtered_signature(df):
+    """Assinatura das linhas de ``df`` (rótulos do índice, na ordem) e das colunas."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(df.index.to_numpy().tobytes())
+    digest.update('\x1f'.join(map(str, df.columns)).encode())
+    return digest.hexdigest()
+
+
+def filtered_csv(nome_base, df):
+    """CSV do resultado filtrado, reaproveitado enquanto as mesmas linhas forem pedidas."""
+    chave = (nome_base, df.attrs['versao'], filtered_signature(df))
+    return cache_filtrados.get_or_build(chave, lambda: export_bytes(df, 'csv'))
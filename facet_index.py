@@ -0,0 +1,177 @@
+"""
+Índice de facetas em bitmaps para os filtros em cascata do app.py.
+
+O índice é construído uma única vez por base carregada. Para cada par
+(coluna, valor) ele guarda as linhas em que o valor aparece, em formato
+comprimido: valores raros ficam como lista ordenada de posições e valores
+frequentes como bitmap empacotado (1 bit por linha). As seleções dos filtros
+viram bitmaps que são combinados com ``&``; a lista de opções de cada filtro e
+a contagem por opção saem desses bitmaps, sem varrer o DataFrame de novo.
+
+Duas estruturas evitam trabalho a cada interação:
+
+- a ordem de exibição (``sort_by``) é calculada uma vez, como permutação das
+  linhas; o resultado filtrado sai nessa ordem aplicando o bitmap à
+  permutação, sem ordenar de novo;
+- as colunas numéricas guardam as posições das linhas ordenadas pelo valor, e
+  um filtro de intervalo vira duas buscas binárias e uma fatia contígua.
+"""
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+# Abaixo desta densidade a lista de posições ocupa menos que o bitmap (4 bytes
+# por linha contra 1 bit por linha do total).
+DENSIDADE_BITMAP = 1 / 32
+
+
+def _to_python(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class FacetIndex:
+    """Mapa (coluna, valor) -> linhas, com operações sobre bitmaps empacotados.
+
+    Os bitmaps usados na API pública são ``np.ndarray`` de ``uint8`` gerados
+    por ``np.packbits`` (ordem de bits "little") e podem ser combinados
+    diretamente com ``&`` e ``|``.
+    """
+
+    def __init__(self, df, columns, sort_by=()):
+        self.n_rows = len(df)
+        self._codes = {}
+        self._values = {}
+        self._postings = {}
+        self._sorted = {}
+        for column in columns:
+            self._add_column(column, df[column])
+        # Mesma ordem de df.sort_values(sort_by) (estável) sobre qualquer subconjunto
+        if sort_by:
+            order = df[list(sort_by)].reset_index(drop=True).sort_values(list(sort_by), kind="stable").index
+            self._display_order = order.to_numpy().astype(np.uint32)
+        else:
+            self._display_order = np.arange(self.n_rows, dtype=np.uint32)
+
+    def _add_column(self, column, series):
+        codes, uniques = pd.factorize(series, sort=True)
+        codes = codes.astype(np.int32, copy=False)
+        values = [_to_python(v) for v in np.asarray(uniques)]
+
+        # Posições de cada valor, agrupadas a partir de uma única ordenação
+        # estável dos códigos (nulos ficam com código -1 e são ignorados).
+        order = np.argsort(codes, kind="stable").astype(np.uint32)
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        postings = []
+        for i in range(len(values)):
+            rows = order[bounds[i]:bounds[i + 1]]
+            if len(rows) >= self.n_rows * DENSIDADE_BITMAP:
+                postings.append(self._rows_to_bitmap(rows))
+            else:
+                postings.append(rows)
+
+        self._codes[column] = codes
+        self._values[column] = values
+        self._postings[column] = postings
+        if pd.api.types.is_numeric_dtype(series):
+            # Linhas ordenadas pelo valor e início de cada valor distinto nessa ordem
+            self._sorted[column] = (order, bounds)
+
+    def _rows_to_bitmap(self, rows):
+        flags = np.zeros(self.n_rows, dtype=bool)
+        flags[rows] = True
+        return np.packbits(flags, bitorder="little")
+
+    def _posting_bitmap(self, posting):
+        if posting.dtype == np.uint8:
+            return posting
+        return self._rows_to_bitmap(posting)
+
+    def select_rows(self, rows):
+        """Bitmap das linhas nas posições ``rows``, vindas de outro índice (ex.: geo_index)."""
+        return self._rows_to_bitmap(rows)
+
+    def all_rows(self):
+        """Bitmap com todas as linhas marcadas."""
+        return np.packbits(np.ones(self.n_rows, dtype=bool), bitorder="little")
+
+    def empty(self):
+        """Bitmap sem nenhuma linha marcada."""
+        return np.packbits(np.zeros(self.n_rows, dtype=bool), bitorder="little")
+
+    def _select_positions(self, column, positions):
+        postings = self._postings[column]
+        bitmap = self.empty()
+        sparse = []
+        for pos in positions:
+            posting = postings[pos]
+            if posting.dtype == np.uint8:
+                bitmap |= posting
+            else:
+                sparse.append(posting)
+        if sparse:
+            bitmap |= self._rows_to_bitmap(np.concatenate(sparse))
+        return bitmap
+
+    def select(self, column, values):
+        """Bitmap das linhas cujo valor em ``column`` está em ``values``.
+
+        Uma seleção vazia não filtra nada, como nos multiselects do app.
+        """
+        if not values:
+            return self.all_rows()
+        lookup = {v: i for i, v in enumerate(self._values[column])}
+        positions = [lookup[v] for v in values if v in lookup]
+        return self._select_positions(column, positions)
+
+    def select_where(self, column, predicate):
+        """Bitmap das linhas cujo valor em ``column`` satisfaz ``predicate``."""
+        positions = [i for i, v in enumerate(self._values[column]) if predicate(v)]
+        return self._select_positions(column, positions)
+
+    def select_range(self, column, low, high):
+        """Bitmap das linhas com ``low <= valor <= high`` (coluna numérica)."""
+        values = self._values[column]
+        start, stop = bisect_left(values, low), bisect_right(values, high)
+        if column in self._sorted:
+            order, bounds = self._sorted[column]
+            return self._rows_to_bitmap(order[bounds[start]:bounds[stop]])
+        return self._select_positions(column, range(start, stop))
+
+    def rows(self, bitmap):
+        """Posições (em ordem crescente) das linhas marcadas no bitmap."""
+        flags = np.unpackbits(bitmap, count=self.n_rows, bitorder="little")
+        return np.flatnonzero(flags)
+
+    def ordered_rows(self, bitmap):
+        """Posições das linhas marcadas no bitmap, na ordem de exibição (``sort_by``)."""
+        flags = np.unpackbits(bitmap, count=self.n_rows, bitorder="little").view(bool)
+        return self._display_order[flags[self._display_order]]
+
+    def count(self, bitmap):
+        return int(np.unpackbits(bitmap, count=self.n_rows, bitorder="little").sum())
+
+    def counts(self, column, bitmap=None):
+        """Contagem de linhas por valor de ``column`` dentro do bitmap.
+
+        Retorna um ``dict`` ordenado pelos valores, só com contagens > 0.
+        """
+        codes = self._codes[column]
+        if bitmap is not None:
+            codes = codes[self.rows(bitmap)]
+        codes = codes[codes >= 0]
+        totals = np.bincount(codes, minlength=len(self._values[column]))
+        values = self._values[column]
+        return {values[i]: int(totals[i]) for i in np.flatnonzero(totals)}
+
+    def options(self, column, bitmap=None):
+        """Valores de ``column`` presentes no bitmap, em ordem crescente."""
+        return list(self.counts(column, bitmap))
+
+    def value_range(self, column, bitmap=None):
+        """(mínimo, máximo) dos valores de ``column`` no bitmap, ou ``None``."""
+        present = self.options(column, bitmap)
+        if not present:
+            return None
+        return present[0], present[-1]
@@ -0,0 +1,293 @@
+"""
+Especificação declarativa dos filtros de cada base e seus compiladores.
+
+Cada base tem uma lista de filtros (``FILTROS``) com a coluna no DataFrame do
+app.py, a coluna correspondente no guia.sqlite do site e o tipo do filtro. As
+seleções do usuário são um ``dict`` ``{coluna do DataFrame: seleção}``, o mesmo
+usado como chave do cache de resultados; seleções vazias não filtram nada.
+
+A mesma especificação é compilada para:
+
+- ``compile_mask``: uma única máscara booleana (numpy) sobre o DataFrame, sem
+  DataFrames intermediários;
+- ``compile_bitmap``: um bitmap do ``FacetIndex`` já construído pelo app;
+- ``compile_where``: uma cláusula ``WHERE`` parametrizada para o guia.sqlite,
+  com a mesma semântica de ``buildWhere`` em docs/app.js.
+
+Tipos de filtro:
+
+- ``valores``: a linha entra se o valor estiver entre os selecionados;
+- ``contem``: a linha entra se o valor contiver algum dos textos selecionados,
+  sem diferenciar maiúsculas (níveis como 'MESTRADO/DOUTORADO');
+- ``intervalo``: a seleção é ``(mínimo, máximo)``, ambos inclusivos.
+
+Filtros com ``'busca': True`` são, no site, caixas de busca textual: cada
+texto escolhido é uma frase cuja última palavra vale como prefixo, procurada
+na tabela FTS5 da base (``LIKE`` sem FTS5). ``compile_where`` gera a mesma
+consulta do site, e ``compile_mask`` e ``compile_bitmap`` reproduzem essa
+busca (sem acentos e sem caixa, palavra a palavra) para a conferência. No
+app.py esses campos continuam sendo seleções exatas, feitas a partir das
+opções da caixa de busca.
+
+A especificação vai para o site em docs/public/data/filtros.json (``write_spec``,
+chamado também pelo build_sqlite_db.py), lido pelo ``buildWhere`` de
+docs/app.js: o tipo de cada filtro do site vem daqui, não do JavaScript.
+
+Uso (confere que os três caminhos devolvem as mesmas linhas; os testes em
+tests/test_filter_spec.py rodam a mesma conferência):
+    python3 filter_spec.py
+    python3 filter_spec.py --exportar   # só regrava o filtros.json
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from search_index import normalize
+
+ROOT = Path(__file__).parent
+ARQUIVO_ESPECIFICACAO = ROOT / 'docs' / 'public' / 'data' / 'filtros.json'
+
+FILTROS = {
+    'graduacao': {
+        'tabela': 'graduacao',
+        'filtros': [
+            {'coluna': 'Grau', 'sql': 'grau', 'tipo': 'valores'},
+            {'coluna': 'Modalidade_Ensino', 'sql': 'modalidade', 'tipo': 'valores'},
+            {'coluna': 'UF', 'sql': 'uf', 'tipo': 'valores'},
+            {'coluna': 'Municipio', 'sql': 'municipio', 'tipo': 'valores'},
+            {'coluna': 'Nome_IES', 'sql': 'nome_ies', 'tipo': 'valores'},
+            {'coluna': 'Nome_Curso', 'sql': 'nome_curso', 'tipo': 'valores', 'busca': True},
+            {'coluna': 'Area_Conhecimento', 'sql': 'area_conhecimento', 'tipo': 'valores'},
+        ],
+    },
+    'especializacao': {
+        'tabela': 'especializacao',
+        'filtros': [
+            {'coluna': 'Area_Conhecimento', 'sql': 'area_conhecimento', 'tipo': 'valores'},
+            {'coluna': 'MODALIDADE', 'sql': 'modalidade', 'tipo': 'valores'},
+            {'coluna': 'NOME_IES', 'sql': 'nome_ies', 'tipo': 'valores'},
+            {'coluna': 'NOME_ESPECIALIZACAO', 'sql': 'nome_especializacao', 'tipo': 'valores'},
+            {'coluna': 'CARGA_HORARIA', 'sql': 'carga_horaria', 'tipo': 'intervalo'},
+            {'coluna': 'DURACAO_MESES', 'sql': 'duracao_meses', 'tipo': 'intervalo'},
+            {'coluna': 'MUNICIPIO', 'sql': 'municipio', 'tipo': 'valores'},
+            {'coluna': 'UF', 'sql': 'uf', 'tipo': 'valores'},
+        ],
+    },
+    'mestrado_doutorado': {
+        'tabela': 'pos',
+        'filtros': [
+            {'coluna': 'Nivel_Programa', 'sql': 'nivel_programa', 'tipo': 'contem'},
+            {'coluna': 'Area_Conhecimento', 'sql': 'area_conhecimento', 'tipo': 'valores'},
+            {'coluna': 'Nota_Conceito', 'sql': 'nota_conceito', 'tipo': 'valores'},
+            {'coluna': 'UF', 'sql': 'uf', 'tipo': 'valores'},
+            {'coluna': 'Municipio', 'sql': 'municipio', 'tipo': 'valores'},
+            {'coluna': 'Sigla_IES', 'sql': 'sigla_ies', 'tipo': 'valores'},
+            {'coluna': 'Nome_IES', 'sql': 'nome_ies', 'tipo': 'valores'},
+            {'coluna': 'Nome_Programa', 'sql': 'nome_programa', 'tipo': 'valores', 'busca': True},
+            {'coluna': 'Modalidade', 'sql': 'modalidade', 'tipo': 'valores'},
+        ],
+    },
+}
+
+
+def active_filters(nome_base, selecoes):
+    """Pares (filtro, seleção) da especificação que de fato restringem as linhas."""
+    for filtro in FILTROS[nome_base]['filtros']:
+        selecao = selecoes.get(filtro['coluna'])
+        if selecao is not None and len(selecao):
+            yield filtro, selecao
+
+
+def _contains_any(valor, textos):
+    return any(texto.lower() in valor.lower() for texto in textos)
+
+
+def _matches_search(valor, textos):
+    """Busca textual do site: algum texto aparece como frase no valor, com a última palavra como prefixo."""
+    palavras = normalize(valor).split()
+    for texto in textos:
+        busca = normalize(texto).split()
+        if not busca:
+            # Uma frase sem palavras não acha nada no FTS5
+            continue
+        *inicio, ultima = busca
+        n = len(inicio)
+        for i in range(len(palavras) - n):
+            if palavras[i:i + n] == inicio and palavras[i + n].startswith(ultima):
+                return True
+    return False
+
+
+def compile_mask(df, nome_base, selecoes):
+    """Máscara booleana (``np.ndarray``) das linhas de ``df`` que atendem ``selecoes``."""
+    mascara = np.ones(len(df), dtype=bool)
+    for filtro, selecao in active_filters(nome_base, selecoes):
+        serie = df[filtro['coluna']]
+        if filtro.get('busca'):
+            # Testa cada valor distinto uma vez, não cada linha
+            valores = [v for v in serie.dropna().unique() if _matches_search(v, selecao)]
+            mascara &= serie.isin(valores).to_numpy()
+        elif filtro['tipo'] == 'valores':
+            mascara &= serie.isin(selecao).to_numpy()
+        elif filtro['tipo'] == 'contem':
+            valores = [v for v in serie.dropna().unique() if _contains_any(v, selecao)]
+            mascara &= serie.isin(valores).to_numpy()
+        else:
+            minimo, maximo = selecao
+            mascara &= serie.between(minimo, maximo).to_numpy()
+    return mascara
+
+
+def compile_bitmap(facetas, nome_base, selecoes):
+    """Bitmap do ``FacetIndex`` das linhas que atendem ``selecoes``."""
+    bitmap = facetas.all_rows()
+    for filtro, selecao in active_filters(nome_base, selecoes):
+        coluna = filtro['coluna']
+        if filtro.get('busca'):
+            bitmap &= facetas.select_where(coluna, lambda valor: _matches_search(valor, selecao))
+        elif filtro['tipo'] == 'valores':
+            bitmap &= facetas.select(coluna, selecao)
+        elif filtro['tipo'] == 'contem':
+            bitmap &= facetas.select_where(coluna, lambda valor: _contains_any(valor, selecao))
+        else:
+            bitmap &= facetas.select_range(coluna, *selecao)
+    return bitmap
+
+
+def _fts_phrase(texto):
+    # Como ftsPhrase em docs/app.js: "engenharia civ" acha "ENGENHARIA CIVIL"
+    return '"' + texto.replace('"', '""') + '"*'
+
+
+def compile_where(nome_base, selecoes, fts=True):
+    """``(where, params)`` para ``SELECT ... FROM <tabela> {where}`` no guia.sqlite.
+
+    Os filtros de busca usam a tabela ``<tabela>_fts`` ou, com ``fts=False``
+    (bancos sem FTS5), ``LIKE``, como ``textClause`` em docs/app.js.
+    """
+    tabela = FILTROS[nome_base]['tabela']
+    clausulas = []
+    params = []
+    for filtro, selecao in active_filters(nome_base, selecoes):
+        coluna = filtro['sql']
+        if filtro.get('busca') and fts:
+            clausulas.append(f"id IN (SELECT rowid FROM {tabela}_fts WHERE {tabela}_fts MATCH ?)")
+            params.append(f"{coluna} : ({' OR '.join(map(_fts_phrase, selecao))})")
+        elif filtro.get('busca'):
+            clausulas.append('(' + ' OR '.join(f"{coluna} LIKE ?" for _ in selecao) + ')')
+            params.extend(f"%{texto}%" for texto in selecao)
+        elif filtro['tipo'] == 'valores':
+            clausulas.append(f"{coluna} IN ({', '.join('?' * len(selecao))})")
+            params.extend(selecao)
+        elif filtro['tipo'] == 'contem':
+            # LIKE do SQLite ignora maiúsculas só em ASCII, o que basta para os níveis
+            clausulas.append('(' + ' OR '.join(f"{coluna} LIKE ?" for _ in selecao) + ')')
+            params.extend(f"%{texto}%" for texto in selecao)
+        else:
+            clausulas.append(f"{coluna} BETWEEN ? AND ?")
+            params.extend(selecao)
+    where = f"WHERE {' AND '.join(clausulas)}" if clausulas else ""
+    return where, params
+
+
+def export_spec():
+    """Especificação para o site: ``{tabela: {coluna SQL: {'tipo': ..., 'busca': ...}}}``."""
+    return {
+        spec['tabela']: {
+            filtro['sql']: {'tipo': filtro['tipo'], 'busca': filtro.get('busca', False)}
+            for filtro in spec['filtros']
+        }
+        for spec in FILTROS.values()
+    }
+
+
+def write_spec(destino=ARQUIVO_ESPECIFICACAO):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    destino.write_text(json.dumps(export_spec(), indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+    return destino
+
+
+# Conferência: máscara, bitmap e SQL devolvem as mesmas linhas
+
+def sqlite_positions(conn, nome_base, selecoes, posicoes_csv):
+    """Posições no CSV das linhas devolvidas pelo ``WHERE`` compilado."""
+    where, params = compile_where(nome_base, selecoes)
+    tabela = FILTROS[nome_base]['tabela']
+    ids = [row[0] for row in conn.execute(f"SELECT id FROM {tabela} {where}", params)]
+    return np.sort(posicoes_csv[np.asarray(ids, dtype=np.int64) - 1])
+
+
+def random_selections(df, nome_base, rng):
+    """Seleções aleatórias, de nenhum a três filtros, com valores que existem na base."""
+    filtros = FILTROS[nome_base]['filtros']
+    selecoes = {}
+    for filtro in rng.sample(filtros, rng.randint(0, min(3, len(filtros)))):
+        valores = sorted(df[filtro['coluna']].dropna().unique().tolist())
+        if filtro.get('busca'):
+            # Nomes inteiros ou só o começo (palavras inteiras e um prefixo), como se digita na busca
+            textos = rng.sample(valores, rng.randint(1, min(2, len(valores))))
+            selecoes[filtro['coluna']] = [texto if rng.random() < 0.5 else texto[:rng.randint(1, len(texto))]
+                                          for texto in textos]
+        elif filtro['tipo'] == 'intervalo':
+            selecoes[filtro['coluna']] = tuple(sorted(rng.sample(valores, 2)))
+        elif filtro['tipo'] == 'contem':
+            selecoes[filtro['coluna']] = rng.sample(['MESTRADO', 'doutorado', 'PROFISSIONAL'], rng.randint(1, 2))
+        else:
+            selecoes[filtro['coluna']] = rng.sample(valores, rng.randint(1, min(4, len(valores))))
+    return selecoes
+
+
+def check_parity(db_path, casos=200, semente=0):
+    from build_sqlite_db import TABELAS
+    from datasets import ARQUIVOS_CSV, load_dataset
+    from facet_index import FacetIndex
+
+    rng = random.Random(semente)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    divergencias = 0
+    for nome_base, spec in FILTROS.items():
+        df = load_dataset(nome_base, ARQUIVOS_CSV[nome_base])
+        facetas = FacetIndex(df, [filtro['coluna'] for filtro in spec['filtros']])
+        # id no SQLite -> posição no CSV: o build grava as linhas em ordem estável por "ordem"
+        cfg = TABELAS[spec['tabela']]
+        posicoes_csv = cfg['load']().sort_values(cfg['ordem'], kind='stable').index.to_numpy()
+        for _ in range(casos):
+            selecoes = random_selections(df, nome_base, rng)
+            por_mascara = np.flatnonzero(compile_mask(df, nome_base, selecoes))
+            por_bitmap = facetas.rows(compile_bitmap(facetas, nome_base, selecoes))
+            por_sql = sqlite_positions(conn, nome_base, selecoes, posicoes_csv)
+            if not (np.array_equal(por_mascara, por_bitmap) and np.array_equal(por_mascara, por_sql)):
+                divergencias += 1
+                print(f"[{nome_base}] divergência em {selecoes}: máscara {len(por_mascara)}, "
+                      f"bitmap {len(por_bitmap)}, SQL {len(por_sql)}")
+        print(f"[{nome_base}] {casos} combinações conferidas")
+    conn.close()
+    return divergencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--banco', type=Path, default=ROOT / 'docs' / 'public' / 'data' / 'guia.sqlite',
+                        help='guia.sqlite gerado por build_sqlite_db.py a partir dos mesmos CSVs')
+    parser.add_argument('--casos', type=int, default=200, help='combinações aleatórias por base')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--exportar', action='store_true',
+                        help=f'só regrava {ARQUIVO_ESPECIFICACAO.relative_to(ROOT)} para o site')
+    args = parser.parse_args()
+    if args.exportar:
+        print(f"Especificação dos filtros gravada em {write_spec()}")
+        return
+    if not args.banco.exists():
+        sys.exit(f"{args.banco} não existe; rode python3 build_sqlite_db.py antes")
+    divergencias = check_parity(args.banco, args.casos, args.semente)
+    sys.exit(1 if divergencias else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Índice espacial dos municípios para buscas "cursos a até N km da minha cidade".
+
+Cada município é ligado ao seu centróide (latitude e longitude) de um arquivo
+local do IBGE, ``dados/municipios_coordenadas.csv`` (ou o caminho em
+``GUIA_COORDENADAS``), com as colunas ``nome``, ``latitude``, ``longitude`` e
+``uf`` (sigla) ou ``codigo_uf`` (código numérico do IBGE), como na tabela de
+municípios com coordenadas publicada a partir das malhas do IBGE. As bases
+são ligadas ao arquivo pela chave "UF|município normalizado" (sem acentos e
+sem diferença entre maiúsculas e minúsculas), a mesma dos perfis por cidade.
+Sem o arquivo, ``load_centroids`` devolve ``None`` e as buscas por distância
+ficam desligadas.
+
+Os pontos ficam numa grade regular de ``TAMANHO_CELULA_GRAUS`` graus, com as
+posições ordenadas pela célula: uma busca por raio visita só as células que
+cruzam o retângulo do círculo (uma busca binária por faixa de latitude) e
+calcula a distância (haversine) só desses candidatos. Os k mais próximos saem
+de buscas por raio que dobram até juntar k pontos.
+
+Num ``LocationIndex`` cada linha de uma base aponta para o ponto do seu
+município, e o resultado de uma busca são as posições das linhas, prontas para
+virar um bitmap do ``FacetIndex`` (ver facet_index.py).
+
+Uso (mede as buscas sobre as bases e o arquivo de coordenadas):
+    python3 geo_index.py [--raio-km 50] [--k 100]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from search_index import normalize
+
+ROOT = Path(__file__).parent
+ARQUIVO_COORDENADAS = Path(os.environ.get('GUIA_COORDENADAS', ROOT / 'dados' / 'municipios_coordenadas.csv'))
+
+RAIO_TERRA_KM = 6371.0088
+KM_POR_GRAU = math.pi * RAIO_TERRA_KM / 180
+# ~55 km de lado no equador: uma busca de 50 km visita poucas células
+TAMANHO_CELULA_GRAUS = 0.5
+
+# Código numérico da UF no IBGE -> sigla
+UF_POR_CODIGO = {
+    11: 'RO', 12: 'AC', 13: 'AM', 14: 'RR', 15: 'PA', 16: 'AP', 17: 'TO',
+    21: 'MA', 22: 'PI', 23: 'CE', 24: 'RN', 25: 'PB', 26: 'PE', 27: 'AL', 28: 'SE', 29: 'BA',
+    31: 'MG', 32: 'ES', 33: 'RJ', 35: 'SP',
+    41: 'PR', 42: 'SC', 43: 'RS',
+    50: 'MS', 51: 'MT', 52: 'GO', 53: 'DF',
+}
+
+
+def municipality_keys(uf, municipio):
+    """Chave "UF|município normalizado" de cada linha (nula se faltar a UF ou o município)."""
+    municipio = pd.Series(municipio).astype(object)
+    # Normaliza cada valor distinto uma vez só
+    nomes = {valor: normalize(valor) for valor in municipio.dropna().unique()}
+    return pd.Series(uf).astype(object).str.upper() + '|' + municipio.map(nomes)
+
+
+def load_centroids(arquivo=ARQUIVO_COORDENADAS):
+    """Centróides dos municípios indexados pela chave, com ``nome``, ``uf``, ``latitude`` e ``longitude``.
+
+    Devolve ``None`` se o arquivo não existir.
+    """
+    arquivo = Path(arquivo)
+    if not arquivo.exists():
+        return None
+    df = pd.read_csv(arquivo, sep=None, engine='python', encoding='utf-8-sig')
+    if 'uf' not in df.columns:
+        df['uf'] = pd.to_numeric(df['codigo_uf'], errors='coerce').map(UF_POR_CODIGO)
+    df = df.dropna(subset=['nome', 'uf', 'latitude', 'longitude'])
+    df = df.assign(chave=municipality_keys(df['uf'], df['nome']).to_numpy())
+    df = df.drop_duplicates('chave').set_index('chave').sort_index()
+    return df[['nome', 'uf', 'latitude', 'longitude']].astype({'latitude': 'float64', 'longitude': 'float64'})
+
+
+def haversine_km(lat, lon, latitudes, longitudes):
+    """Distância em km de (lat, lon) até cada ponto, sobre a esfera."""
+    lat, lon = math.radians(lat), math.radians(lon)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = (np.sin((latitudes - lat) / 2) ** 2
+         + math.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2)
+    return 2 * RAIO_TERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoIndex:
+    """Pontos (latitude, longitude) numa grade regular, com buscas por raio e pelos k mais próximos."""
+
+    def __init__(self, latitudes, longitudes, tamanho_celula=TAMANHO_CELULA_GRAUS):
+        self.latitudes = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.tamanho_celula = tamanho_celula
+        self._n_colunas = math.ceil(360 / tamanho_celula) + 1
+        self._n_linhas = math.ceil(180 / tamanho_celula) + 1
+        celulas = self._cells(self.latitudes, self.longitudes)
+        self._ordem = np.argsort(celulas, kind='stable').astype(np.int32)
+        self._celulas = celulas[self._ordem]
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def _cells(self, latitudes, longitudes):
+        linhas = np.floor((np.asarray(latitudes) + 90) / self.tamanho_celula).astype(np.int64)
+        colunas = np.floor((np.asarray(longitudes) + 180) / self.tamanho_celula).astype(np.int64)
+        return linhas * self._n_colunas + colunas
+
+    def _candidates(self, lat, lon, raio_km):
+        """Pontos das células que cruzam o retângulo em volta do círculo."""
+        dlat = raio_km / KM_POR_GRAU
+        # Longitude: um grau encolhe com o cosseno da latitude mais afastada do equador
+        cosseno = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlon = min(180.0, dlat / cosseno)
+        # O Brasil fica longe do antimeridiano: o retângulo não dá a volta
+        linha_min, linha_max = (min(self._n_linhas - 1, max(0, math.floor((v + 90) / self.tamanho_celula)))
+                                for v in (lat - dlat, lat + dlat))
+        coluna_min, coluna_max = (min(self._n_colunas - 1, max(0, math.floor((v + 180) / self.tamanho_celula)))
+                                  for v in (lon - dlon, lon + dlon))
+        # Em cada faixa de latitude as células do retângulo são contíguas
+        inicios = np.arange(linha_min, linha_max + 1) * self._n_colunas
+        limites = np.searchsorted(self._celulas, np.concatenate([inicios + coluna_min, inicios + coluna_max + 1]))
+        n = len(inicios)
+        fatias = [self._ordem[a:b] for a, b in zip(limites[:n], limites[n:]) if a < b]
+        return np.concatenate(fatias) if fatias else np.empty(0, dtype=np.int32)
+
+    def within(self, lat, lon, raio_km):
+        """``(pontos, distancias_km)`` a até ``raio_km`` de (lat, lon), do mais perto ao mais longe."""
+        candidatos = self._candidates(lat, lon, raio_km)
+        distancias = haversine_km(lat, lon, self.latitudes[candidatos], self.longitudes[candidatos])
+        dentro = distancias <= raio_km
+        candidatos, distancias = candidatos[dentro], distancias[dentro]
+        ordem = np.lexsort((candidatos, distancias))
+        return candidatos[ordem], distancias[ordem]
+
+    def expanding(self, lat, lon, basta):
+        """``within`` com raios que dobram até ``basta(pontos)`` ou até cobrir a Terra."""
+        raio = self.tamanho_celula * KM_POR_GRAU
+        while True:
+            pontos, distancias = self.within(lat, lon, raio)
+            # Todo ponto fora do raio está mais longe que os de dentro
+            if basta(pontos) or raio >= math.pi * RAIO_TERRA_KM:
+                return pontos, distancias
+            raio *= 2
+
+    def nearest(self, lat, lon, k):
+        """Os ``k`` pontos mais próximos de (lat, lon), como ``within``."""
+        pontos, distancias = self.expanding(lat, lon, lambda pontos: len(pontos) >= k)
+        return pontos[:k], distancias[:k]
+
+
+class LocationIndex:
+    """Linhas de uma base ligadas aos centróides dos seus municípios.
+
+    ``uf`` e ``municipio`` são as colunas da base; linhas de municípios sem
+    coordenadas nunca entram nas buscas e são contadas em ``sem_coordenadas``.
+    """
+
+    def __init__(self, uf, municipio, centroides):
+        chaves = municipality_keys(uf, municipio)
+        codigos, valores = pd.factorize(chaves, sort=True)
+        self.n_rows = len(codigos)
+        posicoes = centroides.index.get_indexer(valores)
+        conhecidos = np.flatnonzero(posicoes >= 0)
+        # Código do município na base -> ponto do índice (-1 sem coordenadas)
+        # (a posição extra, -1, atende as linhas sem município, de código -1)
+        ponto_do_codigo = np.full(len(valores) + 1, -1, dtype=np.int32)
+        ponto_do_codigo[conhecidos] = np.arange(len(conhecidos), dtype=np.int32)
+        pontos = ponto_do_codigo[codigos]
+        self.chaves = [valores[i] for i in conhecidos]
+        self.indice = GeoIndex(centroides['latitude'].to_numpy()[posicoes[conhecidos]],
+                               centroides['longitude'].to_numpy()[posicoes[conhecidos]])
+        self.sem_coordenadas = int((pontos < 0).sum())
+
+        # Linhas de cada ponto, a partir de uma única ordenação estável
+        self._linhas = np.argsort(pontos, kind='stable').astype(np.uint32)
+        self._limites = np.searchsorted(pontos[self._linhas], np.arange(len(conhecidos) + 1))
+
+    def _sizes(self, pontos):
+        return self._limites[pontos + 1] - self._limites[pontos]
+
+    def _rows_of(self, pontos):
+        fatias = [self._linhas[self._limites[p]:self._limites[p + 1]] for p in pontos]
+        return np.concatenate(fatias) if fatias else np.empty(0, dtype=np.uint32)
+
+    def rows_within(self, lat, lon, raio_km):
+        """Posições (ordenadas) das linhas a até ``raio_km`` de (lat, lon)."""
+        pontos, _ = self.indice.within(lat, lon, raio_km)
+        return np.sort(self._rows_of(pontos))
+
+    def nearest_rows(self, lat, lon, k):
+        """``(linhas, distancias_km)``: as ``k`` linhas mais próximas, da mais perto à mais longe."""
+        pontos, distancias = self.indice.expanding(lat, lon, lambda pontos: self._sizes(pontos).sum() >= k)
+        return self._rows_of(pontos)[:k], np.repeat(distancias, self._sizes(pontos))[:k]
+
+
+# Medição: buscas por raio e pelos mais próximos sobre as três bases
+
+def main():
+    from datasets import ARQUIVOS_CSV, load_dataset
+    from profiles import COLUNAS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--coordenadas', type=Path, default=ARQUIVO_COORDENADAS)
+    parser.add_argument('--raio-km', type=float, default=50)
+    parser.add_argument('--k', type=int, default=100)
+    parser.add_argument('--repeticoes', type=int, default=200)
+    args = parser.parse_args()
+
+    centroides = load_centroids(args.coordenadas)
+    if centroides is None:
+        sys.exit(f"{args.coordenadas} não existe; baixe o arquivo de municípios com coordenadas do IBGE")
+    rng = np.random.default_rng(0)
+    for nome_base, arquivo in ARQUIVOS_CSV.items():
+        colunas = COLUNAS[nome_base]['app']
+        df = load_dataset(nome_base, arquivo)
+        inicio = time.perf_counter()
+        locais = LocationIndex(df[colunas['uf']], df[colunas['municipio']], centroides)
+        construcao = (time.perf_counter() - inicio) * 1000
+        origens = centroides.iloc[rng.integers(0, len(centroides), args.repeticoes)]
+        tempos = {'raio': [], 'proximos': []}
+        for lat, lon in zip(origens['latitude'], origens['longitude']):
+            inicio = time.perf_counter()
+            locais.rows_within(lat, lon, args.raio_km)
+            tempos['raio'].append(time.perf_counter() - inicio)
+            inicio = time.perf_counter()
+            locais.nearest_rows(lat, lon, args.k)
+            tempos['proximos'].append(time.perf_counter() - inicio)
+        medianas = {nome: np.median(valores) * 1e6 for nome, valores in tempos.items()}
+        print(f"[{nome_base}] {len(locais.indice)} municípios, {locais.sem_coordenadas} linhas sem coordenadas, "
+              f"índice em {construcao:.1f} ms; mediana: raio {args.raio_km:g} km {medianas['raio']:.0f} µs, "
+              f"{args.k} mais próximos {medianas['proximos']:.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
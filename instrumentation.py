@@ -0,0 +1,234 @@
+"""
+Tempo de cada etapa do app.py por execução e por aba, ligado por variável de ambiente.
+
+Com ``GUIA_INSTRUMENTACAO=1``, cada execução de uma aba (um rerun do
+fragmento) é medida por etapas nomeadas: carga da base, filtros em cascata,
+cálculo do resultado, montagem da página da tabela e exportações. Para cada
+etapa ficam o tempo, as linhas de entrada e de saída e a variação da memória
+residente do processo (RSS). A memória é do processo inteiro, então com várias
+sessões ao mesmo tempo a variação de uma etapa pode incluir a de outra.
+
+Cada execução vira uma linha em ``etapas.jsonl``. Os tempos também são
+somados em histogramas por aba e etapa, regravados em ``etapas.prom`` no
+formato texto do Prometheus (o que o coletor "textfile" do node_exporter lê).
+Os dois arquivos ficam em ``GUIA_INSTRUMENTACAO_DIR`` (padrão: dados/metricas).
+
+Desligada, ``stage`` devolve sempre o mesmo objeto vazio (o custo é uma
+chamada de função por etapa) e ``instrumented_tab`` não envolve a função.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).parent
+
+ATIVO = os.environ.get('GUIA_INSTRUMENTACAO', '0') == '1'
+PASTA_METRICAS = Path(os.environ.get('GUIA_INSTRUMENTACAO_DIR', ROOT / 'dados' / 'metricas'))
+
+# Limites (em segundos) das faixas dos histogramas
+FAIXAS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_TAMANHO_PAGINA = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+_execucao_atual = contextvars.ContextVar('execucao_atual', default=None)
+
+
+def rss_bytes():
+    """Memória residente atual do processo (0 onde /proc não existe)."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * _TAMANHO_PAGINA
+    except OSError:
+        return 0
+
+
+class Histogram:
+    """Contagens acumuladas por faixa, soma e total de observações."""
+
+    def __init__(self, faixas=FAIXAS_SEGUNDOS):
+        self.faixas = faixas
+        self.contagens = [0] * len(faixas)
+        self.soma = 0.0
+        self.total = 0
+
+    def observe(self, valor):
+        for i, limite in enumerate(self.faixas):
+            if valor <= limite:
+                self.contagens[i] += 1
+        self.soma += valor
+        self.total += 1
+
+
+class Registry:
+    """Histogramas e contadores por (aba, etapa), seguros entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tempos = {}
+        self.linhas_entrada = {}
+        self.linhas_saida = {}
+        self.memoria = {}
+
+    def record(self, aba, etapa):
+        chave = (aba or '', etapa['etapa'])
+        with self._lock:
+            self.tempos.setdefault(chave, Histogram()).observe(etapa['segundos'])
+            for contador, campo in ((self.linhas_entrada, 'linhas_entrada'), (self.linhas_saida, 'linhas_saida'),
+                                    (self.memoria, 'memoria_bytes')):
+                if etapa.get(campo) is not None:
+                    contador[chave] = contador.get(chave, 0) + etapa[campo]
+
+    def prometheus_text(self):
+        linhas = [
+            '# HELP guia_etapa_segundos Tempo de cada etapa do app por aba.',
+            '# TYPE guia_etapa_segundos histogram',
+        ]
+        with self._lock:
+            for (aba, etapa), hist in sorted(self.tempos.items()):
+                rotulos = f'aba="{aba}",etapa="{etapa}"'
+                for limite, contagem in zip(hist.faixas, hist.contagens):
+                    linhas.append(f'guia_etapa_segundos_bucket{{{rotulos},le="{limite}"}} {contagem}')
+                linhas.append(f'guia_etapa_segundos_bucket{{{rotulos},le="+Inf"}} {hist.total}')
+                linhas.append(f'guia_etapa_segundos_sum{{{rotulos}}} {hist.soma}')
+                linhas.append(f'guia_etapa_segundos_count{{{rotulos}}} {hist.total}')
+            for nome, descricao, contador in (
+                    ('guia_etapa_linhas_entrada_total', 'Linhas recebidas pela etapa, somadas.', self.linhas_entrada),
+                    ('guia_etapa_linhas_saida_total', 'Linhas devolvidas pela etapa, somadas.', self.linhas_saida),
+                    ('guia_etapa_memoria_bytes_total', 'Variação do RSS durante a etapa, somada.', self.memoria)):
+                linhas.append(f'# HELP {nome} {descricao}')
+                linhas.append(f'# TYPE {nome} counter')
+                for (aba, etapa), valor in sorted(contador.items()):
+                    linhas.append(f'{nome}{{aba="{aba}",etapa="{etapa}"}} {valor}')
+        return '\n'.join(linhas) + '\n'
+
+
+registro = Registry()
+_lock_arquivos = threading.Lock()
+
+
+def write_metrics(execucao):
+    """Acrescenta a execução ao JSON lines e regrava o arquivo do Prometheus."""
+    PASTA_METRICAS.mkdir(parents=True, exist_ok=True)
+    texto = registro.prometheus_text()
+    with _lock_arquivos:
+        with open(PASTA_METRICAS / 'etapas.jsonl', 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(execucao, ensure_ascii=False) + '\n')
+        # Troca de uma vez: quem lê o .prom nunca vê o arquivo pela metade
+        fd, temporario = tempfile.mkstemp(dir=PASTA_METRICAS, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(texto)
+        os.chmod(temporario, 0o644)
+        os.replace(temporario, PASTA_METRICAS / 'etapas.prom')
+
+
+class Stage:
+    """Uma etapa medida; use com ``with`` ou com ``start()``/``stop()``."""
+
+    def __init__(self, nome, linhas_entrada=None, aba=None):
+        self.nome = nome
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+        self.aba = aba
+
+    def start(self):
+        self._rss = rss_bytes()
+        self._inicio = time.perf_counter()
+        return self
+
+    def stop(self, linhas_saida=None):
+        segundos = time.perf_counter() - self._inicio
+        if linhas_saida is not None:
+            self.linhas_saida = linhas_saida
+        etapa = {'etapa': self.nome, 'segundos': segundos, 'linhas_entrada': self.linhas_entrada,
+                 'linhas_saida': self.linhas_saida, 'memoria_bytes': rss_bytes() - self._rss}
+        execucao = _execucao_atual.get()
+        if execucao is not None and self.aba is None:
+            execucao['etapas'].append(etapa)
+            aba = execucao['aba']
+        else:
+            # Fora de uma execução de aba (ex.: download gerado depois do rerun)
+            aba = self.aba
+        registro.record(aba, etapa)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+class Tab:
+    """Uma execução de aba: agrupa as etapas e grava o resultado ao terminar."""
+
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __enter__(self):
+        self._execucao = {'execucao': uuid.uuid4().hex[:12], 'aba': self.nome, 'inicio': time.time(),
+                          'etapas': []}
+        self._token = _execucao_atual.set(self._execucao)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, *exc):
+        _execucao_atual.reset(self._token)
+        self._execucao['segundos'] = time.perf_counter() - self._inicio
+        # O Streamlit interrompe a execução com uma exceção quando o usuário
+        # muda um filtro antes de ela terminar
+        self._execucao['interrompida'] = tipo is not None
+        registro.record(self.nome, {'etapa': 'total', 'segundos': self._execucao['segundos']})
+        write_metrics(self._execucao)
+        return False
+
+
+class _Inactive:
+    """Substituto sem efeito de ``Stage`` com a instrumentação desligada."""
+
+    linhas_saida = None
+
+    def start(self):
+        return self
+
+    def stop(self, linhas_saida=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_INATIVO = _Inactive()
+
+
+def stage(nome, linhas_entrada=None, aba=None):
+    """Etapa ``nome`` da execução atual (ou da ``aba`` informada, fora de uma execução)."""
+    if not ATIVO:
+        return _INATIVO
+    return Stage(nome, linhas_entrada, aba)
+
+
+def instrumented_tab(nome):
+    """Decorador: cada chamada da função é uma execução da aba ``nome``.
+
+    Desligada, a função é devolvida sem alteração.
+    """
+    def decorador(funcao):
+        if not ATIVO:
+            return funcao
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with Tab(nome):
+                return funcao(*args, **kwargs)
+        return medida
+    return decorador
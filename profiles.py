@@ -0,0 +1,122 @@
+"""
+Perfis agregados por instituição e por município, somando as três bases.
+
+Um perfil responde de uma vez perguntas como "quantos cursos de graduação e
+especialização e quantos mestrados e doutorados a UFMG oferece" ou "e em Belo
+Horizonte, no total": contagens por base, por grau/nível, por modalidade e por
+área, total de vagas e a distribuição das notas da CAPES.
+
+Os mesmos perfis são calculados pelo build_sqlite_db.py (tabelas
+``perfil_ies`` e ``perfil_municipio`` do guia_perfis.sqlite, chaveadas pelo
+``id_ies`` e por UF + município) e pelo app.py (a partir das bases já
+carregadas). As colunas de cada base nos dois lugares estão em ``COLUNAS``.
+
+Os municípios são agrupados pelo nome normalizado (sem acentos e sem
+diferença entre maiúsculas e minúsculas, ver search_index.normalize), porque a
+CAPES escreve "BELO HORIZONTE" e o MEC "Belo Horizonte"; a chave é a mesma
+do índice espacial (geo_index.municipality_keys). No app, que não tem o
+``id_ies``, as instituições são agrupadas da mesma forma pelo nome.
+"""
+
+import json
+
+import pandas as pd
+
+from geo_index import municipality_keys
+from search_index import normalize
+
+# Para cada base, as colunas de cada papel no DataFrame do app e na tabela do guia.sqlite
+COLUNAS = {
+    'graduacao': {
+        'app': {'ies': 'Nome_IES', 'municipio': 'Municipio', 'uf': 'UF', 'grau': 'Grau',
+                'modalidade': 'Modalidade_Ensino', 'area': 'Area_Conhecimento', 'vagas': 'Vagas autorizadas'},
+        'sqlite': {'ies': 'id_ies', 'municipio': 'municipio', 'uf': 'uf', 'grau': 'grau',
+                   'modalidade': 'modalidade', 'area': 'area_conhecimento', 'vagas': 'vagas_autorizadas'},
+    },
+    'especializacao': {
+        'app': {'ies': 'NOME_IES', 'municipio': 'MUNICIPIO', 'uf': 'UF', 'modalidade': 'MODALIDADE',
+                'area': 'Area_Conhecimento', 'vagas': 'VAGAS'},
+        'sqlite': {'ies': 'id_ies', 'municipio': 'municipio', 'uf': 'uf', 'modalidade': 'modalidade',
+                   'area': 'area_conhecimento', 'vagas': 'vagas'},
+    },
+    'mestrado_doutorado': {
+        'app': {'ies': 'Nome_IES', 'municipio': 'Municipio', 'uf': 'UF', 'grau': 'Nivel_Programa',
+                'modalidade': 'Modalidade', 'area': 'Area_Conhecimento', 'nota': 'Nota_Conceito'},
+        'sqlite': {'ies': 'id_ies', 'municipio': 'municipio', 'uf': 'uf', 'grau': 'nivel_programa',
+                   'modalidade': 'modalidade', 'area': 'area_conhecimento', 'nota': 'nota_conceito'},
+    },
+}
+
+# Colunas de contagem, de vagas e de distribuição, na ordem em que aparecem nos perfis
+CONTAGENS = ['graduacao', 'especializacao', 'mestrado', 'doutorado']
+VAGAS = {'vagas_graduacao': 'graduacao', 'vagas_especializacao': 'especializacao'}
+DISTRIBUICOES = {'por_grau': 'grau', 'por_modalidade': 'modalidade', 'por_area': 'area'}
+
+
+def _normalized(serie):
+    # Normaliza cada valor distinto uma vez só
+    chaves = {valor: normalize(valor) for valor in serie.dropna().unique()}
+    return serie.map(chaves)
+
+
+def canonical_frame(df, nome_base, origem, nivel):
+    """Colunas usadas nos perfis, com os nomes dos papéis em ``COLUNAS``, e a ``chave`` do perfil."""
+    colunas = COLUNAS[nome_base][origem]
+    canonico = pd.DataFrame({papel: df[coluna].to_numpy() for papel, coluna in colunas.items()})
+    if nivel == 'municipio':
+        canonico['nome'] = canonico['municipio'].astype(object)
+        canonico['chave'] = municipality_keys(canonico['uf'], canonico['nome'])
+    elif origem == 'app':
+        canonico['nome'] = canonico['ies'].astype(object)
+        canonico['chave'] = _normalized(canonico['nome'])
+    else:
+        canonico['chave'] = canonico['ies']
+    return canonico
+
+
+def _distribution(df, coluna):
+    """{chave: {valor: linhas}} para os valores não nulos de ``coluna``."""
+    resultado = {}
+    contagens = df.groupby(['chave', df[coluna].astype(object)], sort=True).size()
+    for (chave, valor), n in contagens.items():
+        resultado.setdefault(chave, {})[str(valor)] = int(n)
+    return resultado
+
+
+def build_profiles(frames, origem, nivel):
+    """Um perfil por instituição (``nivel='ies'``) ou por UF + município (``nivel='municipio'``).
+
+    ``frames`` tem as três bases, com os nomes de ``COLUNAS`` (graduacao,
+    especializacao, mestrado_doutorado), e ``origem`` é 'app' ou 'sqlite'. O
+    perfil é indexado pela ``chave``: o ``id_ies`` no guia.sqlite, o nome
+    normalizado da IES no app ou "UF|município normalizado". As distribuições
+    são textos JSON com as contagens de cada base.
+    """
+    bases = {nome: canonical_frame(frames[nome], nome, origem, nivel) for nome in COLUNAS}
+    chaves = pd.concat([df['chave'] for df in bases.values()]).dropna().drop_duplicates().sort_values()
+    perfis = pd.DataFrame(index=pd.Index(chaves, name='chave'))
+
+    # Nome para exibir: o primeiro encontrado, na ordem graduação, especialização e pós
+    if 'nome' in bases['graduacao'].columns:
+        nomes = pd.concat([df[['chave', 'nome']] for df in bases.values()]).dropna().drop_duplicates('chave')
+        perfis['nome'] = nomes.set_index('chave')['nome']
+
+    pos = bases['mestrado_doutorado']
+    # "MESTRADO/DOUTORADO" conta nos dois, como o filtro de nível do app
+    linhas = {'graduacao': bases['graduacao'], 'especializacao': bases['especializacao'],
+              'mestrado': pos[pos['grau'].astype(str).str.contains('MESTRADO', case=False)],
+              'doutorado': pos[pos['grau'].astype(str).str.contains('DOUTORADO', case=False)]}
+    for coluna in CONTAGENS:
+        perfis[coluna] = linhas[coluna].groupby('chave').size()
+    for coluna, nome_base in VAGAS.items():
+        perfis[coluna] = bases[nome_base].groupby('chave')['vagas'].sum()
+    perfis[CONTAGENS + list(VAGAS)] = perfis[CONTAGENS + list(VAGAS)].fillna(0).astype('int64')
+
+    for coluna, papel in DISTRIBUICOES.items():
+        por_base = {nome: _distribution(df, papel) for nome, df in bases.items() if papel in df.columns}
+        perfis[coluna] = [json.dumps({nome: contagens[chave] for nome, contagens in por_base.items()
+                                      if chave in contagens}, ensure_ascii=False, sort_keys=True)
+                          for chave in perfis.index]
+    notas = _distribution(pos, 'nota')
+    perfis['notas_capes'] = [json.dumps(notas.get(chave, {}), sort_keys=True) for chave in perfis.index]
+    return perfis
@@ -0,0 +1,525 @@
+"""
+Serviço HTTP local de consultas em JSON sobre o guia.sqlite.
+
+Serve as tabelas graduacao, pos e especializacao com os mesmos filtros do
+site, sem depender do Streamlit nem de baixar o banco inteiro. Roda só com a
+biblioteca padrão, sobre o arquivo gerado por ``build_sqlite_db.py``.
+
+Rotas:
+    GET /api                         versão dos dados e filtros de cada tabela
+    GET /api/<tabela>                linhas filtradas, paginadas
+    GET /api/<tabela>/facetas        valores e contagens de uma coluna (?coluna=uf)
+    GET /api/pos/historico           nota de um programa em cada ano (?codigo_programa=...)
+    GET /api/<tabela>/proximos       linhas a até N km de uma cidade (?uf=MG&municipio=Lavras&raio_km=100)
+    GET /api/perfis/ies              perfil de uma instituição (?id_ies=...)
+    GET /api/perfis/municipio        perfil de uma cidade (?uf=MG&municipio=Belo Horizonte)
+
+Os perfis vêm de guia_perfis.sqlite, gravado pelo build ao lado do guia.sqlite
+(fora do .gz do site), que cada conexão anexa como ``perfis``.
+
+Parâmetros de /api/<tabela>:
+    <coluna>=valor                   valor exato; repetir o parâmetro para "ou"
+    <coluna>__contem=texto           contém o texto (LIKE), como o filtro de nível do site
+    <coluna>__min / <coluna>__max    intervalo inclusivo nas colunas numéricas
+    q=texto                          busca textual (FTS5) em nome, instituição e área
+    colunas=a,b,c                    colunas devolvidas (padrão: todas)
+    limite=N                         linhas por página (padrão 50, máximo 500)
+    apos=<cursor>                    página seguinte (campo "proximo" da resposta)
+    contar=1                         inclui o total de linhas do filtro
+
+Em /api/<tabela>/proximos as linhas vêm da mais perto à mais longe, com a
+``distancia_km`` entre os centróides dos municípios (tabelas ``municipios`` e
+``municipios_rtree``); ``raio_km`` vai até 1000 (padrão 50), ``limite=k`` dá
+as k linhas mais próximas dentro do raio, e ``colunas``, ``apos`` e ``contar``
+funcionam como acima (o cursor segue a distância, com o ``id`` como desempate).
+
+A paginação é por chave (keyset): o cursor guarda a posição da última linha na
+ordem de exibição do site, com o ``id`` como desempate, então cada página custa
+o mesmo que a primeira. As respostas levam um ETag derivado da versão dos dados
+(tabela ``metadados``) e da consulta; ``If-None-Match`` com o mesmo ETag recebe
+304 sem corpo. Quando o build troca o arquivo, o serviço percebe na requisição
+seguinte, reabre as conexões e os ETags mudam.
+
+As conexões são somente leitura e ficam num pool; cada uma guarda os comandos
+já preparados (``cached_statements``). As listas de valores vão como um único
+parâmetro JSON (``IN (SELECT value FROM json_each(?))``), de modo que o texto
+do SQL não depende de quantos valores foram escolhidos e o comando preparado é
+reaproveitado.
+
+Uso:
+    python3 build_sqlite_db.py
+    python3 query_service.py [--porta 8765] [--banco docs/public/data/guia.sqlite]
+                             [--perfis docs/public/data/guia_perfis.sqlite]
+    curl 'http://127.0.0.1:8765/api/graduacao?uf=MG&grau=Bacharelado&limite=20'
+"""
+
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import math
+import os
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from build_sqlite_db import DB_PATH, PERFIS_PATH, TABELAS
+from geo_index import KM_POR_GRAU, RAIO_TERRA_KM
+from search_index import normalize
+
+# Ordem de exibição das tabelas no site (orderBy em docs/app.js); o id desempata
+ORDEM_EXIBICAO = {
+    "graduacao": ["nome_curso", "nome_ies", "municipio"],
+    "pos": ["nome_programa", "sigla_ies", "municipio"],
+    "especializacao": ["nome_especializacao", "nome_ies", "municipio"],
+}
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+RAIO_PADRAO_KM = 50
+RAIO_MAXIMO_KM = 1000
+CONEXOES = 4
+COMANDOS_PREPARADOS = 256
+
+
+class ConsultaInvalida(ValueError):
+    """Parâmetro de consulta inválido; vira resposta 400."""
+
+
+class ConnectionPool:
+    """Conexões somente leitura com o banco (e o de perfis), reabertas quando um dos arquivos muda."""
+
+    def __init__(self, path, tamanho=CONEXOES, perfis=PERFIS_PATH):
+        self.path = Path(path)
+        self.perfis = Path(perfis)
+        self.tamanho = tamanho
+        self._lock = threading.Lock()
+        self._abrir()
+
+    def _assinatura_arquivo(self):
+        info = os.stat(self.path)
+        perfis = os.stat(self.perfis) if self.perfis.exists() else None
+        return (info.st_ino, info.st_mtime_ns, info.st_size,
+                perfis and (perfis.st_ino, perfis.st_mtime_ns, perfis.st_size))
+
+    def _conectar(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=COMANDOS_PREPARADOS)
+        if self.perfis.exists():
+            # perfil_ies e perfil_municipio são achadas sem o prefixo do esquema
+            conn.execute("ATTACH DATABASE ? AS perfis", (f"file:{self.perfis}?mode=ro",))
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _abrir(self):
+        self.assinatura = self._assinatura_arquivo()
+        self._livres = queue.LifoQueue()
+        for _ in range(self.tamanho):
+            self._livres.put(self._conectar())
+        conn = self._livres.get()
+        try:
+            metadados = dict(conn.execute("SELECT chave, valor FROM metadados"))
+            self.versao = metadados.get("versao", "")
+            self.fts = {
+                tabela for tabela in TABELAS
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{tabela}_fts",)).fetchone()
+            }
+            self.tem_facetas = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'facetas'").fetchone() is not None
+        finally:
+            self._livres.put(conn)
+
+    def refresh(self):
+        """Reabre o pool se o build trocou o arquivo (os.replace muda o inode)."""
+        if self._assinatura_arquivo() == self.assinatura:
+            return
+        with self._lock:
+            if self._assinatura_arquivo() != self.assinatura:
+                antigas = self._livres
+                self._abrir()
+                # As que estavam em uso voltam para a fila antiga e são fechadas
+                # quando ela deixa de ser referenciada
+                while not antigas.empty():
+                    antigas.get_nowait().close()
+
+    def acquire(self):
+        livres = self._livres
+        return livres, livres.get()
+
+    def release(self, livres, conn):
+        livres.put(conn)
+
+
+def encode_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores, ensure_ascii=False).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise ConsultaInvalida("cursor inválido") from exc
+
+
+def _inteiro(params, nome, padrao):
+    valor = params.get(nome, [padrao])[-1]
+    try:
+        return int(valor)
+    except (TypeError, ValueError) as exc:
+        raise ConsultaInvalida(f"{nome} deve ser um número inteiro") from exc
+
+
+def build_query(tabela, params, fts=True):
+    """``(sql, argumentos, colunas)`` da página pedida em ``params`` (saída de ``parse_qs``)."""
+    cfg = TABELAS[tabela]
+    colunas_tabela = list(cfg["colunas"])
+    ordem = ORDEM_EXIBICAO[tabela]
+    clausulas = []
+    argumentos = []
+
+    for nome, valores in params.items():
+        coluna, _, operador = nome.partition("__")
+        if nome in ("q", "colunas", "limite", "apos", "contar"):
+            continue
+        if operador == "" and coluna in cfg["facetas"]:
+            clausulas.append(f"{coluna} IN (SELECT value FROM json_each(?))")
+            argumentos.append(json.dumps(valores, ensure_ascii=False))
+        elif operador == "contem" and coluna in cfg["facetas"]:
+            clausulas.append(f"EXISTS (SELECT 1 FROM json_each(?) WHERE {coluna} LIKE '%' || value || '%')")
+            argumentos.append(json.dumps(valores, ensure_ascii=False))
+        elif operador in ("min", "max") and coluna in cfg["faixas"]:
+            clausulas.append(f"{coluna} {'>=' if operador == 'min' else '<='} ?")
+            argumentos.append(_inteiro(params, nome, None))
+        else:
+            raise ConsultaInvalida(f"filtro desconhecido para {tabela}: {nome}")
+
+    texto = " ".join(params.get("q", [])).strip()
+    if texto:
+        if fts:
+            termos = " ".join(f'"{termo.replace(chr(34), chr(34) * 2)}"*' for termo in texto.split())
+            clausulas.append(f"id IN (SELECT rowid FROM {tabela}_fts WHERE {tabela}_fts MATCH ?)")
+            argumentos.append(termos)
+        else:
+            for termo in texto.split():
+                clausulas.append("(" + " OR ".join(f"{coluna} LIKE ?" for coluna in cfg["texto"]) + ")")
+                argumentos.extend([f"%{termo}%"] * len(cfg["texto"]))
+
+    where = " AND ".join(clausulas) or "1"
+
+    colunas = colunas_tabela
+    if "colunas" in params:
+        colunas = [c for c in ",".join(params["colunas"]).split(",") if c]
+        desconhecidas = set(colunas) - set(colunas_tabela)
+        if desconhecidas:
+            raise ConsultaInvalida(f"colunas desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+    chave_ordem = [f"ifnull({coluna}, '')" for coluna in ordem] + ["id"]
+    pagina = where
+    if "apos" in params:
+        ultimo = decode_cursor(params["apos"][-1])
+        if not isinstance(ultimo, list) or len(ultimo) != len(chave_ordem):
+            raise ConsultaInvalida("cursor inválido")
+        pagina = f"{where} AND ({', '.join(chave_ordem)}) > ({', '.join('?' * len(chave_ordem))})"
+        argumentos_pagina = argumentos + ultimo
+    else:
+        argumentos_pagina = list(argumentos)
+
+    limite = min(max(_inteiro(params, "limite", LIMITE_PADRAO), 1), LIMITE_MAXIMO)
+    selecao = ", ".join(["id"] + [c for c in colunas if c != "id"] + [f"{c} AS _o{i}" for i, c in enumerate(chave_ordem[:-1])])
+    sql = f"SELECT {selecao} FROM {tabela} WHERE {pagina} ORDER BY {', '.join(chave_ordem)} LIMIT ?"
+    contagem = f"SELECT count(*) FROM {tabela} WHERE {where}"
+    return {
+        "sql": sql,
+        "argumentos": argumentos_pagina + [limite + 1],
+        "contagem": contagem,
+        "argumentos_contagem": argumentos,
+        "colunas": ["id"] + [c for c in colunas if c != "id"],
+        "limite": limite,
+        "n_ordem": len(chave_ordem) - 1,
+    }
+
+
+def run_query(conn, tabela, params, fts=True):
+    consulta = build_query(tabela, params, fts)
+    cursor = conn.execute(consulta["sql"], consulta["argumentos"])
+    linhas = cursor.fetchall()
+    n_colunas = len(consulta["colunas"])
+    proximo = None
+    if len(linhas) > consulta["limite"]:
+        linhas = linhas[:consulta["limite"]]
+        ultima = linhas[-1]
+        proximo = encode_cursor(list(ultima[n_colunas:]) + [ultima[0]])
+    resposta = {
+        "tabela": tabela,
+        "linhas": [dict(zip(consulta["colunas"], linha[:n_colunas])) for linha in linhas],
+        "proximo": proximo,
+    }
+    if params.get("contar", ["0"])[-1] == "1":
+        resposta["total"] = conn.execute(consulta["contagem"], consulta["argumentos_contagem"]).fetchone()[0]
+    return resposta
+
+
+def facet_values(conn, tabela, params, tem_facetas=True):
+    coluna = params.get("coluna", [None])[-1]
+    if coluna not in TABELAS[tabela]["facetas"]:
+        raise ConsultaInvalida(f"coluna sem facetas em {tabela}: {coluna}")
+    if tem_facetas:
+        linhas = conn.execute("SELECT valor, contagem FROM facetas WHERE tabela = ? AND coluna = ? ORDER BY ordem",
+                              (tabela, coluna)).fetchall()
+    else:
+        linhas = conn.execute(f"SELECT {coluna}, count(*) FROM {tabela} WHERE ifnull({coluna}, '') != '' "
+                              f"GROUP BY 1 ORDER BY 1").fetchall()
+    return {"tabela": tabela, "coluna": coluna, "valores": [{"valor": v, "contagem": n} for v, n in linhas]}
+
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def nearby_rows(conn, tabela, params):
+    """Linhas a até ``raio_km`` do município pedido, da mais perto à mais longe.
+
+    A R*Tree devolve os centróides no retângulo em volta do círculo; a
+    distância exata filtra esses candidatos e as linhas saem de uma junção
+    pelo ``id_municipio``, já ordenadas pela distância.
+    """
+    uf, municipio = params.get("uf", [None])[-1], params.get("municipio", [None])[-1]
+    if not uf or not municipio:
+        raise ConsultaInvalida("informe uf e municipio")
+    try:
+        raio = float(params.get("raio_km", [RAIO_PADRAO_KM])[-1])
+    except ValueError:
+        raise ConsultaInvalida("raio_km deve ser um número")
+    if not 0 < raio <= RAIO_MAXIMO_KM:
+        raise ConsultaInvalida(f"raio_km deve ficar entre 0 e {RAIO_MAXIMO_KM}")
+    colunas_tabela = list(TABELAS[tabela]["colunas"])
+    colunas = [c for c in ",".join(params.get("colunas", colunas_tabela)).split(",") if c]
+    desconhecidas = set(colunas) - set(colunas_tabela)
+    if desconhecidas:
+        raise ConsultaInvalida(f"colunas desconhecidas: {', '.join(sorted(desconhecidas))}")
+    limite = min(max(_inteiro(params, "limite", LIMITE_PADRAO), 1), LIMITE_MAXIMO)
+
+    try:
+        origem = conn.execute("SELECT latitude, longitude FROM municipios WHERE uf = ? AND municipio_chave = ?",
+                              (uf.upper(), normalize(municipio))).fetchone()
+    except sqlite3.OperationalError:
+        raise ConsultaInvalida("banco sem municipios; gere de novo com build_sqlite_db.py")
+    if origem is None:
+        raise ConsultaInvalida(f"município desconhecido: {municipio} ({uf})")
+    if origem[0] is None:
+        raise ConsultaInvalida("município sem coordenadas; inclua o arquivo do IBGE e gere o banco de novo")
+    lat, lon = origem
+    dlat = raio / KM_POR_GRAU
+    dlon = min(180.0, dlat / math.cos(math.radians(min(89.9, abs(lat) + dlat))))
+    candidatos = conn.execute(
+        "SELECT m.id_municipio, m.latitude, m.longitude FROM municipios_rtree r "
+        "JOIN municipios m ON m.id_municipio = r.id "
+        "WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?",
+        (lat - dlat, lat + dlat, lon - dlon, lon + dlon)).fetchall()
+    distancias = {}
+    for id_municipio, lat_m, lon_m in candidatos:
+        distancia = _distance_km(lat, lon, lat_m, lon_m)
+        if distancia <= raio:
+            distancias[str(id_municipio)] = round(distancia, 1)
+
+    # Mesma paginação por chave das outras rotas, na ordem (distância, id)
+    juncao = f"FROM json_each(?) d JOIN {tabela} t ON t.id_municipio = CAST(d.key AS INTEGER)"
+    pagina, argumentos = "", [json.dumps(distancias)]
+    if "apos" in params:
+        ultimo = decode_cursor(params["apos"][-1])
+        if not isinstance(ultimo, list) or len(ultimo) != 2:
+            raise ConsultaInvalida("cursor inválido")
+        pagina = "WHERE (d.value, t.id) > (?, ?)"
+        argumentos += ultimo
+    selecao = ", ".join(f"t.{c}" for c in ["id"] + [c for c in colunas if c != "id"])
+    linhas = conn.execute(f"SELECT {selecao}, d.value {juncao} {pagina} ORDER BY d.value, t.id LIMIT ?",
+                          argumentos + [limite + 1]).fetchall()
+    proximo = None
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo = encode_cursor([linhas[-1][-1], linhas[-1][0]])
+    nomes = ["id"] + [c for c in colunas if c != "id"] + ["distancia_km"]
+    resposta = {"tabela": tabela, "raio_km": raio, "municipios": len(distancias),
+                "linhas": [dict(zip(nomes, linha)) for linha in linhas], "proximo": proximo}
+    if params.get("contar", ["0"])[-1] == "1":
+        resposta["total"] = conn.execute(f"SELECT count(*) {juncao}", (json.dumps(distancias),)).fetchone()[0]
+    return resposta
+
+
+def grade_history(conn, params):
+    codigos = params.get("codigo_programa", [])
+    if not codigos:
+        raise ConsultaInvalida("informe codigo_programa")
+    try:
+        linhas = conn.execute(
+            "SELECT codigo_programa, ano, nota_conceito FROM historico_notas "
+            "WHERE codigo_programa IN (SELECT value FROM json_each(?)) ORDER BY codigo_programa, ano",
+            (json.dumps(codigos),)).fetchall()
+    except sqlite3.OperationalError:
+        raise ConsultaInvalida("banco sem historico_notas; gere de novo com build_sqlite_db.py")
+    historico = {codigo: [] for codigo in codigos}
+    for codigo, ano, nota in linhas:
+        historico[codigo].append({"ano": ano, "nota_conceito": nota})
+    return {"tabela": "pos", "historico": historico}
+
+
+# Colunas dos perfis guardadas como texto JSON
+COLUNAS_JSON_PERFIS = ("por_grau", "por_modalidade", "por_area", "notas_capes")
+
+
+def profile_lookup(conn, nivel, params):
+    """Perfis pela chave primária: ``id_ies`` (repetível) ou ``uf`` + ``municipio``."""
+    if nivel == "ies":
+        try:
+            ids = [int(valor) for valor in params.get("id_ies", [])]
+        except ValueError:
+            raise ConsultaInvalida("id_ies deve ser inteiro")
+        if not ids:
+            raise ConsultaInvalida("informe id_ies")
+        sql = "SELECT * FROM perfil_ies WHERE id_ies IN (SELECT value FROM json_each(?)) ORDER BY id_ies"
+        args = (json.dumps(ids),)
+    else:
+        uf, municipio = params.get("uf", [None])[-1], params.get("municipio", [None])[-1]
+        if not uf or not municipio:
+            raise ConsultaInvalida("informe uf e municipio")
+        # A chave é o nome normalizado: "BELO HORIZONTE" e "belo horizonte" acham a mesma cidade
+        sql = "SELECT * FROM perfil_municipio WHERE uf = ? AND municipio_chave = ?"
+        args = (uf.upper(), normalize(municipio))
+    try:
+        cursor = conn.execute(sql, args)
+    except sqlite3.OperationalError:
+        raise ConsultaInvalida("sem guia_perfis.sqlite; gere de novo com build_sqlite_db.py")
+    colunas = [descricao[0] for descricao in cursor.description]
+    perfis = []
+    for linha in cursor:
+        perfil = dict(zip(colunas, linha))
+        for coluna in COLUNAS_JSON_PERFIS:
+            perfil[coluna] = json.loads(perfil[coluna])
+        perfis.append(perfil)
+    return {"nivel": nivel, "perfis": perfis}
+
+
+def describe(pool):
+    return {
+        "versao": pool.versao,
+        "tabelas": {
+            tabela: {
+                "colunas": list(cfg["colunas"]),
+                "filtros": cfg["facetas"],
+                "intervalos": cfg["faixas"],
+                "busca_textual": cfg["texto"],
+                "ordem": ORDEM_EXIBICAO[tabela],
+            }
+            for tabela, cfg in TABELAS.items()
+        },
+    }
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    pool = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _enviar(self, status, corpo=None, etag=None):
+        dados = b"" if corpo is None else json.dumps(corpo, ensure_ascii=False).encode()
+        self.send_response(status)
+        if corpo is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        pool = self.pool
+        pool.refresh()
+        url = urlsplit(self.path)
+        partes = [p for p in url.path.split("/") if p]
+        params = parse_qs(url.query, keep_blank_values=False)
+
+        if not partes or partes[0] != "api" or len(partes) > 3:
+            return self._enviar(404, {"erro": "rota desconhecida"})
+        if partes[1:2] == ["perfis"]:
+            if partes[2:] not in (["ies"], ["municipio"]):
+                return self._enviar(404, {"erro": "os perfis são de ies ou de municipio"})
+        elif len(partes) > 1 and partes[1] not in TABELAS:
+            return self._enviar(404, {"erro": f"tabela desconhecida: {partes[1]}"})
+        elif len(partes) == 3 and partes[2] not in ("facetas", "historico", "proximos"):
+            return self._enviar(404, {"erro": "rota desconhecida"})
+        elif partes[2:] == ["historico"] and partes[1] != "pos":
+            return self._enviar(404, {"erro": "o histórico de notas só existe para pos"})
+
+        # O ETag depende só da versão dos dados e da consulta normalizada
+        consulta = json.dumps([url.path, sorted((k, sorted(v)) for k, v in params.items())], ensure_ascii=False)
+        etag = '"' + hashlib.sha256(f"{pool.versao}|{consulta}".encode()).hexdigest()[:32] + '"'
+        if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+            return self._enviar(304, etag=etag)
+
+        livres, conn = pool.acquire()
+        try:
+            if len(partes) == 1:
+                corpo = describe(pool)
+            elif len(partes) == 2:
+                corpo = run_query(conn, partes[1], params, fts=partes[1] in pool.fts)
+            elif partes[1] == "perfis":
+                corpo = profile_lookup(conn, partes[2], params)
+            elif partes[2] == "historico":
+                corpo = grade_history(conn, params)
+            elif partes[2] == "proximos":
+                corpo = nearby_rows(conn, partes[1], params)
+            else:
+                corpo = facet_values(conn, partes[1], params, pool.tem_facetas)
+        except ConsultaInvalida as exc:
+            return self._enviar(400, {"erro": str(exc)})
+        finally:
+            pool.release(livres, conn)
+        corpo["versao"] = pool.versao
+        self._enviar(200, corpo, etag)
+
+
+def make_server(banco=DB_PATH, host="127.0.0.1", porta=8765, conexoes=CONEXOES, verbose=False,
+                perfis=PERFIS_PATH):
+    pool = ConnectionPool(banco, conexoes, perfis)
+    handler = type("Handler", (QueryHandler,), {"pool": pool})
+    servidor = http.server.ThreadingHTTPServer((host, porta), handler)
+    servidor.daemon_threads = True
+    servidor.verbose = verbose
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--banco", type=Path, default=DB_PATH, help="guia.sqlite gerado por build_sqlite_db.py")
+    parser.add_argument("--perfis", type=Path, default=PERFIS_PATH,
+                        help="guia_perfis.sqlite gravado pelo build_sqlite_db.py, para /api/perfis")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--conexoes", type=int, default=CONEXOES, help="conexões somente leitura no pool")
+    parser.add_argument("--verbose", action="store_true", help="registra cada requisição")
+    args = parser.parse_args()
+    if not args.banco.exists():
+        parser.error(f"{args.banco} não existe; rode python3 build_sqlite_db.py antes")
+
+    servidor = make_server(args.banco, args.host, args.porta, args.conexoes, args.verbose, args.perfis)
+    print(f"Servindo {args.banco} (versão {servidor.RequestHandlerClass.pool.versao[:12]}) "
+          f"em http://{args.host}:{servidor.server_address[1]}/api")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Cache de resultados dos filtros do app.py, compartilhado por todas as sessões.
+
+Combinações de filtros idênticas são muito comuns (os padrões da aba de
+graduação, um único estado), então o resultado de cada combinação é guardado
+uma vez por processo. A chave é a base, a versão dos dados e a forma canônica
+das seleções: a ordem em que os valores foram escolhidos não importa e uma
+seleção vazia (que não filtra nada) é o mesmo que não informar o filtro. O
+valor guardado são as posições das linhas já na ordem de exibição, nunca cópias
+do DataFrame.
+
+O cache é limitado pela soma dos tamanhos dos itens e descarta primeiro os
+menos usados. Quando a versão dos dados de uma base muda (CSV recarregado), as
+entradas da versão antiga são descartadas de uma vez.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Teto de memória das posições guardadas (somadas) no processo
+LIMITE_CACHE_RESULTADOS = 32 * 1024 ** 2
+
+# GUIA_ESTATISTICAS_CACHE=1 mostra acertos, falhas e remoções no rodapé do app
+MOSTRAR_ESTATISTICAS = os.environ.get('GUIA_ESTATISTICAS_CACHE', '0') == '1'
+
+
+class LRUCache:
+    """Cache LRU limitado pela soma de ``tamanho(valor)``, seguro entre threads."""
+
+    def __init__(self, limite_bytes, tamanho=len):
+        self.limite_bytes = limite_bytes
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = 0
+
+    def get_or_build(self, chave, gerar):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+        # Gera fora do lock: outras sessões não esperam por este item
+        valor = gerar()
+        tamanho = self.tamanho(valor)
+        with self._lock:
+            if chave not in self._itens and tamanho <= self.limite_bytes:
+                self._itens[chave] = valor
+                self._bytes += tamanho
+                while self._bytes > self.limite_bytes:
+                    _, removido = self._itens.popitem(last=False)
+                    self._bytes -= self.tamanho(removido)
+                    self.remocoes += 1
+        return valor
+
+    def invalidate(self, predicado):
+        """Descarta as entradas cuja chave satisfaz ``predicado``; retorna quantas."""
+        with self._lock:
+            chaves = [chave for chave in self._itens if predicado(chave)]
+            for chave in chaves:
+                self._bytes -= self.tamanho(self._itens.pop(chave))
+            return len(chaves)
+
+    def stats(self):
+        with self._lock:
+            return {'itens': len(self._itens), 'bytes': self._bytes, 'acertos': self.acertos,
+                    'falhas': self.falhas, 'remocoes': self.remocoes}
+
+
+cache_resultados = LRUCache(LIMITE_CACHE_RESULTADOS, tamanho=lambda linhas: linhas.nbytes)
+
+_versoes = {}
+_lock_versoes = threading.Lock()
+
+
+def canonical_filters(filtros):
+    """Forma canônica de ``{filtro: seleção}``, independente da ordem.
+
+    Listas (multiselects) viram tuplas ordenadas sem repetição e são omitidas
+    quando vazias; tuplas (intervalos dos sliders) são mantidas como estão.
+    """
+    canonico = []
+    for nome, selecao in filtros.items():
+        if isinstance(selecao, tuple):
+            canonico.append((nome, selecao))
+        elif selecao:
+            canonico.append((nome, tuple(sorted(set(selecao)))))
+    return tuple(sorted(canonico))
+
+
+def cached_rows(nome_base, df, filtros, calcular):
+    """Posições das linhas que atendem ``filtros``, calculadas por ``calcular()`` na falta."""
+    versao = df.attrs['versao']
+    with _lock_versoes:
+        if _versoes.get(nome_base) != versao:
+            cache_resultados.invalidate(lambda chave: chave[0] == nome_base and chave[1] != versao)
+            _versoes[nome_base] = versao
+    chave = (nome_base, versao, canonical_filters(filtros))
+    return cache_resultados.get_or_build(chave, lambda: np.asarray(calcular(), dtype=np.int32))
+
@@ -0,0 +1,80 @@
+"""
+Índice de trigramas para buscar nomes de cursos e programas no app.py.
+
+O índice é construído uma única vez por base carregada, sobre os nomes
+distintos de uma coluna (não sobre as linhas). Cada nome é normalizado (sem
+acentos, sem diferença entre maiúsculas e minúsculas, só letras e números) e
+quebrado em trigramas, como no ``pg_trgm`` do PostgreSQL: cada palavra ganha
+dois espaços antes e um depois, então "fisica" vira "  f", " fi", "fis", ...
+
+Para cada trigrama o índice guarda os nomes em que ele aparece. Uma busca
+soma, com um único ``np.bincount``, quantos trigramas da consulta cada nome
+tem em comum e ordena os nomes por:
+
+1. cobertura: fração dos trigramas da consulta presentes no nome, o que
+   tolera erros de digitação (uma letra trocada só derruba alguns trigramas);
+2. similaridade: trigramas em comum sobre os da união, o que põe os nomes mais
+   próximos do que foi digitado (e os mais curtos) na frente.
+
+Nenhuma busca percorre o DataFrame: o custo depende do número de nomes
+distintos e dos trigramas da consulta.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+# Fração mínima dos trigramas da consulta que um nome precisa ter
+COBERTURA_MINIMA = 0.5
+LIMITE_RESULTADOS = 50
+
+_PALAVRAS = re.compile(r'[^\W_]+')
+
+
+def normalize(texto):
+    """Texto sem acentos, em minúsculas e só com palavras separadas por um espaço."""
+    decomposto = unicodedata.normalize('NFKD', str(texto))
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(_PALAVRAS.findall(sem_acentos.casefold()))
+
+
+def trigrams(normalizado):
+    """Conjunto de trigramas de um texto já normalizado."""
+    gramas = set()
+    for palavra in normalizado.split():
+        palavra = f'  {palavra} '
+        gramas.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return gramas
+
+
+class TrigramIndex:
+    """Busca aproximada, ordenada por relevância, sobre uma lista de nomes."""
+
+    def __init__(self, valores):
+        self.valores = list(valores)
+        self._normalizados = [normalize(valor) for valor in self.valores]
+        self._tamanhos = np.zeros(len(self.valores), dtype=np.float32)
+        postings = defaultdict(list)
+        for i, normalizado in enumerate(self._normalizados):
+            gramas = trigrams(normalizado)
+            self._tamanhos[i] = len(gramas)
+            for grama in gramas:
+                postings[grama].append(i)
+        self._postings = {grama: np.asarray(ids, dtype=np.int32) for grama, ids in postings.items()}
+
+    def search(self, consulta, limite=LIMITE_RESULTADOS, cobertura_minima=COBERTURA_MINIMA):
+        """Até ``limite`` nomes parecidos com ``consulta``, do mais ao menos relevante."""
+        gramas = trigrams(normalize(consulta))
+        listas = [self._postings[grama] for grama in gramas if grama in self._postings]
+        if not listas:
+            return []
+        comuns = np.bincount(np.concatenate(listas), minlength=len(self.valores))
+        candidatos = np.flatnonzero(comuns >= cobertura_minima * len(gramas))
+        comuns = comuns[candidatos]
+        cobertura = comuns / len(gramas)
+        similaridade = comuns / (len(gramas) + self._tamanhos[candidatos] - comuns)
+        # lexsort ordena pela última chave primeiro; o índice desempata pela ordem original
+        ordem = np.lexsort((candidatos, -similaridade, -cobertura))[:limite]
+        return [self.valores[i] for i in candidatos[ordem]]
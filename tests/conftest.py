@@ -0,0 +1,62 @@
+import shutil
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Os módulos do projeto ficam na raiz do repositório
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Linhas de cada CSV tratado usadas no banco de teste
+LINHAS_AMOSTRA = 1500
+
+
+def _preparar_amostra(pasta, mp):
+    """Copia o começo de cada CSV tratado para ``pasta`` e aponta os caminhos do build para ela.
+
+    Como na benchmarks/suite_sintetica.py, build_sqlite_db e datasets leem e
+    gravam só na pasta temporária enquanto ``mp`` valer.
+    """
+    import build_sqlite_db
+    import datasets
+
+    for csv in [*datasets.ARQUIVOS_CSV.values(), ROOT / 'historico_notas_capes.csv']:
+        if csv.name == 'historico_notas_capes.csv':
+            shutil.copy(csv, pasta / csv.name)
+        else:
+            pd.read_csv(csv, sep='\t', dtype=str, keep_default_na=False, nrows=LINHAS_AMOSTRA).to_csv(
+                pasta / csv.name, sep='\t', index=False)
+
+    mp.setattr(build_sqlite_db, 'ROOT', pasta)
+    mp.setattr(build_sqlite_db, 'DATA_DIR', pasta / 'data')
+    mp.setattr(build_sqlite_db, 'DB_PATH', pasta / 'data' / 'guia.sqlite')
+    mp.setattr(build_sqlite_db, 'GZ_PATH', pasta / 'data' / 'guia.sqlite.gz')
+    mp.setattr(build_sqlite_db, 'VERSAO_PATH', pasta / 'data' / 'guia.versao.json')
+    mp.setattr(build_sqlite_db, 'HTTP_DIR', pasta / 'data' / 'http')
+    mp.setattr(build_sqlite_db, 'PERFIS_PATH', pasta / 'data' / 'guia_perfis.sqlite')
+    mp.setattr(build_sqlite_db, 'STATE_PATH', pasta / 'estado_build.sqlite')
+    mp.setattr(datasets, 'SNAPSHOT_DIR', pasta / 'snapshots')
+    mp.setattr(datasets, 'ARQUIVOS_CSV', {nome: pasta / csv.name for nome, csv in datasets.ARQUIVOS_CSV.items()})
+
+
+@pytest.fixture(scope='session')
+def banco_amostra(tmp_path_factory):
+    """guia.sqlite gerado pelo build_sqlite_db.py a partir do começo de cada CSV tratado."""
+    import build_sqlite_db
+
+    with pytest.MonkeyPatch.context() as mp:
+        _preparar_amostra(tmp_path_factory.mktemp('amostra'), mp)
+        build_sqlite_db.build()
+        yield build_sqlite_db.DB_PATH
+
+
+@pytest.fixture
+def pasta_build(tmp_path, monkeypatch):
+    """Pasta com a amostra dos CSVs e um build completo, que cada teste pode alterar."""
+    import build_sqlite_db
+
+    _preparar_amostra(tmp_path, monkeypatch)
+    build_sqlite_db.build()
+    return tmp_path
@@ -0,0 +1,87 @@
+"""O --incremental deixa o banco, as facetas e os perfis iguais aos de um build completo."""
+
+import sqlite3
+
+import pandas as pd
+
+import build_sqlite_db
+
+ARQUIVO_GRADUACAO = 'graduacao_univ_publicas.csv'
+ARQUIVO_POS = 'mestrado_doutorado_univ_publicas.csv'
+
+
+def _ler(pasta, arquivo):
+    return pd.read_csv(pasta / arquivo, sep='\t', dtype=str, keep_default_na=False)
+
+
+def _gravar(df, pasta, arquivo):
+    df.to_csv(pasta / arquivo, sep='\t', index=False)
+
+
+def _linhas(caminho, tabela):
+    conn = sqlite3.connect(caminho)
+    try:
+        return sorted(conn.execute(f'SELECT * FROM {tabela}'))
+    finally:
+        conn.close()
+
+
+def _esperado():
+    """Facetas, faixas e perfis que um build completo gravaria com os CSVs atuais."""
+    frames, instituicoes, _ = build_sqlite_db.load_frames()
+    conn = sqlite3.connect(':memory:')
+    build_sqlite_db.write_facets(conn, frames)
+    esperado = {tabela: sorted(conn.execute(f'SELECT * FROM {tabela}')) for tabela in ('facetas', 'faixas')}
+    conn.close()
+    for tabela, df in build_sqlite_db.load_profiles(frames, instituicoes).items():
+        esperado[tabela] = sorted(build_sqlite_db.sql_rows(df))
+    return esperado
+
+
+def _conferir(esperado):
+    for tabela in ('facetas', 'faixas'):
+        assert _linhas(build_sqlite_db.DB_PATH, tabela) == esperado[tabela], tabela
+    for tabela in ('perfil_ies', 'perfil_municipio'):
+        assert _linhas(build_sqlite_db.PERFIS_PATH, tabela) == esperado[tabela], tabela
+
+
+def test_incremental_without_changes_keeps_artifacts(pasta_build, capsys):
+    gz = build_sqlite_db.GZ_PATH.stat().st_mtime_ns
+    versao = build_sqlite_db.VERSAO_PATH.read_text()
+
+    build_sqlite_db.build(incremental=True)
+
+    assert 'Nada mudou' in capsys.readouterr().out
+    assert build_sqlite_db.GZ_PATH.stat().st_mtime_ns == gz
+    assert build_sqlite_db.VERSAO_PATH.read_text() == versao
+
+
+def test_incremental_upsert(pasta_build):
+    graduacao = _ler(pasta_build, ARQUIVO_GRADUACAO)
+    graduacao.loc[0, 'Vagas autorizadas'] = '9999'
+    novo = graduacao.iloc[[1]].assign(**{'Código do curso': '99999999'})
+    _gravar(pd.concat([graduacao, novo]), pasta_build, ARQUIVO_GRADUACAO)
+
+    build_sqlite_db.build(incremental=True)
+
+    conn = sqlite3.connect(build_sqlite_db.DB_PATH)
+    codigo = int(graduacao.loc[0, 'Código do curso'])
+    assert conn.execute('SELECT vagas_autorizadas FROM graduacao WHERE codigo_curso = ?', (codigo,)).fetchall() \
+        == [(9999,)]
+    assert conn.execute('SELECT COUNT(*) FROM graduacao').fetchone()[0] == len(graduacao) + 1
+    conn.close()
+    _conferir(_esperado())
+
+
+def test_incremental_delete(pasta_build, capsys):
+    pos = _ler(pasta_build, ARQUIVO_POS)
+    _gravar(pos.iloc[3:], pasta_build, ARQUIVO_POS)
+
+    build_sqlite_db.build(incremental=True)
+
+    conn = sqlite3.connect(build_sqlite_db.DB_PATH)
+    assert conn.execute('SELECT COUNT(*) FROM pos').fetchone()[0] == len(pos) - 3
+    conn.close()
+    _conferir(_esperado())
+    # Três linhas liberam poucas páginas: o arquivo não é reescrito
+    assert 'VACUUM dispensado' in capsys.readouterr().out
@@ -0,0 +1,43 @@
+"""Os filtros do app, do guia.sqlite e do site seguem a mesma especificação."""
+
+import json
+
+import pytest
+
+from filter_spec import ARQUIVO_ESPECIFICACAO, FILTROS, ROOT, check_parity, compile_where, export_spec
+
+
+def test_site_spec_is_up_to_date():
+    # docs/app.js lê o tipo de cada filtro deste arquivo; rode
+    # python3 filter_spec.py --exportar depois de mudar FILTROS
+    assert json.loads(ARQUIVO_ESPECIFICACAO.read_text(encoding='utf-8')) == export_spec()
+
+
+def test_site_filters_are_specified():
+    # Toda coluna filtrada em docs/app.js precisa estar em FILTROS
+    app_js = (ROOT / 'docs' / 'app.js').read_text(encoding='utf-8')
+    colunas = {filtro['sql'] for spec in FILTROS.values() for filtro in spec['filtros']}
+    for trecho in app_js.split('column: "')[1:]:
+        assert trecho.split('"')[0] in colunas
+
+
+def test_search_filters_have_fts():
+    # compile_where e o site procuram os filtros de busca na tabela <tabela>_fts
+    from build_sqlite_db import TABELAS
+    for spec in FILTROS.values():
+        for filtro in spec['filtros']:
+            if filtro.get('busca'):
+                assert filtro['sql'] in TABELAS[spec['tabela']]['texto']
+
+
+def test_search_filters_compile_like_site():
+    where, params = compile_where('graduacao', {'Nome_Curso': ['engenharia civ', 'Direito']})
+    assert where == 'WHERE id IN (SELECT rowid FROM graduacao_fts WHERE graduacao_fts MATCH ?)'
+    assert params == ['nome_curso : ("engenharia civ"* OR "Direito"*)']
+    where, params = compile_where('graduacao', {'Nome_Curso': ['civ']}, fts=False)
+    assert (where, params) == ('WHERE (nome_curso LIKE ?)', ['%civ%'])
+
+
+@pytest.mark.parametrize('semente', [0, 1])
+def test_mask_bitmap_and_sql_agree(banco_amostra, semente):
+    assert check_parity(banco_amostra, casos=200, semente=semente) == 0
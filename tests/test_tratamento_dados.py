@@ -0,0 +1,27 @@
+"""A especialização continua filtrada pelas IES públicas da base de graduação."""
+
+import sys
+
+import pandas as pd
+
+from filter_spec import ROOT
+
+sys.path.insert(0, str(ROOT / 'dados'))
+import tratamento_dados  # noqa: E402
+
+
+def test_public_ies_come_from_graduacao(tmp_path):
+    # Uma IES só da CAPES pode estar na dimensão como pública, mas não entra na seleção
+    coluna = tratamento_dados.COLUNA_CODIGO_IES_GRADUACAO
+    graduacao = tmp_path / 'graduacao.csv'
+    pd.DataFrame({
+        coluna: [10, 10, 20, None],
+        'Categoria da IES': ['Pública Federal', 'Pública Federal', 'Pública Estadual', 'Pública Federal'],
+        'Nome do Curso': ['A', 'B', 'C', 'D'],
+    }).to_csv(graduacao, sep='\t', index=False)
+
+    ies_publicas = tratamento_dados.criar_dataframe_ies_publicas(graduacao)
+
+    assert ies_publicas['CODIGO_IES'].tolist() == [10, 20]
+    assert ies_publicas['Categoria_IES'].tolist() == ['Pública Federal', 'Pública Estadual']
+    assert tratamento_dados.ETAPAS['especializacao']['depende_de'] == ['graduacao']